@@ -7,9 +7,6 @@ import httpx
 import asyncio
 import requests
 # from azure.ai.documentintelligence import DocumentIntelligenceClient
-from azure.core.credentials import AzureKeyCredential
-from azure.search.documents import SearchClient
-from azure.storage.blob import BlobServiceClient
 from quart import (
     Blueprint,
     Quart,
@@ -30,6 +27,30 @@ from azure.identity.aio import (
 from backend.auth.auth_utils import get_authenticated_user_details
 from backend.security.ms_defender_utils import get_msdefender_user_json
 from backend.history.cosmosdbservice import CosmosConversationClient
+from backend.embedding.adaptive import AdaptiveBatchEncoder
+from backend.embedding.batcher import MicroBatcher, EmbeddingQueueFullError
+from backend.embedding.sidecar import SidecarEmbeddingModel
+from backend.embedding.cache import EmbeddingCache, CachedEmbeddingModel
+from backend.embedding.encoding import validate_encoding, encode_embedding, embedding_response
+from backend.embedding.model import load_embedding_model, embedding_model_id, LazyEmbeddingModel
+from backend.ingestion.chunks import (
+    CHUNK_MANIFEST_PREFIX,
+    CONTENT_HASH_METADATA,
+    chunk_id,
+    file_hash,
+    is_manifest_blob,
+    manifest_blob_name
+)
+from backend.ingestion.deletion import delete_blobs, document_filter, iter_document_id_pages
+from backend.ingestion.extraction_cache import ExtractionCache
+from backend.ingestion.pdf import iter_cached_pdf_pages, iter_pdf_pages_parallel, pdf_extractor_version
+from backend.ingestion.indexer import SearchIndexer
+from backend.ingestion.jobs import Job, JobStore, JobWorkerPool, LeaseLostError
+from backend.ingestion.manifest import DocumentManifest, DocumentRecord
+from backend.ingestion.pipeline import IngestionPipeline
+from backend.ingestion.scheduler import ResourceBudget, run_concurrently
+from backend.ingestion.uploads import spooled_request_class
+from backend.ingestion.xml_markdown import iter_xml_document_chunks
 from backend.settings import (
     app_settings,
     MINIMUM_SUPPORTED_AZURE_OPENAI_PREVIEW_API_VERSION
@@ -42,28 +63,55 @@ from backend.utils import (
     format_pf_non_streaming_response,
 )
 from dotenv import load_dotenv
-import fitz 
 import time
-from azure.cosmos import CosmosClient, PartitionKey
-from sentence_transformers import SentenceTransformer
-import xml.etree.ElementTree as ET
-from typing import List
+import orjson
 from io import BytesIO
 import gc
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
-import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+import multiprocessing
 from collections import deque
 from datetime import datetime
 
 load_dotenv() 
 
-model = SentenceTransformer(app_settings.azure_openai.embedding_name)
-print(f"model: {app_settings.azure_openai.embedding_name}")
+if app_settings.embedding.sidecar_socket:
+    # One embedding sidecar process owns the model (and its cache) for all gunicorn workers
+    model = SidecarEmbeddingModel(
+        app_settings.embedding.sidecar_socket,
+        connect_timeout=app_settings.embedding.sidecar_connect_timeout
+    )
+else:
+    # Shared by /api/embed and ingestion so identical texts are only encoded once
+    embedding_cache = EmbeddingCache(
+        embedding_model_id(
+            app_settings.azure_openai.embedding_name,
+            backend=app_settings.embedding.backend,
+            quantize=app_settings.embedding.onnx_quantize,
+            quantization_config=app_settings.embedding.onnx_quantization_config
+        ),
+        memory_entries=app_settings.embedding.cache_memory_entries,
+        disk_dir=app_settings.embedding.cache_dir,
+        disk_max_bytes=app_settings.embedding.cache_disk_max_mb * 1024 * 1024
+    )
+
+    # Loaded by the warm-up task once the server is up (or on first use), so
+    # importing this module doesn't pay for torch and the model weights
+    model = CachedEmbeddingModel(
+        LazyEmbeddingModel(lambda: load_embedding_model(
+            app_settings.azure_openai.embedding_name,
+            backend=app_settings.embedding.backend,
+            onnx_dir=app_settings.embedding.onnx_dir,
+            quantize=app_settings.embedding.onnx_quantize,
+            quantization_config=app_settings.embedding.onnx_quantization_config
+        )),
+        embedding_cache
+    )
+print(f"model: {app_settings.azure_openai.embedding_name} ({app_settings.embedding.backend})")
 # model = SentenceTransformer(os.getenv("AZURE_OPENAI_EMBEDDING_NAME"))
 cosmos_account_uri = f"https://{app_settings.chat_history.account}.documents.azure.com:443/"
 
-cosmos_client = CosmosClient(cosmos_account_uri, credential=os.getenv("REACT_APP_AZURE_COSMOS_ACCOUNT_KEY"))
 collection_name = 'system_messages'
 # Define Cosmos DB collection name for storing user system messages
 USER_SYSTEM_MESSAGE_COLLECTION = "user_system_message"
@@ -89,10 +137,27 @@ blob_service_url = os.getenv("REACT_APP_AZURE_BLOB_URL")
 # container_name = "pdf-container2"
 container_name = os.getenv("REACT_APP_AZURE_BLOB_CONTAINER_NAME")
 storage_key = os.getenv("REACT_APP_AZURE_BLOB_STORAGE_KEY")
-blob_service_client = BlobServiceClient(account_url=blob_service_url, credential=storage_key)
 
-# Create a SearchClient instance
-search_client = SearchClient(service_endpoint, index_name, AzureKeyCredential(api_key))
+
+# The async Azure SDK clients are bound to the serving event loop, so they are
+# created in create_app's before_serving hook and closed in after_serving
+def init_azure_clients(app):
+    from azure.core.credentials import AzureKeyCredential
+    from azure.cosmos.aio import CosmosClient
+    from azure.search.documents.aio import SearchClient
+    from azure.storage.blob.aio import BlobServiceClient
+
+    app.cosmos_client = CosmosClient(cosmos_account_uri, credential=os.getenv("REACT_APP_AZURE_COSMOS_ACCOUNT_KEY"))
+    app.blob_service_client = BlobServiceClient(account_url=blob_service_url, credential=storage_key)
+    app.search_client = SearchClient(service_endpoint, index_name, AzureKeyCredential(api_key))
+
+
+async def close_azure_clients(app):
+    for client in (app.cosmos_client, app.blob_service_client, app.search_client):
+        try:
+            await client.close()
+        except Exception:
+            logging.exception(f"Failed to close {type(client).__name__}")
 
 # Initialize the Document Intelligence Client
 # document_intelligence_client = DocumentIntelligenceClient(
@@ -109,43 +174,109 @@ MAX_WORKERS = int(os.getenv("THREAD_POOL_MAX_WORKERS", "3"))
 # Initialize a thread pool for CPU-bound tasks
 executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
 
-upload_jobs = {}
-job_lock = threading.Lock()
-JOB_EXPIRY_SECONDS = 86400  # 24 hours
-
-# Background job status tracking
-def update_job_status(job_id: str, status: str, result: dict = None, error: str = None):
-    with job_lock:
-        upload_jobs[job_id] = {
-            "status": status,
-            "result": result,
-            "error": error,
-            "timestamp": datetime.utcnow().isoformat()
-        }
+if isinstance(model, SidecarEmbeddingModel):
+    # The sidecar batches queries from every worker itself
+    query_embedder = model
+else:
+    # Dedicated pool for interactive inference so /api/embed never waits behind
+    # ingestion work and never runs encode() on the event loop
+    inference_executor = ThreadPoolExecutor(
+        max_workers=app_settings.embedding.inference_threads,
+        thread_name_prefix="embedding-inference"
+    )
 
-def cleanup_expired_jobs():
-    while True:
-        time.sleep(3600)  # Cleanup hourly
-        with job_lock:
-            now = datetime.utcnow()
-            expired_keys = [
-                job_id for job_id, job in upload_jobs.items()
-                if (now - datetime.fromisoformat(job["timestamp"])).total_seconds() > JOB_EXPIRY_SECONDS
-            ]
-            for job_id in expired_keys:
-                del upload_jobs[job_id]
+    # Coalesce concurrent /api/embed calls into batched encode() calls
+    query_embedder = MicroBatcher(
+        encode_fn=lambda texts: model.encode(texts),
+        max_batch_size=app_settings.embedding.batch_max_size,
+        max_wait_ms=app_settings.embedding.batch_max_wait_ms,
+        executor=inference_executor,
+        max_queue_size=app_settings.embedding.max_queue_size,
+    )
 
-# Start cleanup thread
-cleanup_thread = threading.Thread(target=cleanup_expired_jobs, daemon=True)
-cleanup_thread.start()
+# Ingestion encodes whole documents at once in length-bucketed, auto-sized
+# batches; in local mode the cache is consulted before anything is encoded
+ingestion_encoder = AdaptiveBatchEncoder(
+    model.model if isinstance(model, CachedEmbeddingModel) else model,
+    max_batch_size=app_settings.embedding.ingestion_batch_size,
+    max_batch_tokens=app_settings.embedding.ingestion_max_batch_tokens,
+    target_batch_seconds=app_settings.embedding.ingestion_target_batch_seconds,
+)
+if isinstance(model, CachedEmbeddingModel):
+    ingestion_encoder = CachedEmbeddingModel(ingestion_encoder, model.cache)
+
+# Shared by every upload job: files only start when a CPU slot and their
+# estimated working memory are free
+ingestion_budget = ResourceBudget(
+    cpu_slots=app_settings.ingestion.cpu_slots,
+    memory_bytes=app_settings.ingestion.memory_budget_mb * 1024 * 1024
+)
+# Page ranges of large PDFs are extracted in separate processes, each opening
+# the file by path; the processes are started on first use
+pdf_executor = ProcessPoolExecutor(
+    max_workers=app_settings.ingestion.pdf_processes,
+    mp_context=multiprocessing.get_context("spawn")
+)
+# XML documents are converted to markdown in their own pool; 0 processes
+# converts them on the thread parsing the file
+xml_executor = ProcessPoolExecutor(
+    max_workers=app_settings.ingestion.xml_processes,
+    mp_context=multiprocessing.get_context("spawn")
+) if app_settings.ingestion.xml_processes else None
+
+@lru_cache(maxsize=None)
+def get_extraction_cache():
+    """The extraction cache for PDFs, or None if it is disabled."""
+    if not app_settings.ingestion.extraction_cache:
+        return None
+    container_client = None
+    if app_settings.ingestion.extraction_cache_container:
+        # Read and written from extraction threads, so the sync client is used
+        from azure.storage.blob import BlobServiceClient
+        container_client = BlobServiceClient(account_url=blob_service_url, credential=storage_key).get_container_client(
+            app_settings.ingestion.extraction_cache_container
+        )
+    return ExtractionCache(app_settings.ingestion.extraction_cache_dir, container_client=container_client)
+
+# Working memory of one file (the parsed document), estimated from its size
+INGESTION_MEMORY_PER_BYTE = 4
+
+def create_search_indexer(delete: bool = False, on_indexed=None) -> SearchIndexer:
+    search_client = current_app.search_client
+    send = search_client.delete_documents if delete else search_client.upload_documents
+
+    async def upload(documents):
+        return await send(documents=documents)
+
+    return SearchIndexer(
+        upload,
+        max_batch_documents=app_settings.ingestion.index_batch_size,
+        max_batch_bytes=int(app_settings.ingestion.index_max_batch_mb * 1024 * 1024),
+        max_concurrency=app_settings.ingestion.index_max_concurrency,
+        max_retries=app_settings.ingestion.index_max_retries,
+        on_indexed=on_indexed,
+    )
+
+# Upload jobs are queued in a SQLite database shared by every gunicorn worker
+# and run by a fixed pool of job workers in each of them
+job_store = JobStore(
+    app_settings.ingestion.job_db,
+    app_settings.ingestion.job_spool_dir,
+    lease_seconds=app_settings.ingestion.job_lease_seconds,
+    max_attempts=app_settings.ingestion.job_max_attempts
+)
+
+# The ingested files, on this instance's local storage and shared by its workers;
+# kept in step with Blob Storage by sync_manifest, rebuilt by tools/reconcile_manifest.py
+document_manifest = DocumentManifest(app_settings.ingestion.manifest_db)
 
-# Helper to run async in background thread
-def run_async_in_thread(loop, coro):
-    asyncio.set_event_loop(loop)
-    loop.run_until_complete(coro)
-    
 def create_app():
     app = Quart(__name__)
+    # Uploaded files larger than the threshold are streamed to disk while parsing
+    app.request_class = spooled_request_class(
+        app_settings.ingestion.upload_memory_threshold_kb * 1024,
+        directory=app_settings.ingestion.job_spool_dir
+    )
     app.register_blueprint(bp)
     app.config["TEMPLATES_AUTO_RELOAD"] = True
     # Allow files up to 100000MB
@@ -153,6 +284,7 @@ def create_app():
     
     @app.before_serving
     async def init():
+        init_azure_clients(app)
         try:
             app.cosmos_conversation_client = await init_cosmosdb_client()
             cosmos_db_ready.set()
@@ -160,10 +292,100 @@ def create_app():
             logging.exception("Failed to initialize CosmosDB client")
             app.cosmos_conversation_client = None
             raise e
+        app.add_background_task(warm_up)
+        if app_settings.ingestion.manifest_reconcile_on_start or app_settings.ingestion.manifest_sync_seconds:
+            app.add_background_task(sync_manifest)
+
+        app.job_workers = JobWorkerPool(
+            job_store,
+            run_pipeline_job,
+            workers=app_settings.ingestion.job_workers,
+            poll_seconds=app_settings.ingestion.job_poll_seconds,
+            ttl_seconds=app_settings.ingestion.job_ttl_seconds
+        )
+        app.add_background_task(app.job_workers.run)
+
+    @app.after_serving
+    async def shutdown():
+        serving_stopped.set()
+        # Running jobs go back to the queue for the next worker
+        await app.job_workers.stop()
+        pdf_executor.shutdown(wait=False, cancel_futures=True)
+        if xml_executor:
+            xml_executor.shutdown(wait=False, cancel_futures=True)
+        await close_azure_clients(app)
+        if app.cosmos_conversation_client:
+            await app.cosmos_conversation_client.cosmosdb_client.close()
     
     return app
 
 
+# Warm-up state reported by /readyz: "pending", "ready" or the last error
+readiness = {"model": "pending", "blob": "pending", "search": "pending", "cosmos": "pending"}
+# Longest wait between two attempts of a failing warm-up step
+WARM_UP_MAX_BACKOFF_SECONDS = 30
+# Set on shutdown so the background loops (warm-up retries, manifest sync) stop waiting
+serving_stopped = asyncio.Event()
+
+
+async def _warm_up_model():
+    # Load the weights and run one forward pass, bypassing the cache
+    await asyncio.get_running_loop().run_in_executor(
+        None, lambda: (model.model if isinstance(model, CachedEmbeddingModel) else model).encode(["warm-up"])
+    )
+
+
+async def _warm_up_blob():
+    await current_app.blob_service_client.get_container_client(container_name).get_container_properties()
+
+
+async def _warm_up_search():
+    await current_app.search_client.get_document_count()
+
+
+async def _warm_up_cosmos():
+    await current_app.cosmos_client.get_database_client(app_settings.chat_history.database).read()
+
+
+async def warm_up():
+    """
+    Load the embedding model and open the Azure connection pools in the
+    background. A failing step is retried, with a backoff capped at
+    WARM_UP_MAX_BACKOFF_SECONDS, until it succeeds, so /readyz recovers once
+    the dependency does.
+    """
+    async def step(name, fn):
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                await fn()
+                readiness[name] = "ready"
+                logging.info(f"Warm-up of {name} finished in {time.perf_counter() - started:.2f}s")
+                return
+            except Exception as e:
+                readiness[name] = f"error: {e}"
+                logging.warning(f"Warm-up of {name} failed (attempt {attempt + 1}): {e}")
+            try:
+                await asyncio.wait_for(serving_stopped.wait(), min(WARM_UP_MAX_BACKOFF_SECONDS, 2 ** attempt))
+                return
+            except asyncio.TimeoutError:
+                attempt += 1
+
+    await asyncio.gather(
+        step("model", _warm_up_model),
+        step("blob", _warm_up_blob),
+        step("search", _warm_up_search),
+        step("cosmos", _warm_up_cosmos),
+    )
+
+
+@bp.route("/readyz", methods=["GET"])
+async def readyz():
+    ready = all(state == "ready" for state in readiness.values())
+    return jsonify({"ready": ready, "checks": readiness}), 200 if ready else 503
+
+
 @bp.route("/")
 async def index():
     return await render_template(
@@ -329,12 +551,12 @@ async def prepare_model_args(request_body, request_headers):
 
     try:
         # Get the CosmosDB container for system messages
-        database = cosmos_client.get_database_client(app_settings.chat_history.database)
+        database = current_app.cosmos_client.get_database_client(app_settings.chat_history.database)
         container = database.get_container_client(USER_SYSTEM_MESSAGE_COLLECTION)
 
         # Query for the system message for the authenticated user
         query = f"SELECT * FROM c WHERE c.user_id = '{user_id}'"
-        results = list(container.query_items(query=query, enable_cross_partition_query=True))
+        results = [item async for item in container.query_items(query=query)]
 
         if results:
             # If a system message exists for the user, use that
@@ -632,11 +854,13 @@ async def add_conversation():
         else:
             raise Exception("No user message found")
         
-        database = cosmos_client.get_database_client(app_settings.chat_history.database)
-        existing_collections = [coll['id'] for coll in database.list_containers()]
+        from azure.cosmos import PartitionKey
+
+        database = current_app.cosmos_client.get_database_client(app_settings.chat_history.database)
+        existing_collections = [coll['id'] async for coll in database.list_containers()]
 
         if collection_name not in existing_collections:
-            database.create_container(id=collection_name, partition_key=PartitionKey(path='/conversation_id'))
+            await database.create_container(id=collection_name, partition_key=PartitionKey(path='/conversation_id'))
             print(f"Created collection '{collection_name}'.")
         else:
             print(f"Collection '{collection_name}' already exists.")
@@ -644,7 +868,7 @@ async def add_conversation():
         # Retrieve system message from the 'user_system_message' collection
         container = database.get_container_client(USER_SYSTEM_MESSAGE_COLLECTION)
         query = f"SELECT * FROM c WHERE c.user_id = '{user_id}'"
-        results = list(container.query_items(query=query, enable_cross_partition_query=True))
+        results = [item async for item in container.query_items(query=query)]
 
         # Use the system message from the collection if it exists, otherwise fallback to default value
         if results:
@@ -659,7 +883,7 @@ async def add_conversation():
         }
 
         container = database.get_container_client(collection_name)
-        container.create_item(system_message_entry)
+        await container.create_item(system_message_entry)
         print(f"Inserted system message for conversation ID '{conversation_id}'.")
 
         # Submit request to Chat Completions for response
@@ -1099,101 +1323,311 @@ def upload_to_blob_storage(blob_client, file_data):
 async def list_files():
     # Get the company name from the query parameter (if provided)
     company_name = request.args.get("company", "").strip().lower().strip('.')
-    container_client = blob_service_client.get_container_client(container=container_name)
-    
-    if company_name:
-        # Filter blob names that start with the company name followed by '/'
-        blob_list = [blob.name for blob in container_client.list_blobs() if blob.name.startswith(f"{company_name}/")]
-    else:
-        # Fallback: return all files if no company name is provided
-        blob_list = [blob.name for blob in container_client.list_blobs()]
-    
+
+    # The company's files, or all files if no company name is provided, from
+    # the manifest while it is in step with Blob Storage
+    loop = asyncio.get_running_loop()
+    blob_list = None
+    if await loop.run_in_executor(None, manifest_is_current):
+        blob_list = await loop.run_in_executor(None, document_manifest.blob_paths, company_name or None)
+    if not blob_list:
+        # Not in the manifest (yet), or it may miss changes made by other instances: list the container
+        container_client = current_app.blob_service_client.get_container_client(container=container_name)
+        blob_list = [
+            blob.name
+            async for blob in container_client.list_blobs(name_starts_with=f"{company_name}/" if company_name else None)
+            if not is_manifest_blob(blob.name)
+        ]
     return {"files": blob_list}
 
 
-# Helper function to extract pages from PDF bytes
-async def extract_pages_as_markdown(pdf_bytes: bytes, file_name: str) -> list:
-    loop = asyncio.get_running_loop()
-    return await loop.run_in_executor(
-        executor, 
-        lambda: _extract_pages_sync(pdf_bytes, file_name)
+def manifest_is_current() -> bool:
+    """
+    Whether the document manifest can stand in for a container listing:
+    other instances add and delete files too, so it must have been synced
+    with Blob Storage recently (always, if periodic syncing is off).
+    """
+    interval = app_settings.ingestion.manifest_sync_seconds
+    if not interval:
+        return True
+    synced_at = document_manifest.synced_at()
+    return synced_at is not None and time.time() - synced_at < 2 * interval
+
+
+@bp.route("/pipeline/stats", methods=["GET"])
+async def manifest_stats():
+    # Files, bytes, chunks and pages of the company, or of every company
+    company_name = request.args.get("company", "").strip().lower().strip('.')
+    stats = await asyncio.get_running_loop().run_in_executor(None, document_manifest.stats, company_name or None)
+    return jsonify({"organizations": stats})
+
+
+async def find_document_ids(organization: str, file_name: str) -> list:
+    """Look up the keys of the documents of one file."""
+    pages = iter_document_id_pages(current_app.search_client, document_filter(organization, file_name))
+    return [key async for keys in pages for key in keys]
+
+
+async def delete_documents(organization: str = None, file_name: str = None, on_deleted=None, chunk_ids=()) -> int:
+    """
+    Delete the search documents of an organization (of every organization
+    if None), or of one of its files, in batches of keys, and return how
+    many were deleted. The keys in `chunk_ids` (e.g. from the document
+    manifest) are deleted first, then whatever else the filter still finds.
+    `on_deleted(count)` is awaited after each batch.
+    """
+    async def count_deleted(documents):
+        count_deleted.total += len(documents)
+        if on_deleted is not None:
+            await on_deleted(count_deleted.total)
+
+    seen = set()
+
+    def unseen(keys):
+        for key in keys:
+            if key not in seen:
+                seen.add(key)
+                yield {"id": key}
+
+    count_deleted.total = 0
+    indexer = create_search_indexer(delete=True, on_indexed=count_deleted)
+    await indexer.add(unseen(chunk_ids))
+    # Without a sortable key the filter is queried again once each page is deleted
+    pages = iter_document_id_pages(
+        current_app.search_client, document_filter(organization, file_name), before_requery=indexer.flush
+    )
+    async for keys in pages:
+        await indexer.add(unseen(keys))
+    await indexer.flush()
+    return count_deleted.total
+
+
+async def indexed_chunk_ids(blob_client, organization: str, filename: str, digest: str):
+    """
+    Return the search keys a previous ingestion of the file left in the index
+    (an empty set for a new file), or None if the stored blob already has
+    content hash `digest` and there is nothing to do.
+    """
+    from azure.core.exceptions import ResourceNotFoundError
+
+    # The blob decides: another instance may have replaced or deleted it
+    # since this instance's manifest recorded it
+    try:
+        properties = await blob_client.get_blob_properties()
+    except ResourceNotFoundError:
+        return set()
+    stored_digest = (properties.metadata or {}).get(CONTENT_HASH_METADATA)
+    if stored_digest == digest:
+        return None
+
+    record = await asyncio.get_running_loop().run_in_executor(None, document_manifest.get, blob_client.blob_name)
+    if record is not None and record.content_hash == stored_digest:
+        return set(record.chunk_ids)
+
+    # Not in the manifest (ingested before it was kept, or elsewhere since)
+
+    manifest_client = current_app.blob_service_client.get_blob_client(
+        container=container_name, blob=manifest_blob_name(blob_client.blob_name)
+    )
+    try:
+        download = await manifest_client.download_blob()
+        return set(orjson.loads(await download.readall()))
+    except ResourceNotFoundError:
+        # Ingested before chunk manifests were kept: look its documents up
+        return set(await find_document_ids(organization, filename))
+
+
+async def commit_ingestion(
+    blob_client,
+    path: str,
+    digest: str,
+    chunk_ids: list,
+    previous_ids: set,
+    organization: str,
+    filename: str,
+    page_count: int = None
+):
+    """
+    Delete the documents of chunks that no longer exist, then record the new
+    chunk keys and upload the file with its content hash. The blob is written
+    last, so an interrupted job is simply redone by the next upload; the file
+    is added to the document manifest once it is stored.
+    """
+    stale_ids = previous_ids.difference(chunk_ids)
+    if stale_ids:
+        indexer = create_search_indexer(delete=True)
+        await indexer.add({"id": key} for key in stale_ids)
+        await indexer.flush()
+        logging.info(f"{blob_client.blob_name}: deleted {len(stale_ids)} stale chunks")
+
+    manifest_client = current_app.blob_service_client.get_blob_client(
+        container=container_name, blob=manifest_blob_name(blob_client.blob_name)
+    )
+    await manifest_client.upload_blob(orjson.dumps(chunk_ids), overwrite=True)
+    with open(path, "rb") as data:
+        await blob_client.upload_blob(
+            data, length=os.path.getsize(path), overwrite=True, metadata={CONTENT_HASH_METADATA: digest}
+        )
+    record = DocumentRecord(
+        organization=organization,
+        file_name=filename,
+        blob_path=blob_client.blob_name,
+        content_hash=digest,
+        chunk_ids=chunk_ids,
+        page_count=page_count,
+        byte_size=os.path.getsize(path),
     )
+    await asyncio.get_running_loop().run_in_executor(None, document_manifest.put, record)
 
-def _extract_pages_sync(pdf_bytes: bytes, file_name: str) -> list:
-    """Synchronous PDF processing"""
-    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-    total_pages = doc.page_count
-    pages = []
-    for page in doc:
-        text = page.get_text("text")
-        md = f"## {file_name} - Page {page.number + 1}\n\n{text}\n"
-        pages.append({
-            "page_number": page.number + 1,
-            "markdown": md,
-            "total_pages": total_pages
-        })
-    return pages
-
-async def process_single_file(filename: str, content: bytes, organization: str):
+
+def job_checkpointer(job: Job, filename: str, with_pages: bool, progress=lambda indexed: None):
+    """
+    Build an `on_indexed` callback that checkpoints the chunks of `filename`
+    accepted by the search service (and `progress(indexed)`) in the job store,
+    as long as the job's lease is still held.
+    """
+    async def on_indexed(documents):
+        chunks = [(doc["id"], doc["page"] if with_pages else None) for doc in documents]
+        on_indexed.indexed += len(chunks)
+        await asyncio.get_running_loop().run_in_executor(
+            None, job_store.checkpoint, job.id, filename, chunks, progress(on_indexed.indexed), job.lease_owner
+        )
+
+    on_indexed.indexed = 0
+    return on_indexed
+
+
+async def load_checkpoint(job: Job, filename: str) -> dict:
+    if job is None:
+        return {}
+    return await asyncio.get_running_loop().run_in_executor(None, job_store.checkpointed_chunks, job.id, filename)
+
+
+async def ensure_lease(job: Job):
+    """Raise `LeaseLostError` if the job was claimed again by another worker."""
+    if job is not None:
+        await asyncio.get_running_loop().run_in_executor(None, job_store.ensure_lease, job.id, job.lease_owner)
+
+
+async def process_single_file(filename: str, path: str, organization: str, job: Job = None):
     blob_path = f"{organization}/{filename}"
-    blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_path)
+    blob_client = current_app.blob_service_client.get_blob_client(container=container_name, blob=blob_path)
     
-    if blob_client.exists():
-        return None, filename  # Skip existing
+    # Unchanged files are skipped; changed ones only re-embed changed pages
+    digest = await asyncio.get_running_loop().run_in_executor(None, file_hash, path)
+    previous_ids = await indexed_chunk_ids(blob_client, organization, filename, digest)
+    if previous_ids is None:
+        return None, filename
     
     try:
         print(f"Processing file: {filename}")
-        # Extract pages from PDF
-        page_data = await extract_pages_as_markdown(content, filename)
-        
-        docs_array = []
-        loop = asyncio.get_running_loop()
-        
-        # Process in batches
-        batch_size = MAX_WORKERS  # Adjust based on memory constraints
-        for i in range(0, len(page_data), batch_size):
-            batch = page_data[i:i+batch_size]
-            texts = [p["markdown"] for p in batch]
-            
-            # Generate embeddings in thread pool
-            vectors = await loop.run_in_executor(
-                executor,
-                lambda: model.encode(texts).tolist()
+
+        # Pages an earlier attempt of this job already indexed are neither
+        # extracted nor embedded again
+        checkpointed = await load_checkpoint(job, filename)
+        if checkpointed:
+            logging.info(f"{filename}: resuming after {len(checkpointed)} indexed pages")
+        chunk_ids = list(checkpointed)
+        total_pages = []
+
+        def to_document(page, vector):
+            return {
+                "id": page["id"],
+                "organization": organization,
+                "title": f"Page {page['page_number']}",
+                "page": page["page_number"],
+                "total_pages": page["total_pages"],
+                "file": filename,
+                "content": page["markdown"],
+                "contentVector": vector.tolist(),
+                "keywords": []
+            }
+
+        def progress(indexed):
+            return {
+                "total_pages": total_pages[0] if total_pages else None,
+                "extracted": len(chunk_ids),
+                "embedded": len(checkpointed) + pipeline.stats["embedded"],
+                "indexed": len(checkpointed) + indexed,
+            }
+
+        # Extract, embed and index pages concurrently; only a few batches of
+        # pages are in flight at any time
+        pipeline = IngestionPipeline(
+            encode_fn=ingestion_encoder.encode,
+            indexer=create_search_indexer(
+                on_indexed=job_checkpointer(job, filename, with_pages=True, progress=progress) if job else None
+            ),
+            executor=executor,
+            queue_size=app_settings.ingestion.queue_size,
+            embed_batch_size=app_settings.embedding.ingestion_batch_size,
+            name=filename,
+        )
+
+        skip_pages = set(checkpointed.values())
+
+        def extract():
+            return iter_pdf_pages_parallel(
+                path,
+                filename,
+                pdf_executor,
+                processes=app_settings.ingestion.pdf_processes,
+                pages_per_range=app_settings.ingestion.pdf_pages_per_range,
+                min_pages=app_settings.ingestion.pdf_parallel_min_pages,
+                skip_pages=skip_pages
             )
-            
-            # Create document entries
-            for j, p in enumerate(batch):
-                docs_array.append({
-                    "id": str(uuid.uuid4()),
-                    "organization": organization,
-                    "title": f"Page {p['page_number']}",
-                    "page": p["page_number"],
-                    "total_pages": p["total_pages"],
-                    "file": filename,
-                    "content": p["markdown"],
-                    "contentVector": vectors[j],
-                    "keywords": []
-                })
-        
-        # Upload documents in batches of 5
-        for i in range(0, len(docs_array), 5):
-            batch = docs_array[i:i+5]
-            search_client.upload_documents(batch)
-            await asyncio.sleep(0.5)  # Throttle requests
+
+        def changed_pages():
+            cache = get_extraction_cache()
+            # Documents extracted before (e.g. for an earlier index build) come from the cache
+            pages = extract() if cache is None else iter_cached_pdf_pages(
+                extract, filename, cache, digest, pdf_extractor_version(), skip_pages=skip_pages
+            )
+            for page in pages:
+                total_pages[:] = [page["total_pages"]]
+                page_id = chunk_id(organization, filename, page["page_number"], page["markdown"])
+                chunk_ids.append(page_id)
+                if page_id not in previous_ids:
+                    yield {**page, "id": page_id, "content": page["markdown"]}
+
+        stats = await pipeline.run(changed_pages(), to_document)
+        logging.info(f"{filename}: indexed {stats['indexed']} of {len(chunk_ids)} pages")
         
-        # Upload to blob storage
-        blob_client.upload_blob(content)
+        await ensure_lease(job)
+        await commit_ingestion(
+            blob_client, path, digest, chunk_ids, previous_ids, organization, filename,
+            page_count=total_pages[0] if total_pages else len(chunk_ids)
+        )
         return filename, None
     
+    except LeaseLostError:
+        raise
     except Exception as e:
         logging.error(f"Failed {filename}: {str(e)}")
         return None, filename
     finally:
         # Explicit memory cleanup
-        del content
         gc.collect()
 
 
+async def queue_upload_job(kind: str, organization: str, files) -> str:
+    """Save the uploaded files to the job spool and queue a job for them."""
+    job_id = str(uuid.uuid4())
+    job_dir = job_store.job_dir(job_id)
+    os.makedirs(job_dir, exist_ok=True)
+
+    saved_files = []
+    for position, uploaded_file in enumerate(files):
+        path = os.path.join(job_dir, str(position))
+        await uploaded_file.save(path)
+        saved_files.append({"filename": uploaded_file.filename, "path": path})
+
+    await asyncio.get_running_loop().run_in_executor(
+        None, job_store.create, job_id, kind, {"organization": organization, "files": saved_files}
+    )
+    return job_id
+
+
 @bp.route("/pipeline/upload", methods=["POST"])
 async def upload_files():
     form = await request.form
@@ -1203,29 +1637,61 @@ async def upload_files():
     if not organization:
         return jsonify({"detail": "Missing 'organization' field."}), 400
     
-    job_id = str(uuid.uuid4())
-    update_job_status(job_id, "queued")
-    
-    # Capture file content immediately before files are closed
-    file_data = []
-    for uploaded_file in files:
-        file_data.append({
-            "filename": uploaded_file.filename,
-            "content": uploaded_file.read(),
-            "organization": organization
-        })
-    
-    # Start background processing
-    loop = asyncio.new_event_loop()
-    threading.Thread(
-        target=run_async_in_thread,
-        args=(loop, async_process_files(file_data, job_id, False)),
-        daemon=True
-    ).start()
-    
+    # Any worker's job pool may pick the job up
+    job_id = await queue_upload_job("pdf", organization, files)
     return jsonify({"job_id": job_id}), 202
 
 
+async def delete_organization(organization: str = None, job: Job = None) -> dict:
+    """
+    Delete the files of an organization (of every organization if None),
+    their chunk manifests and their search documents. Run as a job, the
+    counts are recorded as the job's progress after every batch.
+
+    The blobs listed under the organization's prefixes and the documents its
+    filter matches are merged with the files and keys of the document
+    manifest, which may lack files ingested before it was kept or elsewhere.
+    The files leave the manifest once everything was deleted.
+    """
+    loop = asyncio.get_running_loop()
+    container_client = current_app.blob_service_client.get_container_client(container=container_name)
+    records = await loop.run_in_executor(None, document_manifest.records, organization)
+
+    prefixes = [None] if organization is None else [f"{organization}/", f"{CHUNK_MANIFEST_PREFIX}{organization}/"]
+    blob_names = dict.fromkeys(
+        name for record in records for name in (record.blob_path, manifest_blob_name(record.blob_path))
+    )
+    for prefix in prefixes:
+        async for blob in container_client.list_blobs(name_starts_with=prefix):
+            blob_names[blob.name] = None
+
+    progress = {
+        "files": sum(1 for name in blob_names if not is_manifest_blob(name)),
+        "deleted_blobs": 0,
+        "deleted_documents": 0,
+    }
+
+    def update(counter):
+        async def on_batch(count):
+            progress[counter] = count
+            if job:
+                await asyncio.get_running_loop().run_in_executor(
+                    None, job_store.checkpoint, job.id, organization or "*", [], dict(progress), job.lease_owner
+                )
+        return on_batch
+
+    await delete_blobs(container_client, blob_names, on_batch=update("deleted_blobs"))
+    await delete_documents(
+        organization,
+        chunk_ids=(key for record in records for key in record.chunk_ids),
+        on_deleted=update("deleted_documents")
+    )
+    await loop.run_in_executor(
+        None, document_manifest.remove, [name for name in blob_names if not is_manifest_blob(name)]
+    )
+    return progress
+
+
 # Route to delete all files or files by companyClaim or organizationFilter
 @bp.route("/pipeline/delete_all", methods=["DELETE"])
 async def delete_all():
@@ -1233,62 +1699,45 @@ async def delete_all():
     organizationFilter = form.get("organizationFilter")
     companyClaim = form.get("companyClaim")
 
-    container_client = blob_service_client.get_container_client(container=container_name)
-    blob_list = list(container_client.list_blobs())
-
-    files_to_delete = []
     if companyClaim:
-        files_to_delete = [blob.name for blob in blob_list if blob.name.startswith(f"{companyClaim.strip().lower().strip('.')}/")]
+        organization = companyClaim.strip().lower().strip('.')
+    elif organizationFilter:
+        organization = None if organizationFilter == "all" else organizationFilter.strip().lower().strip('.')
     else:
-        if organizationFilter == "all":
-            files_to_delete = [blob.name for blob in blob_list]
-        else:
-            files_to_delete = [blob.name for blob in blob_list if blob.name.startswith(f"{organizationFilter.strip().lower().strip('.')}/")]
-
-    for file in files_to_delete:
-        container_client.delete_blob(file)
-
-    results = search_client.search(search_text="*")
-    keys_to_delete = []
-
-    for doc in results:
-        if companyClaim:
-            if doc.get("organization") == companyClaim.strip().lower().strip('.'):
-                keys_to_delete.append(doc["id"])
-        else:
-            if organizationFilter == "all" or doc.get("organization") == organizationFilter.strip().lower().strip('.'):
-                keys_to_delete.append(doc["id"])
+        return jsonify({"detail": "Missing 'organizationFilter' or 'companyClaim' field."}), 400
 
-    if keys_to_delete:
-        batch = [{"@search.action": "delete", "id": key} for key in keys_to_delete]
-        search_client.upload_documents(documents=batch)
+    # Large tenants are deleted by a job; its progress is reported by /pipeline/job_status
+    if form.get("background", "").lower() == "true":
+        job_id = str(uuid.uuid4())
+        await asyncio.get_running_loop().run_in_executor(
+            None, job_store.create, job_id, "delete", {"organization": organization}
+        )
+        return jsonify({"job_id": job_id}), 202
 
+    result = await delete_organization(organization)
     return jsonify({
-        "message": f"Deleted {len(files_to_delete)} files and {len(keys_to_delete)} documents based on the filter criteria."
+        "message": f"Deleted {result['files']} files and {result['deleted_documents']} documents based on the filter criteria."
     })
 
 # Route to delete a specific file
 @bp.route("/pipeline/delete_file/<path:filename>", methods=["DELETE"])
 async def delete_single_file(filename):
-    container_client = blob_service_client.get_container_client(container=container_name)
-    blob_client = container_client.get_blob_client(filename)
+    loop = asyncio.get_running_loop()
+    container_client = current_app.blob_service_client.get_container_client(container=container_name)
+    record = await loop.run_in_executor(None, document_manifest.get, filename)
 
-    if blob_client.exists():
-        blob_client.delete_blob()
+    if record or await container_client.get_blob_client(filename).exists():
+        # The file and its chunk manifest in one batch request
+        await delete_blobs(container_client, [filename, manifest_blob_name(filename)])
     else:
         return jsonify({"message": f"The file '{filename}' was not found in the blob container."}), 404
 
-    results = search_client.search(search_text="*")
-    keys_to_delete = []
-    for doc in results:
-        if doc.get("file") == os.path.basename(filename):
-            folder_name = filename.split("/")[0]
-            if doc.get("organization") == folder_name:
-                keys_to_delete.append(doc["id"])
-
-    if keys_to_delete:
-        batch = [{"@search.action": "delete", "id": key} for key in keys_to_delete]
-        search_client.upload_documents(documents=batch)
+    # Its documents by the keys in the manifest and by a filter on the file
+    deleted = await delete_documents(
+        filename.split("/")[0], os.path.basename(filename), chunk_ids=record.chunk_ids if record else ()
+    )
+    await loop.run_in_executor(None, document_manifest.remove, [filename])
+    if deleted:
         return jsonify({"message": f"File '{filename}' and all related documents have been deleted."})
     else:
         return jsonify({"message": f"File '{filename}' was deleted from blob storage, but no matching documents were found in the index."})
@@ -1321,11 +1770,11 @@ async def table_data():
 
         # Query CosmosDB for the system message from the 'system_messages' collection
         try:
-            database = cosmos_client.get_database_client(app_settings.chat_history.database)
+            database = current_app.cosmos_client.get_database_client(app_settings.chat_history.database)
             container = database.get_container_client("system_messages")  # Use the correct collection name
 
             query = f"SELECT * FROM c WHERE c.conversation_id = '{conversation_id}'"
-            results = list(container.query_items(query=query, enable_cross_partition_query=True))
+            results = [item async for item in container.query_items(query=query)]
 
             if results:
                 system_message = results[0].get("system_message", app_settings.azure_openai.system_message)
@@ -1382,11 +1831,11 @@ async def get_system_message():
             raise Exception("CosmosDB is not configured or not working")
 
         # Get the CosmosDB container
-        container = cosmos_client.get_database_client(app_settings.chat_history.database).get_container_client(USER_SYSTEM_MESSAGE_COLLECTION)
+        container = current_app.cosmos_client.get_database_client(app_settings.chat_history.database).get_container_client(USER_SYSTEM_MESSAGE_COLLECTION)
 
         # Check if the user already has a system message in the collection
         query = f"SELECT * FROM c WHERE c.user_id = '{user_id}'"
-        results = list(container.query_items(query=query, enable_cross_partition_query=True))
+        results = [item async for item in container.query_items(query=query)]
 
         # If no entry exists, return the default system message from settings
         if not results:
@@ -1419,28 +1868,30 @@ async def update_system_message():
         if not current_app.cosmos_conversation_client:
             raise Exception("CosmosDB is not configured or not working")
 
+        from azure.cosmos import PartitionKey
+
         # Get the CosmosDB container
-        database = cosmos_client.get_database_client(app_settings.chat_history.database)
+        database = current_app.cosmos_client.get_database_client(app_settings.chat_history.database)
         container = database.get_container_client(USER_SYSTEM_MESSAGE_COLLECTION)
 
         # Check if the collection exists, if not create it
-        existing_collections = [coll['id'] for coll in database.list_containers()]
+        existing_collections = [coll['id'] async for coll in database.list_containers()]
         if USER_SYSTEM_MESSAGE_COLLECTION not in existing_collections:
-            container = database.create_container(id=USER_SYSTEM_MESSAGE_COLLECTION, partition_key=PartitionKey(path='/user_id'))
+            container = await database.create_container(id=USER_SYSTEM_MESSAGE_COLLECTION, partition_key=PartitionKey(path='/user_id'))
             print(f"Created collection '{USER_SYSTEM_MESSAGE_COLLECTION}'.")
 
         # Query for the system message
         query = f"SELECT * FROM c WHERE c.user_id = '{user_id}'"
-        results = list(container.query_items(query=query, enable_cross_partition_query=True))
+        results = [item async for item in container.query_items(query=query)]
 
         if results:
             # Update the system message for the existing entry
             system_message_entry = results[0]
             system_message_entry["system_message"] = new_system_message
-            container.upsert_item(system_message_entry)
+            await container.upsert_item(system_message_entry)
         else:
             # Insert a new system message for the user, ensuring to include the 'id'
-            container.create_item({
+            await container.create_item({
                 "id": str(uuid.uuid4()),  # Generate a unique id for the system message
                 "user_id": user_id,
                 "system_message": new_system_message
@@ -1457,45 +1908,60 @@ async def update_system_message():
 async def embed_text():
     try:
         request_json = await request.get_json()
-        text = request_json.get("input", "")
-        if not text:
-            return jsonify({"error": "Error: 'input' field is empty."}), 400
+        # A single string or, as in the OpenAI embeddings API, a list of strings
+        texts = request_json.get("input", "")
+        if isinstance(texts, str):
+            texts = [texts]
+        if not isinstance(texts, list) or not texts or not all(isinstance(t, str) and t for t in texts):
+            return jsonify({"error": "Error: 'input' must be a non-empty string or a list of non-empty strings."}), 400
+        if len(texts) > app_settings.embedding.max_inputs:
+            return jsonify({"error": f"Error: 'input' may contain at most {app_settings.embedding.max_inputs} strings."}), 400
+
+        encoding_format = request_json.get("encoding_format", "float")
+        dtype = request_json.get("dtype", "float32")
+        try:
+            validate_encoding(encoding_format, dtype)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
         logging.info("Quart endpoint for text embedding has been called.")
 
-        # 1) Generate the raw embedding
+        # 1) Generate the raw embeddings (batched with concurrent requests);
+        #    the model answers repeated texts from its cache
         try:
-            vec = model.encode(text)
+            vectors = await query_embedder.embed_many(texts)
+        except EmbeddingQueueFullError as e:
+            logging.warning("Rejecting /api/embed request: %s", e)
+            return jsonify({"error": str(e)}), 503, {"Retry-After": str(e.retry_after)}
         except Exception as e:
             logging.exception("Error generating embedding")
             return jsonify({"error": f"Error generating embedding: {str(e)}"}), 500
 
-        # 2) If it's a 2-D array, take the first (and only) row
-        if hasattr(vec, "ndim") and vec.ndim > 1:
-            vec = vec[0]
-
-        # 3) Convert to a list (may still contain numpy types or nested lists)
-        embedding_list = vec.tolist() if hasattr(vec, "tolist") else vec
-
-        # 4) If you still have a nested list (e.g. [[…]]), flatten one level
-        if embedding_list and isinstance(embedding_list[0], list):
-            embedding_list = embedding_list[0]
-
-        # 5) Coerce each element to a built-in Python float
-        embedding_list = [float(x) for x in embedding_list]
-
-        response_data = {
-            "data": [
-                {
-                    "embedding": embedding_list
-                }
-            ]
-        }
-        return jsonify(response_data), 200
+        # 2) Serialize straight from the numpy buffers: float JSON arrays, or
+        #    base64 of the little-endian float32/float16 bytes
+        embeddings = [encode_embedding(vec, encoding_format, dtype) for vec in vectors]
+        return Response(embedding_response(embeddings), status=200, mimetype="application/json")
 
     except Exception as e:
         logging.exception("Exception in /embed endpoint")
         return jsonify({"error": str(e)}), 500
+
+
+@bp.route("/api/embed/stats", methods=["GET"])
+async def embed_stats():
+    if isinstance(query_embedder, SidecarEmbeddingModel):
+        sidecar_stats = await query_embedder.stats()
+        # The sidecar owns the model and its cache; workers keep none
+        return jsonify({
+            "batcher": sidecar_stats["batcher"],
+            "cache": sidecar_stats["cache"],
+            "ingestion": ingestion_encoder.stats(),
+        }), 200
+    return jsonify({
+        "batcher": query_embedder.stats(),
+        "cache": model.cache.stats(),
+        "ingestion": ingestion_encoder.stats(),
+    }), 200
     
 
 @bp.route("/get-pdf", methods=["GET"])
@@ -1508,32 +1974,40 @@ async def get_pdf():
 
     try:
         # Access the blob container
-        container_client = blob_service_client.get_container_client(container_name)
+        container_client = current_app.blob_service_client.get_container_client(container_name)
         blob_client = None
 
         if '/' in file_name:
             # If '/' is in file_name, treat it as a full path
             blob_client = container_client.get_blob_client(file_name)
             # Check if the blob exists
-            if not blob_client.exists():
+            if not await blob_client.exists():
                 return jsonify({"error": "File not found"}), 404
         else:
-            # If no '/' in file_name, search for the file by name
-            for blob in container_client.list_blobs():
-                # Extract the file name from the blob's name
-                blob_base_name = blob.name.split('/')[-1]
-                if blob_base_name == file_name:
-                    blob_client = container_client.get_blob_client(blob.name)
-                    break
+            # If no '/' in file_name, look the file up by name in the manifest,
+            # then in the container for files the manifest does not know
+            loop = asyncio.get_running_loop()
+            record = await loop.run_in_executor(None, document_manifest.find, file_name)
+            if record:
+                blob_client = container_client.get_blob_client(record.blob_path)
+                if not await blob_client.exists():
+                    # Deleted by another instance since
+                    await loop.run_in_executor(None, document_manifest.remove, [record.blob_path])
+                    blob_client = None
+            if not blob_client:
+                async for blob in container_client.list_blobs():
+                    if not is_manifest_blob(blob.name) and blob.name.split('/')[-1] == file_name:
+                        blob_client = container_client.get_blob_client(blob.name)
+                        break
             if not blob_client:
                 return jsonify({"error": "File not found"}), 404
         
         # Download the blob data
-        download_stream = blob_client.download_blob()
+        download_stream = await blob_client.download_blob()
         
         # Return the PDF with the inline disposition so it opens in the browser
         return Response(
-            download_stream.readall(),
+            await download_stream.readall(),
             mimetype="application/pdf",
             headers={"Content-Disposition": f"inline; filename={file_name}"}
         )
@@ -1542,257 +2016,113 @@ async def get_pdf():
 
  # Helpers for upload xml
 
-def inline_to_md(elem) -> str:
+def iter_xml_chunks(xml_file, organization: str, file_name: str):
     """
-    Recursively convert an element and its children to inline Markdown,
-    handling <strong>, <em>, <code>, <a>, <img>, <br>, <span>, and other inline tags.
+    Stream the chunks of an XML export (a path or binary file object). Each
+    <document> is converted to markdown and chunked as soon as it has been
+    parsed and is dropped afterwards, so memory use does not grow with the
+    size of the file. Yields the fields of each chunk's search document,
+    except the organization and vector; repeated chunks are yielded once.
     """
-    parts: List[str] = []
-    # Text before children
-    if elem.text:
-        parts.append(elem.text)
-
-    for child in elem:
-        tag = child.tag.lower()
-        if tag in ("strong", "b"):
-            parts.append(f"**{inline_to_md(child)}**")
-        elif tag in ("em", "i"):
-            parts.append(f"*{inline_to_md(child)}*")
-        elif tag == "code":
-            code_text = (child.text or "").strip()
-            parts.append(f"`{code_text}`")
-        elif tag == "a":
-            href = child.attrib.get("href", "").strip()
-            link_text = inline_to_md(child)
-            parts.append(f"[{link_text}]({href})")
-        elif tag == "img":
-            src = child.attrib.get("href", child.attrib.get("src", "")).strip()
-            alt = child.attrib.get("alt", child.attrib.get("id", "")).strip()
-            parts.append(f"![{alt}]({src})")
-        elif tag == "br":
-            parts.append("  \n")  # Markdown line break
-        else:
-            # For <span> and unknown inline tags, ignore tag but recurse
-            parts.append(inline_to_md(child))
-
-        # Tail text after this child
-        if child.tail:
-            parts.append(child.tail)
-
-    return "".join(parts).strip()
-
+    seen_ids = set()
+
+    # Documents are converted to markdown in the XML process pool, in order
+    documents = iter_xml_document_chunks(
+        xml_file,
+        xml_executor,
+        processes=app_settings.ingestion.xml_processes,
+        documents_per_task=app_settings.ingestion.xml_documents_per_task,
+        parser=app_settings.ingestion.xml_parser
+    )
+    for folder_id, doc_id, title, chunks in documents:
+        try:
+            page_num = int(doc_id)
+        except (TypeError, ValueError):
+            page_num = 0
+
+        for idx, chunk in enumerate(chunks, 1):
+            header = f"{title} - Chunk {idx}"
+            content = f"{header}\n\n{chunk}"
+            chunk_key = chunk_id(organization, file_name, f"{doc_id}/{idx}", content)
+            if chunk_key in seen_ids:
+                continue
+            seen_ids.add(chunk_key)
+
+            yield {
+                "id": chunk_key,
+                "title": f"{title} - Part {idx}",
+                "page": page_num,
+                "total_pages": int(folder_id) if folder_id and folder_id.isdigit() else 0,
+                "file": doc_id,
+                "content": content,
+            }
 
-def elem_to_markdown(elem, level: int = 0) -> List[str]:
-    """
-    Convert XML element tree to Markdown lines, handling headings,
-    paragraphs (including code blocks), lists, tables, images, footnotes.
-    """
-    md_lines: List[str] = []
-    tag = elem.tag.lower()
-    indent = "  " * level
-
-    # --- Headings ---
-    if tag in ("h1", "h2", "h3", "h4", "h5", "h6"):
-        level_num = int(tag[1])
-        prefix = "#" * level_num
-        text = inline_to_md(elem)
-        md_lines.append(f"{prefix} {text}")
-        return md_lines
-
-    # --- Paragraphs & Code Blocks ---
-    if tag == "p":
-        if elem.attrib.get("class", "").lower() == "code":
-            md_lines.append("```")
-            md_lines.extend((elem.text or "").splitlines())
-            md_lines.append("```")
-        else:
-            text = inline_to_md(elem)
-            if text:
-                md_lines.append(text)
-        return md_lines
-
-    # --- Lists ---
-    if tag in ("list", "ul", "ol"):
-        list_type = elem.attrib.get("type", "bullet")
-        is_ordered = list_type != "bullet" or tag == "ol"
-        for li in elem.findall("li"):
-            p_child = li.find("p")
-            content = inline_to_md(p_child) if p_child is not None else inline_to_md(li)
-            prefix = f"{indent}{(str(li.attrib.get('value')) + '.') if is_ordered else '-'} "
-            md_lines.append(f"{prefix}{content}")
-            # Nested lists
-            for sub in li:
-                if sub.tag.lower() in ("list", "ul", "ol"):
-                    md_lines.extend(elem_to_markdown(sub, level + 1))
-        return md_lines
-
-    # --- Tables ---
-    if tag == "table":
-        tgroup = elem.find("tgroup") or elem
-        rows = tgroup.findall("row")
-        if rows:
-            headers = [inline_to_md(cell) for cell in rows[0].findall("entry")]
-            md_lines.append("| " + " | ".join(headers) + " |")
-            md_lines.append("| " + " | ".join(["---"] * len(headers)) + " |")
-            for row in rows[1:]:
-                cells = [inline_to_md(cell) for cell in row.findall("entry")]
-                md_lines.append("| " + " | ".join(cells) + " |")
-        return md_lines
-
-    # --- Footnotes ---
-    if tag == "footnote":
-        foot = "".join(elem.itertext()).strip()
-        if foot:
-            md_lines.append(f"> **Footnote:** {foot}")
-        return md_lines
-
-    # --- Fallback: recurse into children ---
-    for child in elem:
-        md_lines.extend(elem_to_markdown(child, level))
-
-    return md_lines
-
-def chunk_text(text: str, chunk_size: int = 5_000) -> List[str]:
-    """Split text into ~chunk_size chars while respecting code blocks & sentences."""
-    chunks, start, length = [], 0, len(text)
-    while start < length:
-        end = min(start + chunk_size, length)
-        segment = text[start:end]
-
-        # try to cut nicely
-        cut = max(
-            segment.rfind('```'),        # code block fence
-            segment.rfind('\n\n'),       # paragraph
-            segment.rfind('. '),         # sentence end
-        )
-        if cut != -1 and cut > chunk_size * 0.3:
-            end = start + cut + (0 if cut == segment.rfind('```') else 1)
 
-        chunks.append(text[start:end].strip())
-        start = end
-    return [c for c in chunks if c]
+async def process_single_xml_file(filename: str, path: str, organization: str, job: Job = None):
+    blob_path = f"{organization}/{filename}"
+    blob_client = current_app.blob_service_client.get_blob_client(container=container_name, blob=blob_path)
 
+    # Unchanged files are skipped; changed ones only re-embed changed chunks
+    digest = await asyncio.get_running_loop().run_in_executor(None, file_hash, path)
+    previous_ids = await indexed_chunk_ids(blob_client, organization, filename, digest)
+    if previous_ids is None:
+        return None, filename
 
-def process_xml_file(
-        xml_data: bytes,
-        organization: str,
-        file_name: str,
-        model  # sentence-transformers model
-):
-    """
-    Parse XML data from bytes and return a list of documents ready for
-    `search_client.upload_documents`.
-    """
     try:
-        root = ET.fromstring(xml_data)
-        base_name = os.path.splitext(file_name)[0]
-        
-        # Handle different root types
-        if root.tag == "folder":
-            folder_elem = root
-        elif root.tag == "document":
-            # Create virtual folder for single document
-            folder_elem = ET.Element("folder")
-            folder_elem.append(root)
-        else:
-            # Look for nested folder or create virtual container
-            folder_elem = root.find("folder") 
-            if folder_elem is None:
-                folder_elem = ET.Element("folder")
-                # Collect all document/folder elements
-                for child in root:
-                    if child.tag in ["document", "folder"]:
-                        folder_elem.append(child)
-        
-    except ET.ParseError as e:
-        raise ValueError(f"Failed to parse XML data: {e}")
-
-    docs_array = []
+        # Chunks an earlier attempt of this job already indexed are not embedded again
+        checkpointed = await load_checkpoint(job, filename)
+        indexed_ids = previous_ids.union(checkpointed)
+        chunk_ids = []
+
+        def to_document(chunk, vector):
+            return {
+                **chunk,
+                "organization": organization,
+                "contentVector": vector.tolist(),
+                "keywords": []
+            }
 
-    # -- depth-first traversal of folders & docs -----------------------------
-    def traverse(folder_elem, parent_folder_id=None, parent_folder_name=None):
-        fid = folder_elem.attrib.get("id", parent_folder_id)
-        fname = folder_elem.findtext("naam", parent_folder_name or base_name).strip()
+        def progress(indexed):
+            return {
+                "extracted": len(chunk_ids),
+                "embedded": len(checkpointed) + pipeline.stats["embedded"],
+                "indexed": len(checkpointed) + indexed,
+            }
 
-        # process <document> children
-        for doc in folder_elem.findall("document"):
-            doc_id = doc.attrib.get("id", "")
-            try:
-                page_num = int(doc_id)
-            except (TypeError, ValueError):
-                page_num = 0
-                
-            title = doc.findtext("naam", "").strip() or "(untitled)"
-            body_section = doc.find("document/section")
-            print(f"\nProcessing document: {doc_id}")
-            markdown = "\n\n".join(elem_to_markdown(body_section)) if body_section is not None else ""
-
-            for idx, chunk in enumerate(chunk_text(markdown), 1):
-                header = f"{title} - Chunk {idx}"
-                content = f"{header}\n\n{chunk}"
-                print(f"Embedding chunk {idx} of document {doc_id}")
-                content_vector = model.encode(content).tolist()
-
-                docs_array.append({
-                    "id": str(uuid.uuid4()),
-                    "organization": organization,
-                    "title": f"{title} - Part {idx}",
-                    "page": page_num,
-                    "total_pages": int(fid) if fid and fid.isdigit() else 0,
-                    "file": doc_id,
-                    "content": content,
-                    "keywords": [],
-                    "contentVector": content_vector,
-                })
-
-        # recurse into sub-folders
-        for sub in folder_elem.findall("folder"):
-            traverse(sub, fid, fname)
-
-    traverse(folder_elem, parent_folder_name=base_name)
-    return docs_array
-
-
-async def process_single_xml_file(filename: str, content: bytes, organization: str):
-    blob_path = f"{organization}/{filename}"
-    blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_path)
+        # Parse, embed and index chunks concurrently, as the documents of the
+        # export are read
+        pipeline = IngestionPipeline(
+            encode_fn=ingestion_encoder.encode,
+            indexer=create_search_indexer(
+                on_indexed=job_checkpointer(job, filename, with_pages=False, progress=progress) if job else None
+            ),
+            executor=executor,
+            queue_size=app_settings.ingestion.queue_size,
+            embed_batch_size=app_settings.embedding.ingestion_batch_size,
+            name=filename,
+        )
 
-    if blob_client.exists():
-        return None, filename  # Skip existing
+        def changed_chunks():
+            for chunk in iter_xml_chunks(path, organization, filename):
+                chunk_ids.append(chunk["id"])
+                if chunk["id"] not in indexed_ids:
+                    yield chunk
 
-    try:
-        loop = asyncio.get_running_loop()
+        stats = await pipeline.run(changed_chunks(), to_document)
+        logging.info(f"{filename}: indexed {stats['indexed']} of {len(chunk_ids)} chunks")
         
-        # Offload XML processing to thread pool
-        docs_array = await loop.run_in_executor(
-            executor,
-            lambda: process_xml_file(
-                xml_data=content,
-                organization=organization,
-                file_name=filename,
-                model=model
-            )
-        )
-        
-        # Upload documents in smaller batches
-        for i in range(0, len(docs_array), 5):  # 5 documents per batch
-            batch = docs_array[i:i+5]
-            try:
-                search_client.upload_documents(batch)
-                await asyncio.sleep(0.3)  # Throttle requests
-            except Exception as e:
-                logging.error(f"Batch upload failed for {filename}: {str(e)}")
-        
-        # Upload original XML to blob storage
-        blob_client.upload_blob(content)
+        # Drop stale chunks, then store the original XML with its content hash
+        await ensure_lease(job)
+        await commit_ingestion(blob_client, path, digest, chunk_ids, previous_ids, organization, filename)
         return filename, None
     
+    except LeaseLostError:
+        raise
     except Exception as e:
         logging.error(f"Failed to process {filename}: {str(e)}")
         return None, filename
     finally:
         # Explicit memory cleanup
-        del content
         gc.collect()
         
 
@@ -1805,76 +2135,151 @@ async def upload_xml_files():
     if not organization:
         return jsonify({"detail": "Missing 'organization' field."}), 400
     
-    job_id = str(uuid.uuid4())
-    update_job_status(job_id, "queued")
-    
-    # Capture file content immediately before files are closed
-    file_data = []
-    for uploaded_file in files:
-        file_data.append({
-            "filename": uploaded_file.filename,
-            "content": uploaded_file.read(),
-            "organization": organization
-        })
-    
-    # Start background processing
-    loop = asyncio.new_event_loop()
-    threading.Thread(
-        target=run_async_in_thread,
-        args=(loop, async_process_files(file_data, job_id, True)),
-        daemon=True
-    ).start()
-    
+    # Any worker's job pool may pick the job up
+    job_id = await queue_upload_job("xml", organization, files)
     return jsonify({"job_id": job_id}), 202
 
 
-async def async_process_files(file_data, job_id, is_xml=False):
-    try:
-        processed_files = []
-        skipped_files = []
-        
-        for file_info in file_data:
-            if is_xml:
-                processed, skipped = await process_single_xml_file(
-                    file_info["filename"],
-                    file_info["content"],
-                    file_info["organization"]
-                )
-            else:
-                processed, skipped = await process_single_file(
-                    file_info["filename"],
-                    file_info["content"],
-                    file_info["organization"]
+async def reconcile_manifest(organization: str = None, replace: bool = True) -> dict:
+    """
+    Rebuild the document manifest of an organization (of every organization
+    if None) from Blob Storage and the search index: each file's content
+    hash and size from its blob, and its document keys from its chunk
+    manifest, or from the index for files ingested before those were kept.
+
+    With `replace` False, only the files missing from the manifest are
+    looked up and added, and the files whose blob no longer exists are
+    removed; the records of the others are kept as they are.
+    """
+    from azure.core.exceptions import ResourceNotFoundError
+
+    loop = asyncio.get_running_loop()
+    started = time.time()
+    known = set() if replace else set(await loop.run_in_executor(None, document_manifest.blob_paths, organization))
+    container_client = current_app.blob_service_client.get_container_client(container=container_name)
+    listed = [
+        blob
+        async for blob in container_client.list_blobs(
+            name_starts_with=f"{organization}/" if organization else None, include=["metadata"]
+        )
+        if not is_manifest_blob(blob.name)
+    ]
+    blobs = [blob for blob in listed if blob.name not in known]
+
+    async def record_of(blob) -> DocumentRecord:
+        blob_organization, file_name = blob.name.split("/")[0], os.path.basename(blob.name)
+        try:
+            download = await container_client.get_blob_client(manifest_blob_name(blob.name)).download_blob()
+            chunk_ids = orjson.loads(await download.readall())
+        except ResourceNotFoundError:
+            chunk_ids = await find_document_ids(blob_organization, file_name)
+        return DocumentRecord(
+            organization=blob_organization,
+            file_name=file_name,
+            blob_path=blob.name,
+            content_hash=(blob.metadata or {}).get(CONTENT_HASH_METADATA),
+            chunk_ids=chunk_ids,
+            # PDFs are indexed one document per page
+            page_count=len(chunk_ids) if file_name.lower().endswith(".pdf") else None,
+            byte_size=blob.size,
+            updated_at=blob.last_modified.timestamp() if blob.last_modified else 0.0,
+        )
+
+    records = await run_concurrently(blobs, record_of, concurrency=app_settings.ingestion.file_concurrency)
+    removed = []
+    if replace:
+        await loop.run_in_executor(None, document_manifest.replace, records, organization)
+    else:
+        await loop.run_in_executor(None, document_manifest.add_missing, records)
+        removed = await loop.run_in_executor(
+            None, document_manifest.prune, [blob.name for blob in listed], started, organization
+        )
+    if organization is None:
+        await loop.run_in_executor(None, document_manifest.mark_synced, started)
+    return {
+        "files": len(records),
+        "removed": len(removed),
+        "chunks": sum(len(record.chunk_ids) for record in records),
+    }
+
+
+async def sync_manifest():
+    """
+    Keep the document manifest in step with Blob Storage, which other
+    instances (each with its own manifest) change too: add the files it
+    does not know and remove those deleted elsewhere, when the worker starts
+    and then every INGESTION_MANIFEST_SYNC_SECONDS, unless another worker
+    sharing the manifest has just done so.
+    """
+    loop = asyncio.get_running_loop()
+    interval = app_settings.ingestion.manifest_sync_seconds
+    delay = 0 if app_settings.ingestion.manifest_reconcile_on_start else interval
+    while True:
+        if delay:
+            try:
+                await asyncio.wait_for(serving_stopped.wait(), delay)
+                return
+            except asyncio.TimeoutError:
+                pass
+            synced_at = await loop.run_in_executor(None, document_manifest.synced_at)
+            due = synced_at is None or time.time() - synced_at >= interval
+        else:
+            due = True
+        if due:
+            try:
+                result = await reconcile_manifest(replace=False)
+                logging.info(
+                    f"Document manifest: added {result['files']} and removed {result['removed']} files"
+                    " to match Blob Storage"
                 )
-            
-            if processed:
-                processed_files.append(processed)
-            if skipped:
-                skipped_files.append(skipped)
-        
-        update_job_status(job_id, "completed", {
-            "processed_files": processed_files,
-            "skipped_files": skipped_files
-        })
-    except Exception as e:
-        logging.error(f"Background job failed: {str(e)}")
-        update_job_status(job_id, "failed", error=str(e))
+            except Exception:
+                logging.exception("Failed to reconcile the document manifest")
+        if not interval:
+            return
+        delay = interval
+
+
+async def run_pipeline_job(job: Job) -> dict:
+    """Run a queued upload or delete job and return its result."""
+    if job.kind == "delete":
+        return await delete_organization(job.payload["organization"], job=job)
+
+    process_file = process_single_xml_file if job.kind == "xml" else process_single_file
+    organization = job.payload["organization"]
+
+    async def process(file_info):
+        # Files are read from the spool by path, never held in memory whole
+        return await process_file(file_info["filename"], file_info["path"], organization, job=job)
+
+    # Several files at once, within the budget shared with other jobs
+    results = await run_concurrently(
+        job.payload["files"],
+        process,
+        concurrency=app_settings.ingestion.file_concurrency,
+        budget=ingestion_budget,
+        memory_of=lambda file_info: os.path.getsize(file_info["path"]) * INGESTION_MEMORY_PER_BYTE
+    )
+    return {
+        "processed_files": [processed for processed, _ in results if processed],
+        "skipped_files": [skipped for _, skipped in results if skipped]
+    }
 
 
 @bp.route("/pipeline/job_status/<job_id>", methods=["GET"])
 async def get_job_status(job_id: str):
-    with job_lock:
-        job = upload_jobs.get(job_id)
+    loop = asyncio.get_running_loop()
+    job = await loop.run_in_executor(None, job_store.get, job_id)
     
     if not job:
         return jsonify({"error": "Job not found"}), 404
     
     return jsonify({
         "job_id": job_id,
-        "status": job["status"],
-        "result": job.get("result"),
-        "error": job.get("error"),
-        "timestamp": job["timestamp"]
+        "status": job.status,
+        "progress": await loop.run_in_executor(None, job_store.progress, job_id),
+        "result": job.result,
+        "error": job.error,
+        "timestamp": datetime.utcfromtimestamp(job.updated_at).isoformat()
     })
 
 app = create_app()
@@ -0,0 +1,129 @@
+import logging
+import threading
+import time
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+
+# Rough characters-per-token ratio used when the model exposes no tokenizer
+# (e.g. the sidecar client)
+_CHARS_PER_TOKEN = 4
+
+
+class AdaptiveBatchEncoder:
+    """
+    Bulk encoder for ingestion that groups texts of similar token length.
+
+    Texts are sorted by token length (longest first) and cut into batches so
+    that each batch stays within a padded-token budget: `len(batch) *
+    longest_text` may not exceed `max_batch_tokens` (the memory cap), nor the
+    number of tokens the model is measured to process in
+    `target_batch_seconds`. Short texts therefore go in large batches and
+    long ones in small batches, with little padding in either. Vectors are
+    returned in the original order.
+    """
+
+    def __init__(
+        self,
+        model,
+        max_batch_size: int = 64,
+        max_batch_tokens: int = 16384,
+        target_batch_seconds: float = 2.0,
+    ):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.target_batch_seconds = target_batch_seconds
+
+        self._lock = threading.Lock()
+        self._tokens_per_second: Optional[float] = None
+        self._batches = 0
+        self._texts = 0
+        self._tokens = 0
+        self._padded_tokens = 0
+
+    def token_lengths(self, texts: Sequence[str]) -> List[int]:
+        max_length = getattr(self.model, "max_seq_length", None)
+        tokenizer = getattr(self.model, "tokenizer", None)
+        if tokenizer is not None:
+            try:
+                encoded = tokenizer(
+                    list(texts),
+                    truncation=bool(max_length),
+                    max_length=max_length,
+                    return_attention_mask=False,
+                    return_token_type_ids=False,
+                )
+                return [len(ids) for ids in encoded["input_ids"]]
+            except Exception:
+                logging.debug("Tokenizer failed, estimating token lengths", exc_info=True)
+        lengths = [max(1, len(t) // _CHARS_PER_TOKEN) for t in texts]
+        return [min(n, max_length) for n in lengths] if max_length else lengths
+
+    def _token_budget(self) -> int:
+        budget = self.max_batch_tokens
+        if self._tokens_per_second:
+            budget = min(budget, int(self._tokens_per_second * self.target_batch_seconds))
+        return max(1, budget)
+
+    def _record(self, batch_size: int, tokens: int, padded_tokens: int, seconds: float):
+        with self._lock:
+            self._batches += 1
+            self._texts += batch_size
+            self._tokens += tokens
+            self._padded_tokens += padded_tokens
+            rate = padded_tokens / max(seconds, 1e-6)
+            if self._tokens_per_second is None:
+                self._tokens_per_second = rate
+            else:
+                self._tokens_per_second = 0.7 * self._tokens_per_second + 0.3 * rate
+
+    def encode(self, sentences, progress: Optional[Callable[[int, int], None]] = None, **kwargs) -> np.ndarray:
+        """
+        Encode `sentences` in length-bucketed batches. `progress(done, total)`
+        is called after every batch.
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        lengths = self.token_lengths(texts)
+        order = sorted(range(len(texts)), key=lambda i: lengths[i], reverse=True)
+        result: Optional[np.ndarray] = None
+
+        start = 0
+        while start < len(order):
+            budget = self._token_budget()
+            longest = lengths[order[start]]
+            size = max(1, min(self.max_batch_size, budget // max(1, longest), len(order) - start))
+            indices = order[start:start + size]
+
+            started = time.perf_counter()
+            vectors = np.asarray(
+                self.model.encode([texts[i] for i in indices], batch_size=size, **kwargs), dtype=np.float32
+            )
+            self._record(size, sum(lengths[i] for i in indices), size * longest, time.perf_counter() - started)
+
+            if result is None:
+                result = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+            result[indices] = vectors
+            start += size
+            if progress:
+                progress(start, len(texts))
+
+        return result[0] if single else result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "batches": self._batches,
+                "texts": self._texts,
+                "tokens": self._tokens,
+                "padding_ratio": 1 - self._tokens / self._padded_tokens if self._padded_tokens else 0.0,
+                "tokens_per_second": self._tokens_per_second,
+                "token_budget": self._token_budget(),
+                "max_batch_size": self.max_batch_size,
+                "max_batch_tokens": self.max_batch_tokens,
+                "target_batch_seconds": self.target_batch_seconds,
+            }
@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import math
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+
+
+class EmbeddingQueueFullError(Exception):
+    """Raised when the inference backlog is full; callers should retry later."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Embedding queue is full, retry after {retry_after} seconds")
+        self.retry_after = retry_after
+
+
+@dataclass
+class _PendingText:
+    text: str
+    future: asyncio.Future
+
+
+def _histogram_bucket(size: int) -> str:
+    # Power-of-two buckets keep the histogram small: "1", "2", "3-4", "5-8", ...
+    if size <= 2:
+        return str(size)
+    upper = 1 << (size - 1).bit_length()
+    return f"{upper // 2 + 1}-{upper}"
+
+
+class MicroBatcher:
+    """
+    Collects concurrent embedding requests and encodes them together.
+
+    Texts are queued as they arrive; a single worker task waits up to
+    `max_wait_ms` after the first pending text (or until `max_batch_size`
+    texts are queued), runs one `encode_fn` call for the whole batch and
+    resolves each caller's future with its own row of the result.
+
+    `encode_fn` runs on `executor` so the event loop never blocks on
+    inference. At most `max_queue_size` texts may wait; beyond that `embed`
+    raises `EmbeddingQueueFullError` instead of growing the backlog.
+    """
+
+    def __init__(
+        self,
+        encode_fn: Callable[[List[str]], np.ndarray],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        executor=None,
+        max_queue_size: int = 256,
+    ):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.executor = executor
+        self.max_queue_size = max_queue_size
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self._batches = 0
+        self._texts = 0
+        self._max_queue_depth = 0
+        self._rejected = 0
+        self._batch_seconds = 0.0
+        self._batch_sizes = Counter()
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    def retry_after(self) -> int:
+        # Rough time to drain the current backlog at the observed batch latency
+        batches_ahead = self._queue.qsize() / self.max_batch_size + 1 if self._queue else 1
+        return max(1, math.ceil(batches_ahead * self._batch_seconds))
+
+    async def embed(self, text: str) -> np.ndarray:
+        self._ensure_worker()
+        if self._queue.qsize() >= self.max_queue_size:
+            self._rejected += 1
+            raise EmbeddingQueueFullError(self.retry_after())
+        future = self._loop.create_future()
+        self._queue.put_nowait(_PendingText(text, future))
+        self._max_queue_depth = max(self._max_queue_depth, self._queue.qsize())
+        return await future
+
+    async def embed_many(self, texts: Sequence[str]) -> List[np.ndarray]:
+        """
+        Queue several texts at once (all or none are admitted) and return one
+        vector per text, in order. They share batches with concurrent callers.
+        A request larger than `max_queue_size` is only admitted into an empty
+        queue.
+        """
+        self._ensure_worker()
+        depth = self._queue.qsize()
+        if depth and depth + len(texts) > self.max_queue_size:
+            self._rejected += len(texts)
+            raise EmbeddingQueueFullError(self.retry_after())
+        futures = []
+        for text in texts:
+            future = self._loop.create_future()
+            self._queue.put_nowait(_PendingText(text, future))
+            futures.append(future)
+        self._max_queue_depth = max(self._max_queue_depth, self._queue.qsize())
+        try:
+            return list(await asyncio.gather(*futures))
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+    async def _collect(self) -> List[_PendingText]:
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            # Callers that gave up (e.g. client disconnects) don't need a slot
+            batch = [item for item in batch if not item.future.done()]
+            if batch:
+                await self._encode(batch)
+
+    async def _encode(self, batch: Sequence[_PendingText]):
+        texts = [item.text for item in batch]
+        started = self._loop.time()
+        try:
+            vectors = await self._loop.run_in_executor(self.executor, self.encode_fn, texts)
+        except Exception as e:
+            logging.exception("Batched embedding of %d texts failed", len(texts))
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(e)
+            return
+
+        elapsed = self._loop.time() - started
+        self._batch_seconds = elapsed if not self._batches else 0.8 * self._batch_seconds + 0.2 * elapsed
+        self._batches += 1
+        self._texts += len(texts)
+        self._batch_sizes[_histogram_bucket(len(texts))] += 1
+        for item, vector in zip(batch, vectors):
+            if not item.future.done():
+                item.future.set_result(vector)
+
+    async def aclose(self):
+        if self._worker is not None and not self._worker.done():
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._worker = None
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "max_queue_depth": self._max_queue_depth,
+            "max_queue_size": self.max_queue_size,
+            "rejected": self._rejected,
+            "mean_batch_seconds": self._batch_seconds,
+            "batches": self._batches,
+            "texts": self._texts,
+            "mean_batch_size": (self._texts / self._batches) if self._batches else 0.0,
+            "batch_size_histogram": dict(self._batch_sizes),
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+        }
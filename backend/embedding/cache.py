@@ -0,0 +1,313 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+_VECTOR_DTYPE = np.dtype("<f4")
+_SQLITE_MAX_PARAMS = 500
+
+
+def normalize_text(text: str) -> str:
+    """Unicode NFC with whitespace runs collapsed, which the tokenizers ignore anyway."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def text_digest(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def _slot_tag(digest: str) -> int:
+    # Non-zero 63-bit tag written next to each vector so readers can detect a
+    # slot that was recycled by another process between lookup and read
+    return (int(digest[:16], 16) >> 1) or 1
+
+
+class _MemoryTier:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, digest: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._entries.get(digest)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return vector
+
+    def put(self, digest: str, vector: np.ndarray):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[digest] = vector
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class _DiskTier:
+    """
+    Fixed-size vector slots in a memory-mapped file, indexed by SQLite.
+
+    The slot file is sized from `max_bytes` once the vector dimension is
+    known; when it is full the least recently used slots are recycled. The
+    index is safe to share between processes (e.g. gunicorn workers).
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            os.path.join(directory, "index.sqlite3"), timeout=30, check_same_thread=False, isolation_level=None
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries (digest TEXT PRIMARY KEY, slot INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._vectors: Optional[np.memmap] = None
+        self._tags: Optional[np.memmap] = None
+        self.capacity = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        row = self._db.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+        if row:
+            self._open(row[0])
+
+    def _open(self, dim: int):
+        self.dim = dim
+        self.capacity = max(1, self.max_bytes // (dim * _VECTOR_DTYPE.itemsize))
+        vectors_path = os.path.join(self.directory, "vectors.f32")
+        tags_path = os.path.join(self.directory, "tags.u64")
+        for path, size in ((vectors_path, self.capacity * dim * 4), (tags_path, self.capacity * 8)):
+            with open(path, "ab") as f:
+                if f.tell() < size:
+                    f.truncate(size)  # sparse until slots are written
+        self._vectors = np.memmap(vectors_path, dtype=_VECTOR_DTYPE, mode="r+", shape=(self.capacity, dim))
+        self._tags = np.memmap(tags_path, dtype=np.uint64, mode="r+", shape=(self.capacity,))
+
+    def get_many(self, digests: Sequence[str]) -> Dict[str, np.ndarray]:
+        found: Dict[str, np.ndarray] = {}
+        if self._vectors is None:
+            self.misses += len(digests)
+            return found
+
+        with self._lock:
+            for i in range(0, len(digests), _SQLITE_MAX_PARAMS):
+                part = list(digests[i:i + _SQLITE_MAX_PARAMS])
+                placeholders = ",".join("?" * len(part))
+                rows = self._db.execute(
+                    f"SELECT digest, slot FROM entries WHERE digest IN ({placeholders})", part
+                ).fetchall()
+                for digest, slot in rows:
+                    if slot < self.capacity:
+                        vector = np.array(self._vectors[slot])
+                        if int(self._tags[slot]) == _slot_tag(digest):
+                            found[digest] = vector
+            if found:
+                now = time.time()
+                self._db.executemany(
+                    "UPDATE entries SET last_access = ? WHERE digest = ?", [(now, d) for d in found]
+                )
+
+        self.hits += len(found)
+        self.misses += len(digests) - len(found)
+        return found
+
+    def put_many(self, items: Dict[str, np.ndarray]):
+        if not items:
+            return
+        with self._lock:
+            if self._vectors is None:
+                dim = len(next(iter(items.values())))
+                self._db.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('dim', ?)", (dim,))
+                stored = self._db.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()[0]
+                self._open(stored)
+
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                digests = list(items)
+                existing = set()
+                for i in range(0, len(digests), _SQLITE_MAX_PARAMS):
+                    part = digests[i:i + _SQLITE_MAX_PARAMS]
+                    placeholders = ",".join("?" * len(part))
+                    existing.update(
+                        d for (d,) in self._db.execute(
+                            f"SELECT digest FROM entries WHERE digest IN ({placeholders})", part
+                        )
+                    )
+                new = [d for d in digests if d not in existing and len(items[d]) == self.dim]
+                if not new:
+                    self._db.execute("COMMIT")
+                    return
+
+                used = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+                next_free = self._db.execute("SELECT value FROM meta WHERE name = 'next_slot'").fetchone()
+                next_free = next_free[0] if next_free else used
+                free_slots = list(range(next_free, min(self.capacity, next_free + len(new))))
+                shortfall = len(new) - len(free_slots)
+                if shortfall > 0:
+                    victims = self._db.execute(
+                        "SELECT digest, slot FROM entries ORDER BY last_access LIMIT ?", (shortfall,)
+                    ).fetchall()
+                    self._db.executemany("DELETE FROM entries WHERE digest = ?", [(d,) for d, _ in victims])
+                    free_slots.extend(slot for _, slot in victims)
+                    self.evictions += len(victims)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO meta (name, value) VALUES ('next_slot', ?)",
+                    (min(self.capacity, next_free + len(new)),),
+                )
+
+                now = time.time()
+                rows = []
+                for digest, slot in zip(new, free_slots):
+                    self._tags[slot] = 0
+                    self._vectors[slot] = items[digest]
+                    self._tags[slot] = _slot_tag(digest)
+                    rows.append((digest, slot, now))
+                self._db.executemany(
+                    "INSERT INTO entries (digest, slot, last_access) VALUES (?, ?, ?)", rows
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {
+            "entries": entries,
+            "capacity": self.capacity,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache keyed by (model name, normalized text hash).
+
+    Lookups go to an in-memory LRU first and then, if `disk_dir` is set, to a
+    memory-mapped on-disk tier that survives restarts and is shared by every
+    worker process on the machine.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        memory_entries: int = 10000,
+        disk_dir: Optional[str] = None,
+        disk_max_bytes: int = 1024 * 1024 * 1024,
+    ):
+        self.model_name = model_name
+        self.memory = _MemoryTier(memory_entries)
+        self.disk = None
+        if disk_dir:
+            model_dir = re.sub(r"[^A-Za-z0-9._-]+", "_", model_name)
+            self.disk = _DiskTier(os.path.join(disk_dir, model_dir), disk_max_bytes)
+
+    def get(self, text: str, include_disk: bool = True) -> Optional[np.ndarray]:
+        digest = text_digest(text)
+        vector = self.memory.get(digest)
+        if vector is None and include_disk and self.disk:
+            vector = self.disk.get_many([digest]).get(digest)
+            if vector is not None:
+                self.memory.put(digest, vector)
+        return vector
+
+    def put(self, text: str, vector: np.ndarray, include_disk: bool = True):
+        digest = text_digest(text)
+        vector = np.asarray(vector, dtype=_VECTOR_DTYPE)
+        self.memory.put(digest, vector)
+        if include_disk and self.disk:
+            self.disk.put_many({digest: vector})
+
+    def encode(self, texts: Sequence[str], encode_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """Return one vector per text, calling `encode_fn` only for texts not cached yet."""
+        digests = [text_digest(t) for t in texts]
+        vectors: Dict[str, np.ndarray] = {}
+        for digest in dict.fromkeys(digests):
+            vector = self.memory.get(digest)
+            if vector is not None:
+                vectors[digest] = vector
+
+        pending = [d for d in dict.fromkeys(digests) if d not in vectors]
+        if pending and self.disk:
+            for digest, vector in self.disk.get_many(pending).items():
+                vectors[digest] = vector
+                self.memory.put(digest, vector)
+            pending = [d for d in pending if d not in vectors]
+
+        if pending:
+            first_text = {}
+            for digest, text in zip(digests, texts):
+                first_text.setdefault(digest, text)
+            encoded = np.asarray(encode_fn([first_text[d] for d in pending]), dtype=_VECTOR_DTYPE)
+            fresh = dict(zip(pending, encoded))
+            for digest, vector in fresh.items():
+                self.memory.put(digest, vector)
+            if self.disk:
+                try:
+                    self.disk.put_many(fresh)
+                except sqlite3.Error:
+                    logging.exception("Failed to write embeddings to the disk cache")
+            vectors.update(fresh)
+
+        return np.stack([vectors[d] for d in digests]) if digests else np.empty((0, 0), dtype=_VECTOR_DTYPE)
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model_name,
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk else None,
+        }
+
+
+class CachedEmbeddingModel:
+    """Wraps a model so that `encode()` is served from an `EmbeddingCache` where possible."""
+
+    def __init__(self, model, cache: EmbeddingCache):
+        self.model = model
+        self.cache = cache
+
+    def encode(self, sentences, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        vectors = self.cache.encode(texts, lambda pending: self.model.encode(pending, **kwargs))
+        return vectors[0] if single else vectors
+
+    def __getattr__(self, name):
+        # tokenizer, max_seq_length, etc. come from the wrapped model
+        return getattr(self.model, name)
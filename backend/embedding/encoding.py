@@ -0,0 +1,47 @@
+import base64
+
+import numpy as np
+import orjson
+
+ENCODING_FORMATS = ("float", "base64")
+
+# Little-endian, as in the OpenAI embeddings API
+_BASE64_DTYPES = {
+    "float32": np.dtype("<f4"),
+    "float16": np.dtype("<f2"),
+}
+
+
+def validate_encoding(encoding_format: str, dtype: str):
+    """Raise `ValueError` for an unsupported `encoding_format` / `dtype` combination."""
+    if encoding_format not in ENCODING_FORMATS:
+        raise ValueError(f"Unsupported encoding_format '{encoding_format}', expected one of {', '.join(ENCODING_FORMATS)}")
+    if dtype not in _BASE64_DTYPES:
+        raise ValueError(f"Unsupported dtype '{dtype}', expected one of {', '.join(_BASE64_DTYPES)}")
+    if encoding_format == "float" and dtype != "float32":
+        raise ValueError("dtype is only supported with encoding_format 'base64'")
+
+
+def encode_embedding(vector, encoding_format: str = "float", dtype: str = "float32"):
+    """
+    Return `vector` in the representation requested by an /api/embed caller:
+    the float32 array itself for `float` (serialized by `embedding_response`)
+    or a base64 string of its little-endian `dtype` bytes for `base64`.
+    """
+    validate_encoding(encoding_format, dtype)
+    vector = np.asarray(vector).reshape(-1)
+    if encoding_format == "base64":
+        return base64.b64encode(vector.astype(_BASE64_DTYPES[dtype], copy=False).tobytes()).decode("ascii")
+    return np.ascontiguousarray(vector, dtype=np.float32)
+
+
+def embedding_response(embeddings: list) -> bytes:
+    """
+    Serialize an /api/embed response body with one entry per input, tagged
+    with its `index`. numpy arrays are written straight from their buffer
+    instead of going through a list of Python floats.
+    """
+    return orjson.dumps(
+        {"data": [{"index": i, "embedding": embedding} for i, embedding in enumerate(embeddings)]},
+        option=orjson.OPT_SERIALIZE_NUMPY
+    )
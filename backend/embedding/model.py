@@ -0,0 +1,107 @@
+import logging
+import os
+import re
+import threading
+import time
+from typing import Callable
+
+
+def _quantized_file_name(quantization_config: str) -> str:
+    # Matches the name sentence-transformers gives the exported file
+    return f"onnx/model_qint8_{quantization_config}.onnx"
+
+
+def embedding_model_id(model_name: str, backend: str = "torch", quantize: bool = False,
+                       quantization_config: str = "avx2") -> str:
+    """
+    Identifies the exact weights producing a vector. Cache entries are keyed
+    on it because ONNX and int8 outputs differ slightly from torch.
+    """
+    if backend == "torch":
+        return model_name
+    if quantize:
+        return f"{model_name}@onnx-qint8-{quantization_config}"
+    return f"{model_name}@onnx"
+
+
+def export_onnx_model(model_name: str, export_dir: str, quantize: bool = False,
+                      quantization_config: str = "avx2") -> str:
+    """
+    Export `model_name` to ONNX under `export_dir` (optionally with an int8
+    dynamically quantized copy) and return the ONNX file to load.
+    """
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    file_name = "onnx/model.onnx"
+    if not os.path.exists(os.path.join(export_dir, file_name)):
+        logging.info(f"Exporting embedding model {model_name} to ONNX in {export_dir}")
+        model = SentenceTransformer(model_name, backend="onnx")
+        model.save_pretrained(export_dir)
+    else:
+        model = SentenceTransformer(export_dir, backend="onnx", model_kwargs={"file_name": file_name})
+
+    if quantize:
+        file_name = _quantized_file_name(quantization_config)
+        if not os.path.exists(os.path.join(export_dir, file_name)):
+            logging.info(f"Quantizing ONNX embedding model for {quantization_config}")
+            export_dynamic_quantized_onnx_model(model, quantization_config, export_dir)
+
+    return file_name
+
+
+def load_embedding_model(model_name: str, backend: str = "torch", onnx_dir: str = ".onnx",
+                         quantize: bool = False, quantization_config: str = "avx2"):
+    """
+    Load the sentence-transformers embedding model on the requested backend:
+    `torch` (PyTorch) or `onnx` (ONNX Runtime, exported on first use and
+    reused from `onnx_dir` afterwards).
+    """
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "torch":
+        return SentenceTransformer(model_name)
+
+    if backend != "onnx":
+        raise ValueError(f"Unsupported embedding backend '{backend}'")
+
+    export_dir = os.path.join(onnx_dir, re.sub(r"[^A-Za-z0-9._-]+", "_", model_name))
+    file_name = export_onnx_model(model_name, export_dir, quantize, quantization_config)
+    return SentenceTransformer(export_dir, backend="onnx", model_kwargs={"file_name": file_name})
+
+
+class LazyEmbeddingModel:
+    """
+    Defers loading the embedding model (and importing torch /
+    sentence-transformers) until it is first used or `load()` is called,
+    typically from a warm-up task once the server is accepting connections.
+    """
+
+    def __init__(self, loader: Callable[[], object]):
+        self._loader = loader
+        self._model = None
+        self._lock = threading.Lock()
+        self.load_seconds = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def load(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    started = time.perf_counter()
+                    model = self._loader()
+                    self.load_seconds = time.perf_counter() - started
+                    logging.info(f"Embedding model loaded in {self.load_seconds:.1f}s")
+                    self._model = model
+        return self._model
+
+    def encode(self, sentences, **kwargs):
+        return self.load().encode(sentences, **kwargs)
+
+    def __getattr__(self, name):
+        # tokenizer, max_seq_length, etc. load the model on first access
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
@@ -0,0 +1,415 @@
+"""
+Embedding sidecar: a single process that owns the embedding model and serves
+every gunicorn worker over a local Unix domain socket.
+
+Run it with `python -m backend.embedding.sidecar`. gunicorn.conf.py and
+start.sh start it automatically when EMBEDDING_SIDECAR_SOCKET is set, under a
+`SidecarSupervisor` that restarts it if it exits
+(`python -m backend.embedding.sidecar --autostart`).
+
+Wire format, in both directions: an 8-byte header with the lengths of a JSON
+header and a binary payload, followed by both. Requests carry
+`{"texts": [...], "mode": "interactive" | "bulk"}`; responses carry
+`{"shape": [n, dim]}` plus the little-endian float32 matrix, or `{"error": ...}`.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from backend.embedding.batcher import MicroBatcher, EmbeddingQueueFullError
+
+_FRAME_HEADER = struct.Struct("!II")
+_VECTOR_DTYPE = np.dtype("<f4")
+
+
+def _pack_frame(header: dict, payload: bytes = b"") -> bytes:
+    header_bytes = json.dumps(header).encode("utf-8")
+    return _FRAME_HEADER.pack(len(header_bytes), len(payload)) + header_bytes + payload
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> Tuple[dict, bytes]:
+    header_len, payload_len = _FRAME_HEADER.unpack(await reader.readexactly(_FRAME_HEADER.size))
+    header = json.loads(await reader.readexactly(header_len))
+    payload = await reader.readexactly(payload_len) if payload_len else b""
+    return header, payload
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            raise ConnectionError("Embedding sidecar closed the connection")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def _read_frame_blocking(sock: socket.socket) -> Tuple[dict, bytes]:
+    header_len, payload_len = _FRAME_HEADER.unpack(_recv_exactly(sock, _FRAME_HEADER.size))
+    header = json.loads(_recv_exactly(sock, header_len))
+    payload = _recv_exactly(sock, payload_len) if payload_len else b""
+    return header, payload
+
+
+def _decode_vectors(header: dict, payload: bytes) -> np.ndarray:
+    if "error" in header:
+        if header.get("retry_after") is not None:
+            raise EmbeddingQueueFullError(header["retry_after"])
+        raise RuntimeError(f"Embedding sidecar error: {header['error']}")
+    return np.frombuffer(payload, dtype=_VECTOR_DTYPE).reshape(header["shape"])
+
+
+class EmbeddingSidecarServer:
+    """
+    Serves embeddings from one model instance. Interactive requests go through
+    a `MicroBatcher` so queries from all workers are batched together; bulk
+    (ingestion) requests are already batched and are encoded directly on a
+    separate thread so they never fill the interactive queue.
+    """
+
+    def __init__(
+        self,
+        model,
+        socket_path: str,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        max_queue_size: int = 256,
+        inference_threads: int = 1,
+        bulk_threads: int = 1,
+    ):
+        self.model = model
+        self.socket_path = socket_path
+        self._writers = set()
+        self.inference_executor = ThreadPoolExecutor(
+            max_workers=inference_threads, thread_name_prefix="sidecar-inference"
+        )
+        self.bulk_executor = ThreadPoolExecutor(
+            max_workers=bulk_threads, thread_name_prefix="sidecar-bulk"
+        )
+        self.batcher = MicroBatcher(
+            encode_fn=lambda texts: self.model.encode(texts),
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms,
+            executor=self.inference_executor,
+            max_queue_size=max_queue_size,
+        )
+
+    async def _embed(self, texts: List[str], mode: str) -> np.ndarray:
+        if mode == "bulk":
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.bulk_executor, self.model.encode, texts)
+        return np.stack(await self.batcher.embed_many(texts))
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._writers.add(writer)
+        try:
+            while True:
+                try:
+                    header, _ = await _read_frame(reader)
+                except asyncio.IncompleteReadError:
+                    break
+
+                if header.get("op") == "stats":
+                    cache = getattr(self.model, "cache", None)
+                    stats = {"batcher": self.batcher.stats(), "cache": cache.stats() if cache else None}
+                    writer.write(_pack_frame({"stats": stats}))
+                    await writer.drain()
+                    continue
+
+                try:
+                    vectors = np.ascontiguousarray(
+                        await self._embed(header["texts"], header.get("mode", "interactive")),
+                        dtype=_VECTOR_DTYPE,
+                    )
+                    frame = _pack_frame({"shape": list(vectors.shape)}, vectors.tobytes())
+                except EmbeddingQueueFullError as e:
+                    frame = _pack_frame({"error": str(e), "retry_after": e.retry_after})
+                except Exception as e:
+                    logging.exception("Embedding sidecar failed to encode request")
+                    frame = _pack_frame({"error": str(e)})
+                writer.write(frame)
+                await writer.drain()
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def serve_forever(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        server = await asyncio.start_unix_server(self._handle_connection, path=self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        logging.info(f"Embedding sidecar listening on {self.socket_path}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for writer in list(self._writers):
+                writer.close()
+            await self.batcher.aclose()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+
+class SidecarEmbeddingModel:
+    """
+    Client for `EmbeddingSidecarServer`.
+
+    `encode()` mirrors `SentenceTransformer.encode` for the ingestion code that
+    runs in worker threads (one blocking socket per thread), while `embed()` is
+    the awaitable used by request handlers (a small per-loop connection pool).
+    """
+
+    def __init__(self, socket_path: str, connect_timeout: float = 60.0, pool_size: int = 4):
+        self.socket_path = socket_path
+        self.connect_timeout = connect_timeout
+        self.pool_size = pool_size
+        self._local = threading.local()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    # -- blocking client (ingestion threads) ---------------------------------
+    def _blocking_socket(self) -> socket.socket:
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            return sock
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.socket_path)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                sock.close()
+                # The sidecar may still be loading the model
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.2)
+        self._local.sock = sock
+        return sock
+
+    def encode(self, sentences, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        frame = _pack_frame({"texts": texts, "mode": "bulk"})
+        for attempt in range(2):
+            sock = self._blocking_socket()
+            try:
+                sock.sendall(frame)
+                response = _read_frame_blocking(sock)
+                break
+            except OSError:
+                sock.close()
+                self._local.sock = None
+                # Retry once on a fresh connection in case the sidecar restarted
+                if attempt:
+                    raise
+        vectors = _decode_vectors(*response)
+        return vectors[0] if single else vectors
+
+    # -- async client (request handlers) -------------------------------------
+    async def _open_connection(self):
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            try:
+                return await asyncio.open_unix_connection(self.socket_path)
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.2)
+
+    async def _roundtrip(self, connection, header: dict) -> Tuple[dict, bytes]:
+        reader, writer = connection
+        try:
+            writer.write(_pack_frame(header))
+            await writer.drain()
+            response = await _read_frame(reader)
+        except BaseException:
+            writer.close()
+            raise
+        self._idle.append(connection)
+        return response
+
+    async def _request(self, header: dict) -> Tuple[dict, bytes]:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._idle = []
+            self._slots = asyncio.Semaphore(self.pool_size)
+
+        async with self._slots:
+            if self._idle:
+                try:
+                    return await self._roundtrip(self._idle.pop(), header)
+                except (asyncio.IncompleteReadError, ConnectionError) as e:
+                    # The pooled connection went stale (e.g. the sidecar restarted)
+                    logging.debug(f"Retrying embedding sidecar request on a new connection: {e}")
+            return await self._roundtrip(await self._open_connection(), header)
+
+    async def embed(self, text: str) -> np.ndarray:
+        return _decode_vectors(*await self._request({"texts": [text], "mode": "interactive"}))[0]
+
+    async def embed_many(self, texts: List[str]) -> List[np.ndarray]:
+        return list(_decode_vectors(*await self._request({"texts": list(texts), "mode": "interactive"})))
+
+    async def stats(self) -> dict:
+        header, _ = await self._request({"op": "stats"})
+        return header["stats"]
+
+    async def aclose(self):
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
+            await writer.wait_closed()
+
+
+class SidecarSupervisor:
+    """
+    Runs the sidecar as a child process and starts it again whenever it
+    exits, so a crash (e.g. running out of memory) does not leave every
+    worker without embeddings. Restarts wait `backoff_seconds`, doubling up
+    to `max_backoff_seconds` while the sidecar keeps failing; a sidecar that
+    stayed up for `stable_seconds` is restarted after the shortest delay.
+    The child is watched from a daemon thread, so `start()` returns at once.
+    """
+
+    def __init__(
+        self,
+        command: Optional[List[str]] = None,
+        cwd: Optional[str] = None,
+        backoff_seconds: float = 1.0,
+        max_backoff_seconds: float = 60.0,
+        stable_seconds: float = 60.0,
+    ):
+        self.command = command or [sys.executable, "-m", "backend.embedding.sidecar"]
+        self.cwd = cwd
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.stable_seconds = stable_seconds
+        self.restarts = 0
+        self._process: Optional[subprocess.Popen] = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._watch, name="embedding-sidecar-supervisor", daemon=True)
+        self._thread.start()
+
+    def _watch(self):
+        delay = self.backoff_seconds
+        while True:
+            with self._lock:
+                if self._stopping.is_set():
+                    return
+                started = time.monotonic()
+                self._process = subprocess.Popen(self.command, cwd=self.cwd)
+            status = self._process.wait()
+            if self._stopping.is_set():
+                return
+            if time.monotonic() - started >= self.stable_seconds:
+                delay = self.backoff_seconds
+            logging.error(f"Embedding sidecar exited with status {status}; restarting in {delay:.0f}s")
+            if self._stopping.wait(delay):
+                return
+            self.restarts += 1
+            delay = min(delay * 2, self.max_backoff_seconds)
+
+    def stop(self, timeout: float = 10.0):
+        """Stop restarting the sidecar and terminate it (killing it after `timeout` seconds)."""
+        with self._lock:
+            self._stopping.set()
+            process = self._process
+        if process is not None and process.poll() is None:
+            process.terminate()
+            try:
+                process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+
+
+def _supervise():
+    supervisor = SidecarSupervisor()
+    stopped = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stopped.set())
+    supervisor.start()
+    while not stopped.wait(1):
+        pass
+    supervisor.stop()
+
+
+def main():
+    from backend.embedding.cache import EmbeddingCache, CachedEmbeddingModel
+    from backend.embedding.model import load_embedding_model, embedding_model_id
+    from backend.settings import app_settings
+
+    parser = argparse.ArgumentParser(description="Serve embeddings to every worker over a Unix socket.")
+    parser.add_argument(
+        "--autostart",
+        action="store_true",
+        help="run the sidecar under a supervisor that restarts it, if EMBEDDING_SIDECAR_SOCKET is set and"
+        " EMBEDDING_SIDECAR_AUTOSTART is true; otherwise exit",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    settings = app_settings.embedding
+    if args.autostart:
+        if settings.sidecar_socket and settings.sidecar_autostart:
+            _supervise()
+        return
+    if not settings.sidecar_socket:
+        raise SystemExit("EMBEDDING_SIDECAR_SOCKET must be set to run the embedding sidecar")
+
+    model_name = app_settings.azure_openai.embedding_name
+    cache = EmbeddingCache(
+        embedding_model_id(
+            model_name,
+            backend=settings.backend,
+            quantize=settings.onnx_quantize,
+            quantization_config=settings.onnx_quantization_config,
+        ),
+        memory_entries=settings.cache_memory_entries,
+        disk_dir=settings.cache_dir,
+        disk_max_bytes=settings.cache_disk_max_mb * 1024 * 1024,
+    )
+    model = CachedEmbeddingModel(
+        load_embedding_model(
+            model_name,
+            backend=settings.backend,
+            onnx_dir=settings.onnx_dir,
+            quantize=settings.onnx_quantize,
+            quantization_config=settings.onnx_quantization_config,
+        ),
+        cache,
+    )
+    server = EmbeddingSidecarServer(
+        model,
+        settings.sidecar_socket,
+        max_batch_size=settings.batch_max_size,
+        max_wait_ms=settings.batch_max_wait_ms,
+        max_queue_size=settings.max_queue_size,
+        inference_threads=settings.inference_threads,
+    )
+    asyncio.run(server.serve_forever())
+
+
+if __name__ == "__main__":
+    main()
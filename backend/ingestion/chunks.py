@@ -0,0 +1,44 @@
+import hashlib
+from typing import Union
+
+# Blob metadata key holding the SHA-256 of an ingested file's content
+CONTENT_HASH_METADATA = "content_sha256"
+
+# Companion blobs listing the search document keys of each ingested file
+CHUNK_MANIFEST_PREFIX = "_chunks/"
+
+
+def content_hash(data: Union[bytes, str]) -> str:
+    """SHA-256 hex digest of `data` (text is hashed as UTF-8)."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_hash(path: str, block_size: int = 1024 * 1024) -> str:
+    """SHA-256 hex digest of a file, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(block_size):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id(organization: str, file_name: str, position, content: str) -> str:
+    """
+    Deterministic search document key for the chunk at `position` (a page
+    number or chunk index) of a file. Re-ingesting unchanged content yields
+    the same key, so retried jobs overwrite instead of duplicating and only
+    chunks whose content changed get new keys. Hex digits are valid in Azure
+    AI Search keys.
+    """
+    key = "\0".join((organization, file_name, str(position), content_hash(content)))
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def manifest_blob_name(blob_name: str) -> str:
+    return f"{CHUNK_MANIFEST_PREFIX}{blob_name}.json"
+
+
+def is_manifest_blob(blob_name: str) -> bool:
+    return blob_name.startswith(CHUNK_MANIFEST_PREFIX)
@@ -0,0 +1,161 @@
+import asyncio
+import itertools
+import logging
+from typing import AsyncIterator, Awaitable, Callable, Iterable, List, Optional
+
+# Sub-requests per Blob batch request (the service limit)
+BLOB_BATCH_SIZE = 256
+
+# Without a sortable key, how often and how long to wait for deleted keys to
+# disappear from the results before giving up
+STALE_QUERY_ATTEMPTS = 30
+STALE_QUERY_SECONDS = 1.0
+
+
+class BlobDeletionError(Exception):
+    """Raised by `delete_blobs` when some blobs could not be deleted."""
+
+    def __init__(self, failed: List[str]):
+        super().__init__(f"{len(failed)} blobs could not be deleted, e.g. {failed[0]}")
+        self.failed = failed
+
+
+def odata_string(value: str) -> str:
+    """Quote `value` as an OData string literal."""
+    return "'" + value.replace("'", "''") + "'"
+
+
+def document_filter(organization: Optional[str] = None, file_name: Optional[str] = None) -> Optional[str]:
+    """`$filter` matching the search documents of an organization, or of one of its files."""
+    clauses = []
+    if organization is not None:
+        clauses.append(f"organization eq {odata_string(organization)}")
+    if file_name is not None:
+        clauses.append(f"file eq {odata_string(file_name)}")
+    return " and ".join(clauses) or None
+
+
+async def iter_document_id_pages(
+    search_client,
+    filter: Optional[str] = None,
+    page_size: int = 1000,
+    before_requery: Optional[Callable[[], Awaitable]] = None,
+) -> AsyncIterator[List[str]]:
+    """
+    Yield the keys of the documents matching `filter` (`None` matches every
+    document), one page of at most `page_size` keys at a time.
+
+    Only the key field is retrieved. Pages are read in key order, each one
+    starting after the last key of the previous page rather than at an
+    offset, so deleting the documents of a page does not shift the next one
+    and there is no limit on the number of documents ($skip stops at
+    100,000). This needs a key field that is both sortable and filterable.
+
+    If the index rejects a key-ordered query (HTTP 400), on the first page
+    or a later one, the remaining pages are read without ordering; keys
+    already yielded are not yielded again. A consumer that deletes the documents passes `before_requery`, an
+    async callable that finishes deleting the keys yielded so far: the
+    filter is then queried again from the start until it matches nothing,
+    and keys still returned while the index catches up are not yielded
+    again. Otherwise pages are read by offset, up to the $skip limit.
+    """
+    last_key = None
+    yielded = set()
+    while True:
+        clauses = [clause for clause in (filter, last_key and f"id gt {odata_string(last_key)}") if clause]
+        try:
+            results = await search_client.search(
+                search_text="*",
+                filter=" and ".join(f"({clause})" for clause in clauses) or None,
+                select=["id"],
+                order_by=["id asc"],
+                top=page_size,
+            )
+            keys = [doc["id"] async for doc in results]
+        except Exception as e:
+            if _status_code(e) != 400:
+                raise
+            logging.warning(
+                f"Cannot page search documents in key order ({e}); make the key field sortable and filterable"
+            )
+            async for keys in _iter_unordered_id_pages(search_client, filter, page_size, before_requery, yielded):
+                yield keys
+            return
+        if keys:
+            yielded.update(keys)
+            yield keys
+        if len(keys) < page_size:
+            return
+        last_key = keys[-1]
+
+
+async def _iter_unordered_id_pages(search_client, filter, page_size, before_requery, yielded) -> AsyncIterator[List[str]]:
+    async def query(skip: int) -> List[str]:
+        results = await search_client.search(search_text="*", filter=filter, select=["id"], skip=skip, top=page_size)
+        return [doc["id"] async for doc in results]
+
+    if before_requery is None:
+        skip = 0
+        while True:
+            found = await query(skip)
+            keys = [key for key in found if key not in yielded]
+            if keys:
+                yield keys
+            if len(found) < page_size:
+                return
+            skip += len(found)
+
+    stale_queries = 0
+    while True:
+        await before_requery()
+        found = await query(0)
+        if not found:
+            return
+        keys = [key for key in found if key not in yielded]
+        if keys:
+            stale_queries = 0
+            yielded.update(keys)
+            yield keys
+            continue
+        # Only deleted keys: wait for the index to catch up
+        stale_queries += 1
+        if stale_queries > STALE_QUERY_ATTEMPTS:
+            raise RuntimeError(f"{len(found)} deleted search documents are still returned by the index")
+        await asyncio.sleep(STALE_QUERY_SECONDS)
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    return getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+
+
+async def delete_blobs(container_client, names: Iterable[str], batch_size: int = BLOB_BATCH_SIZE, on_batch=None) -> int:
+    """
+    Delete the blobs `names` of an async `ContainerClient` with the Blob
+    batch API, `batch_size` blobs per request, and return how many were
+    deleted. Blobs that no longer exist are skipped; other failures are
+    logged, and raised as a `BlobDeletionError` once every batch was sent.
+    `on_batch(deleted)` is awaited after each request with the running
+    total.
+    """
+    deleted = 0
+    failed = []
+    names = iter(names)
+    while batch := list(itertools.islice(names, batch_size)):
+        responses = await container_client.delete_blobs(*batch, raise_on_any_failure=False)
+        async for name, response in _zip_async(batch, responses):
+            if 200 <= response.status_code < 300:
+                deleted += 1
+            elif response.status_code != 404:
+                logging.error(f"Failed to delete blob {name}: HTTP {response.status_code} {response.reason}")
+                failed.append(name)
+        if on_batch is not None:
+            await on_batch(deleted)
+    if failed:
+        raise BlobDeletionError(failed)
+    return deleted
+
+
+async def _zip_async(names: List[str], responses):
+    names = iter(names)
+    async for response in responses:
+        yield next(names, None), response
@@ -0,0 +1,96 @@
+import gzip
+import json
+import logging
+import os
+import tempfile
+import threading
+from typing import Optional
+
+
+class ExtractionCache:
+    """
+    Text extracted from documents, keyed by the document's content hash plus
+    the extractor's name and version, so re-indexing an unchanged corpus
+    (e.g. after changing the embedding model or the chunking) skips
+    extraction entirely. Bumping the version invalidates old entries.
+
+    Entries are gzip-compressed JSON, stored under `directory` or, if
+    `container_client` (a sync `azure.storage.blob.ContainerClient`) is
+    given, as blobs under `prefix` in that container. Failures to read or
+    write an entry are logged and treated as misses.
+    """
+
+    def __init__(self, directory: Optional[str] = ".extraction_cache", container_client=None, prefix: str = ""):
+        self.directory = directory
+        self.container_client = container_client
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    @staticmethod
+    def key(digest: str, extractor: str, version: str) -> str:
+        return f"{extractor}/{version}/{digest}.json.gz"
+
+    def _read(self, key: str) -> Optional[bytes]:
+        if self.container_client is not None:
+            from azure.core.exceptions import ResourceNotFoundError
+
+            try:
+                return self.container_client.download_blob(self.prefix + key).readall()
+            except ResourceNotFoundError:
+                return None
+        try:
+            with open(os.path.join(self.directory, key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write(self, key: str, data: bytes):
+        if self.container_client is not None:
+            self.container_client.upload_blob(self.prefix + key, data, overwrite=True)
+            return
+        path = os.path.join(self.directory, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so concurrent readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def get(self, digest: str, extractor: str, version: str) -> Optional[dict]:
+        try:
+            data = self._read(self.key(digest, extractor, version))
+            entry = json.loads(gzip.decompress(data)) if data is not None else None
+        except Exception:
+            logging.exception(f"Failed to read extraction cache entry {digest}")
+            entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def put(self, digest: str, extractor: str, version: str, entry: dict):
+        try:
+            self._write(self.key(digest, extractor, version), gzip.compress(json.dumps(entry).encode("utf-8")))
+        except Exception:
+            logging.exception(f"Failed to write extraction cache entry {digest}")
+            return
+        with self._lock:
+            self.writes += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": "blob" if self.container_client is not None else "directory",
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+            }
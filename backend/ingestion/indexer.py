@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+import orjson
+
+# Azure AI Search accepts at most 1000 documents and 16 MB per indexing request
+MAX_BATCH_DOCUMENTS = 1000
+MAX_BATCH_BYTES = 16 * 1024 * 1024
+
+# Per-document statuses worth retrying (version conflict, index busy, throttled)
+_RETRIABLE_DOCUMENT_STATUSES = {409, 422, 429, 503}
+_THROTTLE_STATUSES = {429, 503}
+
+
+class IndexingError(Exception):
+    """Raised by `SearchIndexer.flush` when some documents could not be indexed."""
+
+    def __init__(self, failed: Dict[str, str]):
+        super().__init__(f"{len(failed)} documents failed to index, e.g. {next(iter(failed.items()))}")
+        self.failed = failed
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    return getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    for name in ("retry-after-ms", "x-ms-retry-after-ms"):
+        if headers.get(name):
+            return float(headers[name]) / 1000
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class SearchIndexer:
+    """
+    Uploads documents to Azure AI Search in batches sized by serialized
+    payload bytes and document count, with several batches in flight.
+
+    Concurrency adapts additively-increase / multiplicatively-decrease: each
+    throttled response (429/503) halves the number of batches in flight and
+    pauses all senders for the advertised Retry-After (or an exponential
+    backoff), and each successful batch lets one more batch run, up to
+    `max_concurrency`. Only the documents reported as failed are retried.
+
+    `upload_fn` is an async callable returning one result per document
+    (objects with `key`, `succeeded`, `status_code` and `error_message`, as
+    returned by `SearchClient.upload_documents`). If given, `on_indexed` is
+    awaited with the documents of each batch that the service accepted, e.g.
+    to checkpoint progress. An exception from `on_indexed` (such as a lost
+    job lease) stops indexing: batches still in flight are cancelled and it
+    is raised from the next `add` or `flush`.
+    """
+
+    def __init__(
+        self,
+        upload_fn: Callable[[List[dict]], Awaitable[list]],
+        max_batch_documents: int = MAX_BATCH_DOCUMENTS,
+        max_batch_bytes: int = MAX_BATCH_BYTES - 1024 * 1024,
+        max_concurrency: int = 4,
+        max_retries: int = 5,
+        backoff_seconds: float = 1.0,
+        key_field: str = "id",
+        on_indexed: Optional[Callable[[List[dict]], Awaitable[None]]] = None,
+    ):
+        self.upload_fn = upload_fn
+        self.max_batch_documents = min(max_batch_documents, MAX_BATCH_DOCUMENTS)
+        self.max_batch_bytes = min(max_batch_bytes, MAX_BATCH_BYTES)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.key_field = key_field
+        self.on_indexed = on_indexed
+
+        self._limit = max_concurrency
+        self._active = 0
+        self._slots: Optional[asyncio.Condition] = None
+        self._resume_at = 0.0
+        self._tasks: List[asyncio.Task] = []
+        self._buffer: List[dict] = []
+        self._buffer_bytes = 0
+        self._failed: Dict[str, str] = {}
+        self.stats = {"succeeded": 0, "failed": 0, "batches": 0, "retried": 0, "throttled": 0}
+
+    # -- batching ------------------------------------------------------------
+    async def add(self, documents: Iterable[dict]):
+        """Buffer documents, sending every full batch (waits while the window is full)."""
+        for document in documents:
+            size = len(orjson.dumps(document))
+            if self._buffer and (
+                len(self._buffer) >= self.max_batch_documents or self._buffer_bytes + size > self.max_batch_bytes
+            ):
+                await self._dispatch()
+            self._buffer.append(document)
+            self._buffer_bytes += size
+
+    async def flush(self) -> dict:
+        """Send the remaining documents, wait for every batch and return the counters."""
+        if self._buffer:
+            await self._dispatch()
+        tasks, self._tasks = self._tasks, []
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            await self._cancel(tasks)
+            raise
+        if self._failed:
+            failed, self._failed = self._failed, {}
+            raise IndexingError(failed)
+        return dict(self.stats, concurrency=self._limit)
+
+    async def _dispatch(self):
+        await self._raise_task_errors()
+        batch, self._buffer, self._buffer_bytes = self._buffer, [], 0
+        if self._slots is None:
+            self._slots = asyncio.Condition()
+        async with self._slots:
+            await self._slots.wait_for(lambda: self._active < self._limit)
+            self._active += 1
+        self._tasks.append(asyncio.ensure_future(self._run(batch)))
+
+    async def _raise_task_errors(self):
+        """Raise the error of a finished batch, cancelling the others."""
+        for task in self._tasks:
+            if task.done() and not task.cancelled() and task.exception() is not None:
+                tasks, self._tasks = self._tasks, []
+                await self._cancel(tasks)
+                raise task.exception()
+
+    @staticmethod
+    async def _cancel(tasks: List[asyncio.Task]):
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, batch: List[dict]):
+        try:
+            await self._send(batch)
+        finally:
+            async with self._slots:
+                self._active -= 1
+                self._slots.notify_all()
+
+    # -- sending -------------------------------------------------------------
+    def _backoff(self, attempt: int) -> float:
+        return self.backoff_seconds * 2 ** attempt
+
+    def _throttle(self, delay: float):
+        self.stats["throttled"] += 1
+        self._limit = max(1, self._limit // 2)
+        self._resume_at = max(self._resume_at, time.monotonic() + delay)
+        logging.warning(f"Search indexing throttled; pausing {delay:.1f}s with {self._limit} batches in flight")
+
+    async def _send(self, batch: List[dict]):
+        pending = batch
+        for attempt in range(self.max_retries + 1):
+            delay = self._resume_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            self.stats["batches"] += 1
+            try:
+                results = await self.upload_fn(pending)
+            except Exception as e:
+                status = _status_code(e)
+                if status == 413 and len(pending) > 1:
+                    # Larger than the service accepts after all; split it
+                    middle = len(pending) // 2
+                    await self._send(pending[:middle])
+                    await self._send(pending[middle:])
+                    return
+                if status in _THROTTLE_STATUSES:
+                    self._throttle(_retry_after(e) or self._backoff(attempt))
+                elif attempt == self.max_retries or (status is not None and status < 500 and status != 408):
+                    self._fail(pending, str(e))
+                    return
+                else:
+                    await asyncio.sleep(self._backoff(attempt))
+                self.stats["retried"] += len(pending)
+                continue
+
+            by_key = {document[self.key_field]: document for document in pending}
+            retry = []
+            succeeded = []
+            throttled = False
+            for result in results:
+                if result.succeeded:
+                    self.stats["succeeded"] += 1
+                    succeeded.append(by_key[result.key])
+                elif result.status_code in _RETRIABLE_DOCUMENT_STATUSES and attempt < self.max_retries:
+                    retry.append(by_key[result.key])
+                    throttled = throttled or result.status_code in _THROTTLE_STATUSES
+                else:
+                    self._fail([by_key[result.key]], result.error_message or f"status {result.status_code}")
+            if succeeded and self.on_indexed is not None:
+                await self.on_indexed(succeeded)
+
+            if not retry:
+                self._limit = min(self.max_concurrency, self._limit + 1)
+                return
+            if throttled:
+                self._throttle(self._backoff(attempt))
+            else:
+                await asyncio.sleep(self._backoff(attempt))
+            self.stats["retried"] += len(retry)
+            pending = retry
+
+        self._fail(pending, "retries exhausted")
+
+    def _fail(self, documents: List[dict], error: str):
+        self.stats["failed"] += len(documents)
+        for document in documents:
+            self._failed[document[self.key_field]] = error
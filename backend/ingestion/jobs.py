@@ -0,0 +1,372 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import socket
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_chunks (
+    job_id TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    chunk_id TEXT NOT NULL,
+    page INTEGER,
+    PRIMARY KEY (job_id, file_name, chunk_id)
+);
+CREATE TABLE IF NOT EXISTS job_progress (
+    job_id TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    progress TEXT NOT NULL,
+    PRIMARY KEY (job_id, file_name)
+);
+"""
+
+FINISHED_STATUSES = ("completed", "failed")
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    payload: dict
+    status: str
+    attempts: int
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    updated_at: float = 0.0
+    lease_owner: Optional[str] = None
+
+
+class LeaseLostError(Exception):
+    """Raised when a worker writes to a job whose lease it no longer holds."""
+
+
+def _job(row: sqlite3.Row) -> Job:
+    return Job(
+        id=row["id"],
+        kind=row["kind"],
+        payload=json.loads(row["payload"]),
+        status=row["status"],
+        attempts=row["attempts"],
+        result=json.loads(row["result"]) if row["result"] else None,
+        error=row["error"],
+        updated_at=row["updated_at"],
+        lease_owner=row["lease_owner"],
+    )
+
+
+class JobStore:
+    """
+    Ingestion jobs in a SQLite database shared by every worker process, with
+    each job's uploaded files kept under `spool_dir/<job id>/`.
+
+    A worker claims a job by taking a lease on it and renews the lease while
+    it runs. A job whose lease runs out (its worker died or was recycled) is
+    claimed again by the next worker, up to `max_attempts` times. Finished
+    jobs and their files are removed once they are `ttl_seconds` old.
+
+    While a file is ingested, the chunks the search service has accepted are
+    checkpointed, so a resumed job neither extracts nor embeds them again.
+    """
+
+    def __init__(self, path: str, spool_dir: str, lease_seconds: float = 300, max_attempts: int = 3):
+        self.path = path
+        self.spool_dir = spool_dir
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        os.makedirs(spool_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def job_dir(self, job_id: str) -> str:
+        return os.path.join(self.spool_dir, job_id)
+
+    def create(self, job_id: str, kind: str, payload: dict):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, payload, status, created_at, updated_at) VALUES (?, ?, ?, 'queued', ?, ?)",
+                (job_id, kind, json.dumps(payload), now, now),
+            )
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _job(row) if row else None
+
+    def claim(self, owner: str) -> Optional[Job]:
+        """Lease the oldest queued (or abandoned) job to `owner`, if any."""
+        while True:
+            now = time.time()
+            with self._transaction() as conn:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' OR (status = 'processing' AND lease_expires < ?) "
+                    "ORDER BY created_at LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is None:
+                    return None
+                if row["attempts"] < self.max_attempts:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'processing', attempts = attempts + 1, lease_owner = ?, "
+                        "lease_expires = ?, updated_at = ? WHERE id = ?",
+                        (owner, now + self.lease_seconds, now, row["id"]),
+                    )
+                    return _job(conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone())
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, lease_owner = NULL, updated_at = ? WHERE id = ?",
+                    (f"Abandoned after {row['attempts']} attempts", now, row["id"]),
+                )
+            logging.warning(f"Ingestion job {row['id']} abandoned after {row['attempts']} attempts")
+            self._remove_files(row["id"])
+
+    def renew(self, job_id: str, owner: str) -> bool:
+        """Extend the lease; False if `owner` no longer holds it."""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? "
+                "WHERE id = ? AND lease_owner = ? AND status = 'processing'",
+                (now + self.lease_seconds, now, job_id, owner),
+            )
+        return cursor.rowcount == 1
+
+    def holds_lease(self, job_id: str, owner: str) -> bool:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT 1 FROM jobs WHERE id = ? AND lease_owner = ? AND status = 'processing'", (job_id, owner)
+            ).fetchone()
+        return row is not None
+
+    def ensure_lease(self, job_id: str, owner: str):
+        """Raise `LeaseLostError` unless `owner` still holds the lease on the job."""
+        if not self.holds_lease(job_id, owner):
+            raise LeaseLostError(f"Lost the lease on ingestion job {job_id}")
+
+    def release(self, job_id: str, owner: str):
+        """Put a job back in the queue without counting the attempt (e.g. on shutdown)."""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = MAX(attempts - 1, 0), lease_owner = NULL, "
+                "updated_at = ? WHERE id = ? AND lease_owner = ? AND status = 'processing'",
+                (time.time(), job_id, owner),
+            )
+
+    def finish(self, job_id: str, owner: str, status: str, result: dict = None, error: str = None) -> bool:
+        """Record the outcome of a job and delete its files; False if the lease was lost."""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, lease_owner = NULL, updated_at = ? "
+                "WHERE id = ? AND lease_owner = ? AND status = 'processing'",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id, owner),
+            )
+        if cursor.rowcount != 1:
+            return False
+        self._remove_files(job_id)
+        return True
+
+    def purge(self, ttl_seconds: float) -> List[str]:
+        """Delete finished jobs older than `ttl_seconds` and return their ids."""
+        cutoff = time.time() - ttl_seconds
+        with self._transaction() as conn:
+            job_ids = [
+                row["id"] for row in conn.execute(
+                    "SELECT id FROM jobs WHERE status IN (?, ?) AND updated_at < ?", (*FINISHED_STATUSES, cutoff)
+                )
+            ]
+            for table, column in (("jobs", "id"), ("job_chunks", "job_id"), ("job_progress", "job_id")):
+                conn.executemany(f"DELETE FROM {table} WHERE {column} = ?", [(job_id,) for job_id in job_ids])
+        for job_id in job_ids:
+            self._remove_files(job_id)
+        return job_ids
+
+    def checkpoint(self, job_id: str, file_name: str, chunks: List[tuple], progress: dict = None, owner: str = None):
+        """
+        Record indexed `(chunk_id, page)` pairs of a file, and optionally its
+        progress counters. Given `owner`, raise `LeaseLostError` instead if it
+        no longer holds the lease on the job.
+        """
+        with self._transaction() as conn:
+            if owner is not None and conn.execute(
+                "SELECT 1 FROM jobs WHERE id = ? AND lease_owner = ? AND status = 'processing'", (job_id, owner)
+            ).fetchone() is None:
+                raise LeaseLostError(f"Lost the lease on ingestion job {job_id}")
+            conn.executemany(
+                "INSERT OR IGNORE INTO job_chunks (job_id, file_name, chunk_id, page) VALUES (?, ?, ?, ?)",
+                [(job_id, file_name, chunk_id, page) for chunk_id, page in chunks],
+            )
+            if progress is not None:
+                conn.execute(
+                    "INSERT OR REPLACE INTO job_progress (job_id, file_name, progress) VALUES (?, ?, ?)",
+                    (job_id, file_name, json.dumps(progress)),
+                )
+
+    def checkpointed_chunks(self, job_id: str, file_name: str) -> Dict[str, Optional[int]]:
+        """Chunk ids already indexed for a file of the job, mapped to their page."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT chunk_id, page FROM job_chunks WHERE job_id = ? AND file_name = ?", (job_id, file_name)
+            ).fetchall()
+        return {row["chunk_id"]: row["page"] for row in rows}
+
+    def progress(self, job_id: str) -> Dict[str, dict]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT file_name, progress FROM job_progress WHERE job_id = ?", (job_id,)).fetchall()
+        return {row["file_name"]: json.loads(row["progress"]) for row in rows}
+
+    def _remove_files(self, job_id: str):
+        shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+
+
+class JobWorkerPool:
+    """
+    A fixed number of workers that claim jobs from a `JobStore` and run
+    `handler(job)` on the current event loop. The store is accessed on
+    `executor` so that SQLite never blocks the loop.
+
+    A handler whose lease is lost (the job was claimed again by another
+    worker) is cancelled; handlers pass `job.lease_owner` to the store's
+    writes so that none lands after the lease is gone.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        handler: Callable[[Job], Awaitable[dict]],
+        workers: int = 1,
+        poll_seconds: float = 1.0,
+        ttl_seconds: float = 86400,
+        cleanup_seconds: float = 3600,
+        executor=None,
+    ):
+        self.store = store
+        self.handler = handler
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.ttl_seconds = ttl_seconds
+        self.cleanup_seconds = cleanup_seconds
+        self.executor = executor
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._task: Optional[asyncio.Task] = None
+
+    async def _call(self, fn, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, lambda: fn(*args, **kwargs))
+
+    async def run(self):
+        """Run the workers and the TTL cleanup until cancelled (see `stop`)."""
+        self._task = asyncio.current_task()
+        tasks = [asyncio.ensure_future(self._work(f"{self.owner}/{n}")) for n in range(self.workers)]
+        tasks.append(asyncio.ensure_future(self._cleanup()))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _work(self, owner: str):
+        while True:
+            try:
+                job = await self._call(self.store.claim, owner)
+            except sqlite3.Error:
+                logging.exception("Failed to claim an ingestion job")
+                job = None
+            if job is None:
+                await asyncio.sleep(self.poll_seconds)
+                continue
+            await self._process(job, owner)
+
+    async def _process(self, job: Job, owner: str):
+        logging.info(f"Ingestion job {job.id} started (attempt {job.attempts})")
+        task = asyncio.ensure_future(self.handler(job))
+        lease_lost = asyncio.Event()
+        heartbeat = asyncio.ensure_future(self._heartbeat(job, owner, task, lease_lost))
+        try:
+            result = await task
+        except asyncio.CancelledError:
+            if lease_lost.is_set() and not asyncio.current_task().cancelling():
+                # Cancelled by the heartbeat: the job now belongs to another worker
+                return
+            # Shutting down: let another worker pick the job up right away. This
+            # runs inline because the pool's tasks may be cancelled again
+            self.store.release(job.id, owner)
+            raise
+        except LeaseLostError:
+            logging.warning(f"Ingestion job {job.id} stopped after its lease was lost")
+        except Exception as e:
+            logging.exception(f"Ingestion job {job.id} failed")
+            await self._call(self.store.finish, job.id, owner, "failed", error=str(e))
+        else:
+            if not await self._call(self.store.finish, job.id, owner, "completed", result=result):
+                logging.warning(f"Ingestion job {job.id} finished after its lease was lost")
+        finally:
+            heartbeat.cancel()
+
+    async def _heartbeat(self, job: Job, owner: str, task: asyncio.Future, lease_lost: asyncio.Event):
+        while True:
+            await asyncio.sleep(self.store.lease_seconds / 3)
+            try:
+                if not await self._call(self.store.renew, job.id, owner):
+                    logging.warning(f"Lost the lease on ingestion job {job.id}; cancelling it")
+                    lease_lost.set()
+                    task.cancel()
+                    return
+            except sqlite3.Error:
+                logging.exception(f"Failed to renew the lease on ingestion job {job.id}")
+
+    async def _cleanup(self):
+        while True:
+            try:
+                purged = await self._call(self.store.purge, self.ttl_seconds)
+                if purged:
+                    logging.info(f"Purged {len(purged)} expired ingestion jobs")
+            except sqlite3.Error:
+                logging.exception("Failed to purge expired ingestion jobs")
+            await asyncio.sleep(self.cleanup_seconds)
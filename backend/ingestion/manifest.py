@@ -0,0 +1,232 @@
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    blob_path TEXT PRIMARY KEY,
+    organization TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    content_hash TEXT,
+    chunk_ids TEXT NOT NULL,
+    chunk_count INTEGER NOT NULL,
+    page_count INTEGER,
+    byte_size INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS documents_by_organization ON documents (organization, blob_path);
+CREATE INDEX IF NOT EXISTS documents_by_file_name ON documents (file_name);
+CREATE TABLE IF NOT EXISTS sync (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    synced_at REAL NOT NULL
+);
+"""
+
+
+@dataclass
+class DocumentRecord:
+    organization: str
+    file_name: str
+    blob_path: str
+    content_hash: Optional[str]
+    chunk_ids: List[str] = field(default_factory=list)
+    page_count: Optional[int] = None
+    byte_size: int = 0
+    updated_at: float = 0.0
+
+
+def _record(row: sqlite3.Row) -> DocumentRecord:
+    return DocumentRecord(
+        organization=row["organization"],
+        file_name=row["file_name"],
+        blob_path=row["blob_path"],
+        content_hash=row["content_hash"],
+        chunk_ids=json.loads(row["chunk_ids"]),
+        page_count=row["page_count"],
+        byte_size=row["byte_size"],
+        updated_at=row["updated_at"],
+    )
+
+
+class DocumentManifest:
+    """
+    The ingested files in a SQLite database: for every blob, its
+    organization and file name, content hash, search document keys, page
+    count and size. Ingestion records each file once it is committed, so
+    listing and looking up files, and per-organization stats, are queries
+    here instead of container listings or index scans.
+
+    Blob Storage and the search index stay the source of truth: the app
+    falls back to them for files missing here, and `replace`, `add_missing`
+    and `prune` bring the manifest in line with them (see
+    `reconcile_manifest` in app.py). SQLite in WAL mode needs a local
+    filesystem, so each instance keeps its own manifest; `synced_at` tells
+    how recently it was compared with Blob Storage as a whole.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    @staticmethod
+    def _insert(conn, record: DocumentRecord, replace: bool = True):
+        conn.execute(
+            f"INSERT OR {'REPLACE' if replace else 'IGNORE'} INTO documents (blob_path, organization, file_name, content_hash, chunk_ids,"
+            " chunk_count, page_count, byte_size, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                record.blob_path, record.organization, record.file_name, record.content_hash,
+                json.dumps(list(record.chunk_ids)), len(record.chunk_ids), record.page_count,
+                record.byte_size, record.updated_at or time.time(),
+            ),
+        )
+
+    def put(self, record: DocumentRecord):
+        with self._connect() as conn:
+            self._insert(conn, record)
+
+    def get(self, blob_path: str) -> Optional[DocumentRecord]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM documents WHERE blob_path = ?", (blob_path,)).fetchone()
+        return _record(row) if row else None
+
+    def find(self, file_name: str) -> Optional[DocumentRecord]:
+        """The first file (by blob path) named `file_name` in any organization."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM documents WHERE file_name = ? ORDER BY blob_path LIMIT 1", (file_name,)
+            ).fetchone()
+        return _record(row) if row else None
+
+    def records(self, organization: str = None) -> List[DocumentRecord]:
+        """The files of `organization`, or every file, by blob path."""
+        with self._connect() as conn:
+            if organization is None:
+                rows = conn.execute("SELECT * FROM documents ORDER BY blob_path").fetchall()
+            else:
+                rows = conn.execute(
+                    "SELECT * FROM documents WHERE organization = ? ORDER BY blob_path", (organization,)
+                ).fetchall()
+        return [_record(row) for row in rows]
+
+    def blob_paths(self, organization: str = None) -> List[str]:
+        """Blob paths of the files of `organization`, or of every file, in order."""
+        with self._connect() as conn:
+            if organization is None:
+                rows = conn.execute("SELECT blob_path FROM documents ORDER BY blob_path").fetchall()
+            else:
+                rows = conn.execute(
+                    "SELECT blob_path FROM documents WHERE organization = ? ORDER BY blob_path", (organization,)
+                ).fetchall()
+        return [row["blob_path"] for row in rows]
+
+    def remove(self, blob_paths: Iterable[str]) -> List[DocumentRecord]:
+        """Remove files from the manifest and return the records that were removed."""
+        removed = []
+        with self._transaction() as conn:
+            for blob_path in blob_paths:
+                row = conn.execute("SELECT * FROM documents WHERE blob_path = ?", (blob_path,)).fetchone()
+                if row:
+                    conn.execute("DELETE FROM documents WHERE blob_path = ?", (blob_path,))
+                    removed.append(_record(row))
+        return removed
+
+    def stats(self, organization: str = None) -> Dict[str, dict]:
+        """Files, bytes, chunks and pages per organization."""
+        query = (
+            "SELECT organization, COUNT(*) AS files, SUM(byte_size) AS bytes, SUM(chunk_count) AS chunks,"
+            " SUM(page_count) AS pages, MAX(updated_at) AS updated_at FROM documents"
+        )
+        with self._connect() as conn:
+            if organization is None:
+                rows = conn.execute(f"{query} GROUP BY organization ORDER BY organization").fetchall()
+            else:
+                rows = conn.execute(f"{query} WHERE organization = ? GROUP BY organization", (organization,)).fetchall()
+        return {
+            row["organization"]: {
+                "files": row["files"],
+                "bytes": row["bytes"],
+                "chunks": row["chunks"],
+                "pages": row["pages"] or 0,
+                "updated_at": row["updated_at"],
+            }
+            for row in rows
+        }
+
+    def replace(self, records: Iterable[DocumentRecord], organization: str = None):
+        """
+        Replace the files of `organization` (the whole manifest if None) with
+        `records` in one transaction.
+        """
+        with self._transaction() as conn:
+            if organization is None:
+                conn.execute("DELETE FROM documents")
+            else:
+                conn.execute("DELETE FROM documents WHERE organization = ?", (organization,))
+            for record in records:
+                self._insert(conn, record)
+
+    def add_missing(self, records: Iterable[DocumentRecord]):
+        """Add the `records` whose blob is not in the manifest yet, keeping the others as they are."""
+        with self._transaction() as conn:
+            for record in records:
+                self._insert(conn, record, replace=False)
+
+    def prune(self, blob_paths: Iterable[str], before: float, organization: str = None) -> List[str]:
+        """
+        Remove the files of `organization` (of every organization if None)
+        whose blob path is not in `blob_paths`, and return their paths. Only
+        files recorded before `before` are removed, so that files ingested
+        while `blob_paths` was being listed are kept.
+        """
+        existing = set(blob_paths)
+        with self._transaction() as conn:
+            if organization is None:
+                rows = conn.execute("SELECT blob_path FROM documents WHERE updated_at < ?", (before,)).fetchall()
+            else:
+                rows = conn.execute(
+                    "SELECT blob_path FROM documents WHERE organization = ? AND updated_at < ?", (organization, before)
+                ).fetchall()
+            stale = [row["blob_path"] for row in rows if row["blob_path"] not in existing]
+            conn.executemany("DELETE FROM documents WHERE blob_path = ?", [(blob_path,) for blob_path in stale])
+        return stale
+
+    def mark_synced(self, synced_at: float = None):
+        """Record that the whole manifest was compared with Blob Storage at `synced_at` (now if None)."""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sync (id, synced_at) VALUES (0, ?)",
+                (time.time() if synced_at is None else synced_at,),
+            )
+
+    def synced_at(self) -> Optional[float]:
+        """When the manifest was last compared with Blob Storage, or None if it never was."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT synced_at FROM sync WHERE id = 0").fetchone()
+        return row["synced_at"] if row else None
@@ -0,0 +1,121 @@
+from concurrent.futures import Executor
+from typing import Callable, Collection, Iterator, List, Union
+
+from backend.ingestion.scheduler import map_in_order
+
+# Name and version of the extractor in the extraction cache; bump the version
+# whenever the extracted text changes
+PDF_EXTRACTOR = "pymupdf-text"
+PDF_EXTRACTOR_VERSION = "1"
+
+
+def _page(page_number: int, text: str, file_name: str, total_pages: int) -> dict:
+    return {
+        "page_number": page_number,
+        "text": text,
+        "markdown": f"## {file_name} - Page {page_number}\n\n{text}\n",
+        "total_pages": total_pages,
+    }
+
+
+def _markdown_page(page, file_name: str, total_pages: int) -> dict:
+    return _page(page.number + 1, page.get_text("text"), file_name, total_pages)
+
+
+def iter_pdf_pages(pdf: Union[str, bytes], file_name: str, skip_pages: Collection[int] = ()) -> Iterator[dict]:
+    """
+    Yield one markdown page at a time, so callers never hold the whole
+    document's text. `pdf` is a file path (opened by PyMuPDF without reading
+    it into memory) or the document's bytes. Pages numbered in `skip_pages`
+    are not extracted.
+    """
+    import fitz
+
+    with (fitz.open(pdf, filetype="pdf") if isinstance(pdf, str) else fitz.open(stream=pdf, filetype="pdf")) as doc:
+        total_pages = doc.page_count
+        for page in doc:
+            if page.number + 1 in skip_pages:
+                continue
+            yield _markdown_page(page, file_name, total_pages)
+
+
+def extract_page_range(path: str, file_name: str, start: int, stop: int, skip_pages: Collection[int] = ()) -> List[dict]:
+    """Extract pages `start + 1` to `stop` of the PDF at `path`; runs in a worker process."""
+    import fitz
+
+    with fitz.open(path, filetype="pdf") as doc:
+        return [
+            _markdown_page(doc.load_page(number), file_name, doc.page_count)
+            for number in range(start, stop)
+            if number + 1 not in skip_pages
+        ]
+
+
+def iter_pdf_pages_parallel(
+    path: str,
+    file_name: str,
+    executor: Executor,
+    processes: int,
+    pages_per_range: int = 50,
+    min_pages: int = 200,
+    skip_pages: Collection[int] = (),
+) -> Iterator[dict]:
+    """
+    Like `iter_pdf_pages`, but documents of at least `min_pages` pages are
+    split into ranges of `pages_per_range` pages extracted on `executor` (a
+    process pool of `processes` workers, each opening the file by path).
+    Pages are yielded in order, as soon as their range is done; at most two
+    ranges per process are extracted ahead of the consumer.
+    """
+    import fitz
+
+    with fitz.open(path, filetype="pdf") as doc:
+        total_pages = doc.page_count
+    if total_pages < min_pages:
+        yield from iter_pdf_pages(path, file_name, skip_pages)
+        return
+
+    ranges = (
+        (path, file_name, start, min(start + pages_per_range, total_pages),
+         frozenset(page for page in skip_pages if start < page <= start + pages_per_range))
+        for start in range(0, total_pages, pages_per_range)
+    )
+    for pages in map_in_order(executor, extract_page_range, ranges, max_in_flight=2 * processes):
+        yield from pages
+
+
+def pdf_extractor_version() -> str:
+    import fitz
+
+    return f"{PDF_EXTRACTOR_VERSION}-{fitz.VersionBind}"
+
+
+def iter_cached_pdf_pages(
+    extract: Callable[[], Iterator[dict]],
+    file_name: str,
+    cache,
+    digest: str,
+    version: str,
+    skip_pages: Collection[int] = (),
+) -> Iterator[dict]:
+    """
+    Yield the pages of the PDF with content hash `digest` from `cache` (an
+    `ExtractionCache`) if it holds them for extractor `version`, else from
+    `extract()`. A complete extraction is stored in the cache once the last
+    page has been yielded.
+    """
+    entry = cache.get(digest, PDF_EXTRACTOR, version)
+    if entry is not None:
+        texts = entry["pages"]
+        for number, text in enumerate(texts, 1):
+            if number not in skip_pages:
+                yield _page(number, text, file_name, len(texts))
+        return
+
+    texts = []
+    for page in extract():
+        texts.append(page["text"])
+        yield page
+    # Pages skipped by the caller were not extracted, so there is nothing complete to store
+    if not skip_pages:
+        cache.put(digest, PDF_EXTRACTOR, version, {"pages": texts})
@@ -0,0 +1,107 @@
+import asyncio
+import itertools
+import logging
+import time
+from typing import Callable, Iterable, Iterator, List, Sequence
+
+import numpy as np
+
+_DONE = object()
+
+
+def _take(iterator: Iterator, count: int) -> list:
+    return list(itertools.islice(iterator, count))
+
+
+class IngestionPipeline:
+    """
+    Streams items through extract -> embed -> index stages connected by
+    bounded queues, so uploading early chunks overlaps with embedding later
+    ones and at most `queue_size` batches wait between two stages.
+
+    Extraction (advancing the item iterator) and `encode_fn` run on
+    `executor`; the index stage hands documents to `indexer` (a
+    `SearchIndexer`), which batches and uploads them. If any stage fails the
+    others are cancelled and the error is raised from `run`.
+    """
+
+    def __init__(
+        self,
+        encode_fn: Callable[[List[str]], np.ndarray],
+        indexer,
+        executor=None,
+        queue_size: int = 4,
+        embed_batch_size: int = 64,
+        name: str = "",
+    ):
+        self.encode_fn = encode_fn
+        self.indexer = indexer
+        self.executor = executor
+        self.queue_size = queue_size
+        self.embed_batch_size = embed_batch_size
+        self.name = name
+        self.stats = {
+            "extracted": 0,
+            "embedded": 0,
+            "indexed": 0,
+            "extract_seconds": 0.0,
+            "embed_seconds": 0.0,
+            "index_seconds": 0.0,
+        }
+
+    async def _blocking(self, stage: str, fn, *args):
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.stats[f"{stage}_seconds"] += time.perf_counter() - started
+
+    async def _extract(self, items: Iterable[dict], out: asyncio.Queue):
+        iterator = iter(items)
+        while True:
+            batch = await self._blocking("extract", _take, iterator, self.embed_batch_size)
+            if not batch:
+                break
+            self.stats["extracted"] += len(batch)
+            await out.put(batch)
+        await out.put(_DONE)
+
+    async def _embed(self, to_document: Callable[[dict, np.ndarray], dict], inbox: asyncio.Queue, out: asyncio.Queue):
+        while (batch := await inbox.get()) is not _DONE:
+            vectors = await self._blocking("embed", self.encode_fn, [item["content"] for item in batch])
+            self.stats["embedded"] += len(batch)
+            logging.info(f"{self.name}: embedded {self.stats['embedded']} chunks")
+            await out.put([to_document(item, vector) for item, vector in zip(batch, vectors)])
+        await out.put(_DONE)
+
+    async def _index(self, inbox: asyncio.Queue):
+        while (documents := await inbox.get()) is not _DONE:
+            started = time.perf_counter()
+            await self.indexer.add(documents)
+            self.stats["index_seconds"] += time.perf_counter() - started
+        started = time.perf_counter()
+        result = await self.indexer.flush()
+        self.stats["index_seconds"] += time.perf_counter() - started
+        self.stats["indexed"] = result["succeeded"]
+
+    async def run(self, items: Iterable[dict], to_document: Callable[[dict, np.ndarray], dict]) -> dict:
+        """
+        Embed and index `items` (dicts with a "content" key, typically a lazy
+        generator) and return the stage counters. `to_document(item, vector)`
+        builds the search document for each item.
+        """
+        extracted: asyncio.Queue = asyncio.Queue(self.queue_size)
+        embedded: asyncio.Queue = asyncio.Queue(self.queue_size)
+        tasks: Sequence[asyncio.Task] = [
+            asyncio.ensure_future(self._extract(items, extracted)),
+            asyncio.ensure_future(self._embed(to_document, extracted, embedded)),
+            asyncio.ensure_future(self._index(embedded)),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        return self.stats
@@ -0,0 +1,160 @@
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import Executor, Future
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Deque, Iterable, Iterator, List, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+@dataclass(eq=False)
+class _Waiter:
+    cpu: int
+    memory: int
+    loop: asyncio.AbstractEventLoop
+    future: asyncio.Future
+    granted: bool = False
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class ResourceBudget:
+    """
+    Process-wide CPU slots and memory bytes shared by every ingestion job.
+
+    The budget is guarded by a thread lock and waiters are woken on their
+    own loop, so it can be shared by jobs on any event loop or thread.
+    Requests are granted in arrival order; a request larger than the whole
+    budget is clamped so that it can still run on its own.
+    """
+
+    def __init__(self, cpu_slots: int, memory_bytes: int):
+        self.cpu_slots = cpu_slots
+        self.memory_bytes = memory_bytes
+        self._cpu_free = cpu_slots
+        self._memory_free = memory_bytes
+        self._lock = threading.Lock()
+        self._waiters: Deque[_Waiter] = deque()
+
+    def _fits(self, cpu: int, memory: int) -> bool:
+        return cpu <= self._cpu_free and memory <= self._memory_free
+
+    def _grant_waiters(self):
+        while self._waiters and self._fits(self._waiters[0].cpu, self._waiters[0].memory):
+            waiter = self._waiters.popleft()
+            try:
+                waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+            except RuntimeError:
+                continue  # the waiter's loop is closed
+            waiter.granted = True
+            self._cpu_free -= waiter.cpu
+            self._memory_free -= waiter.memory
+
+    async def acquire(self, cpu: int = 1, memory: int = 0):
+        cpu, memory = min(cpu, self.cpu_slots), min(memory, self.memory_bytes)
+        with self._lock:
+            if not self._waiters and self._fits(cpu, memory):
+                self._cpu_free -= cpu
+                self._memory_free -= memory
+                return cpu, memory
+            waiter = _Waiter(cpu, memory, asyncio.get_running_loop(), asyncio.get_running_loop().create_future())
+            self._waiters.append(waiter)
+        try:
+            await waiter.future
+        except BaseException:
+            with self._lock:
+                if waiter.granted:
+                    self._cpu_free += cpu
+                    self._memory_free += memory
+                else:
+                    self._waiters.remove(waiter)
+                self._grant_waiters()
+            raise
+        return cpu, memory
+
+    def release(self, cpu: int, memory: int):
+        with self._lock:
+            self._cpu_free += cpu
+            self._memory_free += memory
+            self._grant_waiters()
+
+    @asynccontextmanager
+    async def reserve(self, cpu: int = 1, memory: int = 0):
+        granted = await self.acquire(cpu, memory)
+        try:
+            yield
+        finally:
+            self.release(*granted)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "cpu_slots": self.cpu_slots,
+                "cpu_in_use": self.cpu_slots - self._cpu_free,
+                "memory_bytes": self.memory_bytes,
+                "memory_in_use": self.memory_bytes - self._memory_free,
+                "waiting": len(self._waiters),
+            }
+
+
+async def run_concurrently(
+    items: Sequence[T],
+    process: Callable[[T], Awaitable[R]],
+    concurrency: int,
+    budget: ResourceBudget = None,
+    memory_of: Callable[[T], int] = lambda item: 0,
+) -> List[R]:
+    """
+    Run `process` over `items` with at most `concurrency` running at once
+    (and, if given, within `budget`: one CPU slot plus `memory_of(item)`
+    bytes each). Results are returned in the order of `items`; the first
+    exception cancels the remaining work and is raised.
+    """
+    slots = asyncio.Semaphore(concurrency)
+
+    async def run_one(item: T) -> R:
+        async with slots:
+            if budget is None:
+                return await process(item)
+            async with budget.reserve(cpu=1, memory=memory_of(item)):
+                return await process(item)
+
+    tasks = [asyncio.ensure_future(run_one(item)) for item in items]
+    try:
+        return list(await asyncio.gather(*tasks))
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+def map_in_order(executor: Executor, fn: Callable[..., R], args: Iterable[Tuple], max_in_flight: int) -> Iterator[R]:
+    """
+    Yield `fn(*a)` for each `a` in `args`, computed on `executor` with at
+    most `max_in_flight` calls submitted at once, in the order of `args`.
+    Results are yielded as soon as they and all earlier ones are ready;
+    calls not yet started are cancelled if the consumer stops early.
+    """
+    args = iter(args)
+    pending: Deque[Future] = deque()
+    try:
+        for call in args:
+            pending.append(executor.submit(fn, *call))
+            if len(pending) >= max_in_flight:
+                break
+        while pending:
+            result = pending.popleft().result()
+            call = next(args, None)
+            if call is not None:
+                pending.append(executor.submit(fn, *call))
+            yield result
+    finally:
+        for future in pending:
+            future.cancel()
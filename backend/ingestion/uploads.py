@@ -0,0 +1,26 @@
+from tempfile import SpooledTemporaryFile
+from typing import Optional, Type
+
+from quart import Request
+from quart.formparser import FormDataParser
+
+
+def spooled_request_class(memory_threshold: int, directory: Optional[str] = None) -> Type[Request]:
+    """
+    Build a Quart request class whose multipart file parts are streamed into
+    temporary files, kept in memory only up to `memory_threshold` bytes each
+    and otherwise written to `directory`.
+    """
+
+    def stream_factory(total_content_length, content_type, filename, content_length=None):
+        return SpooledTemporaryFile(max_size=memory_threshold, mode="rb+", dir=directory)
+
+    class SpooledFormDataParser(FormDataParser):
+        def __init__(self, *args, **kwargs):
+            kwargs.setdefault("stream_factory", stream_factory)
+            super().__init__(*args, **kwargs)
+
+    class SpooledRequest(Request):
+        form_data_parser_class = SpooledFormDataParser
+
+    return SpooledRequest
@@ -0,0 +1,193 @@
+import re
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterator, Optional, Tuple
+from xml.parsers import expat
+from xml.sax.saxutils import quoteattr
+
+# XML parsers the converters accept; lxml is optional and must be installed separately
+XML_PARSERS = ("etree", "lxml")
+
+
+def _lxml_options() -> dict:
+    # Like ElementTree, drop comments and processing instructions, so the
+    # text around them is merged and converts to the same markdown
+    return {"remove_comments": True, "remove_pis": True}
+
+
+def parse_xml(source: bytes, parser: str = "etree"):
+    """Parse a standalone XML document with ElementTree or lxml."""
+    if parser == "lxml":
+        from lxml import etree
+
+        return etree.fromstring(source, etree.XMLParser(**_lxml_options()))
+    if parser != "etree":
+        raise ValueError(f"Unsupported XML parser '{parser}'")
+    return ET.fromstring(source)
+
+
+def iter_xml_documents(xml_file, parser: str = "etree") -> Iterator[Tuple[Optional[str], ET.Element]]:
+    """
+    Incrementally parse an XML export (a path or binary file object) and
+    yield `(folder_id, document)` for each top-level `<document>` as soon as
+    its closing tag is read. Top-level documents are those directly inside a
+    `<folder>` or the root element, or the root itself; `folder_id` is the
+    id of the innermost enclosing folder that has one.
+
+    Each document is cleared and detached from the tree once the consumer
+    asks for the next one, and so is each folder once it closes, so memory
+    use depends on the size of one document, not of the file. Consumers must
+    not keep references to yielded elements. `parser` is "etree" or "lxml".
+    """
+    if parser == "lxml":
+        from lxml import etree
+
+        events = etree.iterparse(xml_file, events=("start", "end"), **_lxml_options())
+    elif parser == "etree":
+        events = ET.iterparse(xml_file, events=("start", "end"))
+    else:
+        raise ValueError(f"Unsupported XML parser '{parser}'")
+
+    folder_ids = []  # ids of the open folders, inherited from the parent when missing
+    open_elements = []
+    try:
+        for event, elem in events:
+            if event == "start":
+                if elem.tag == "folder":
+                    folder_ids.append(elem.attrib.get("id", folder_ids[-1] if folder_ids else None))
+                open_elements.append(elem)
+                continue
+
+            open_elements.pop()
+            parent = open_elements[-1] if open_elements else None
+            if _is_top_level_document(elem.tag, parent.tag if parent is not None else None, len(open_elements)):
+                yield (folder_ids[-1] if folder_ids else None), elem
+            elif elem.tag == "folder":
+                folder_ids.pop()
+            else:
+                continue
+
+            elem.clear()
+            if parent is not None:
+                parent.remove(elem)
+    except SyntaxError as e:
+        # ElementTree's ParseError and lxml's XMLSyntaxError
+        raise ValueError(f"Failed to parse XML data: {e}")
+
+
+def _is_top_level_document(tag: str, parent_tag: Optional[str], depth: int) -> bool:
+    return tag == "document" and (
+        parent_tag is None
+        or parent_tag == "folder"
+        or (depth == 1 and parent_tag != "document")
+    )
+
+
+def iter_xml_document_sources(xml_file, block_size: int = 1024 * 1024) -> Iterator[Tuple[Optional[str], bytes]]:
+    """
+    Like `iter_xml_documents`, but yield the source bytes of each top-level
+    `<document>` (a standalone XML document) instead of the parsed element.
+
+    The file is scanned with expat in blocks of `block_size` bytes without
+    building a tree, and each document is sliced out of the input at the
+    byte offsets of its start and end tags. This is several times cheaper
+    than serializing a parsed subtree, so the documents can be handed to
+    other processes for conversion. Only the bytes of the open top-level
+    document and one block are kept in memory.
+
+    What a document inherits from outside its own bytes is carried into its
+    slice, so that it parses on its own as it does in the whole file: the
+    namespace declarations of its ancestors, added to its start tag, and
+    the file's document type declaration (with its internal subset, e.g.
+    entity definitions), repeated before it.
+    """
+    parser = expat.ParserCreate()
+    folder_ids = []  # ids of the open folders, inherited from the parent when missing
+    open_tags = []  # (tag, start offset if it is a top-level document, namespaces declared by its ancestors)
+    namespaces = []  # xmlns declarations in scope in each open element
+    finished = []  # (folder_id, start, end offset, inherited namespaces) of documents closed by the last block
+    last_event = [0]  # offset of the last tag seen; later tags may still be incomplete in the buffer
+    declaration = [b""]
+    encoding = ["utf-8"]
+    doctype = [None, b""]  # offset of the document type declaration, then its bytes
+
+    def xml_declaration(version, file_encoding, standalone):
+        # Slices are in the file's encoding; repeat it if it is not UTF-8
+        if file_encoding and file_encoding.lower().replace("_", "-") not in ("utf-8", "utf8"):
+            declaration[0] = f'<?xml version="1.0" encoding="{file_encoding}"?>'.encode("ascii")
+            encoding[0] = file_encoding
+
+    def start_doctype(name, system_id, public_id, has_internal_subset):
+        doctype[0] = parser.CurrentByteIndex
+
+    def start_element(tag, attrs):
+        parent_tag = open_tags[-1][0] if open_tags else None
+        if tag == "folder":
+            folder_ids.append(attrs.get("id", folder_ids[-1] if folder_ids else None))
+        top_level = _is_top_level_document(tag, parent_tag, len(open_tags))
+        last_event[0] = parser.CurrentByteIndex
+        if not open_tags and doctype[0] is not None:
+            # The prolog is still buffered (nothing is trimmed before the root
+            # element); expat reports a position inside the declaration
+            doctype_start = buffer.rindex(b"<!DOCTYPE", 0, doctype[0] - offset + 1)
+            doctype[1] = bytes(buffer[doctype_start:last_event[0] - offset])
+
+        inherited = namespaces[-1] if namespaces else {}
+        declared = {name: value for name, value in attrs.items() if name == "xmlns" or name.startswith("xmlns:")}
+        namespaces.append({**inherited, **declared} if declared else inherited)
+        open_tags.append((
+            tag,
+            last_event[0] if top_level else None,
+            {name: value for name, value in inherited.items() if name not in declared} if top_level else None,
+        ))
+
+    def end_element(tag):
+        tag, start, inherited = open_tags.pop()
+        namespaces.pop()
+        last_event[0] = parser.CurrentByteIndex
+        if start is not None:
+            finished.append((folder_ids[-1] if folder_ids else None, start, last_event[0], inherited))
+        elif tag == "folder":
+            folder_ids.pop()
+
+    parser.XmlDeclHandler = xml_declaration
+    parser.StartDoctypeDeclHandler = start_doctype
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+
+    f = open(xml_file, "rb") if isinstance(xml_file, str) else xml_file
+    buffer = bytearray()
+    offset = 0  # offset of buffer[0] in the file
+    try:
+        while True:
+            block = f.read(block_size)
+            buffer += block
+            parser.Parse(block, not block)
+
+            for folder_id, start, end, inherited in finished:
+                # Expat reports the end tag's position, or the position after
+                # an empty-element tag `<document ... />`
+                if re.match(rb"</document[\s>]", buffer[end - offset:end - offset + 11]):
+                    end = buffer.index(b">", end - offset) + offset + 1
+                source = bytes(buffer[start - offset:end - offset])
+                if inherited:
+                    source = _declare_namespaces(source, inherited, encoding[0])
+                yield folder_id, declaration[0] + doctype[1] + source
+            finished.clear()
+
+            if not block:
+                break
+            keep = min((start for _, start, _ in open_tags if start is not None), default=last_event[0])
+            del buffer[:keep - offset]
+            offset = keep
+    except expat.ExpatError as e:
+        raise ValueError(f"Failed to parse XML data: {e}")
+    finally:
+        if f is not xml_file:
+            f.close()
+
+
+def _declare_namespaces(source: bytes, namespaces: Dict[str, str], encoding: str) -> bytes:
+    """Add xmlns attributes to the start tag of a `<document>` slice."""
+    attributes = "".join(f" {name}={quoteattr(uri)}" for name, uri in namespaces.items())
+    tag_end = len(b"<document")
+    return source[:tag_end] + attributes.encode(encoding, "xmlcharrefreplace") + source[tag_end:]
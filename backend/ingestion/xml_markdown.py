@@ -0,0 +1,236 @@
+import itertools
+import xml.etree.ElementTree as ET
+from concurrent.futures import Executor
+from typing import Iterator, List, Optional, Tuple
+
+from backend.ingestion.scheduler import map_in_order
+from backend.ingestion.xml_documents import iter_xml_document_sources, iter_xml_documents, parse_xml
+
+
+# How inline tags are rendered: wrapped as `prefix + content + suffix`, or
+# by one of the special cases below. Unknown inline tags (e.g. <span>) keep
+# only their content.
+_CODE, _IMG, _BR, _LINK = range(4)
+_NO_WRAPPER = ("", "")
+_INLINE = {
+    "strong": ("**", "**"),
+    "b": ("**", "**"),
+    "em": ("*", "*"),
+    "i": ("*", "*"),
+    "code": _CODE,
+    "img": _IMG,
+    "br": _BR,
+    "a": _LINK,
+}
+_HEADINGS = {f"h{n}": "#" * n for n in range(1, 7)}
+_LISTS = frozenset(("list", "ul", "ol"))
+
+
+def inline_to_md(elem) -> str:
+    """
+    Convert an element and its children to inline Markdown, handling
+    <strong>, <em>, <code>, <a>, <img>, <br>, <span>, and other inline tags.
+    The content of every nested tag is stripped of surrounding whitespace.
+
+    The subtree is walked once with an explicit stack, which only grows for
+    children that have children themselves; elements without children (most
+    paragraphs and table cells) take a shortcut.
+    """
+    if not len(elem):
+        return (elem.text or "").strip()
+
+    # One frame per open element: its parts, its remaining children, how to
+    # wrap its content once they are done, and the element itself
+    stack = [([elem.text] if elem.text else [], iter(elem), _NO_WRAPPER, elem)]
+    while True:
+        parts, children, wrap, parent = stack[-1]
+        for child in children:
+            kind = _INLINE.get(child.tag.lower(), _NO_WRAPPER)
+            if kind is _CODE:
+                parts.append(f"`{(child.text or '').strip()}`")
+            elif kind is _IMG:
+                src = child.attrib.get("href", child.attrib.get("src", "")).strip()
+                alt = child.attrib.get("alt", child.attrib.get("id", "")).strip()
+                parts.append(f"![{alt}]({src})")
+            elif kind is _BR:
+                parts.append("  \n")  # Markdown line break
+            else:
+                if kind is _LINK:
+                    kind = ("[", f"]({child.attrib.get('href', '').strip()})")
+                if len(child):
+                    # Continue with this child's children; its tail follows them
+                    stack.append(([child.text] if child.text else [], iter(child), kind, child))
+                    break
+                parts.append(f"{kind[0]}{(child.text or '').strip()}{kind[1]}")
+
+            # Tail text after this child
+            if child.tail:
+                parts.append(child.tail)
+        else:
+            stack.pop()
+            text = "".join(parts).strip()
+            if not stack:
+                return text
+            outer = stack[-1][0]
+            outer.append(f"{wrap[0]}{text}{wrap[1]}")
+            if parent.tail:
+                outer.append(parent.tail)
+
+
+def _row_cells(row) -> List[str]:
+    # Plain-text cells skip the call to inline_to_md
+    return [
+        inline_to_md(cell) if len(cell) else (cell.text or "").strip()
+        for cell in row if cell.tag == "entry"
+    ]
+
+
+def elem_to_markdown(elem, level: int = 0) -> List[str]:
+    """
+    Convert XML element tree to Markdown lines, handling headings,
+    paragraphs (including code blocks), lists, tables, images, footnotes.
+
+    The tree is walked once, iteratively: each frame on the stack holds the
+    remaining elements at one depth, or the remaining items of a list.
+    """
+    md_lines: List[str] = []
+    # (remaining elements, list nesting level, None or whether the elements
+    # are the <li> items of an ordered list)
+    stack = [(iter((elem,)), level, None)]
+    while stack:
+        elements, level, ordered = stack[-1]
+        elem = next(elements, None)
+        if elem is None:
+            stack.pop()
+            continue
+
+        # --- List items ---
+        if ordered is not None:
+            p_child = next((child for child in elem if child.tag == "p"), None)
+            content = inline_to_md(p_child) if p_child is not None else inline_to_md(elem)
+            prefix = f"{'  ' * level}{(str(elem.attrib.get('value')) + '.') if ordered else '-'} "
+            md_lines.append(f"{prefix}{content}")
+            # Nested lists
+            nested = [sub for sub in elem if sub.tag.lower() in _LISTS]
+            if nested:
+                stack.append((iter(nested), level + 1, None))
+            continue
+
+        tag = elem.tag.lower()
+
+        # --- Headings ---
+        if tag in _HEADINGS:
+            md_lines.append(f"{_HEADINGS[tag]} {inline_to_md(elem)}")
+
+        # --- Paragraphs & Code Blocks ---
+        elif tag == "p":
+            if elem.attrib.get("class", "").lower() == "code":
+                md_lines.append("```")
+                md_lines.extend((elem.text or "").splitlines())
+                md_lines.append("```")
+            else:
+                text = inline_to_md(elem)
+                if text:
+                    md_lines.append(text)
+
+        # --- Lists ---
+        elif tag in _LISTS:
+            is_ordered = elem.attrib.get("type", "bullet") != "bullet" or tag == "ol"
+            stack.append((iter([li for li in elem if li.tag == "li"]), level, is_ordered))
+
+        # --- Tables ---
+        elif tag == "table":
+            # The rows are in the first <tgroup>, if it has any children
+            tgroup = next((child for child in elem if child.tag == "tgroup"), None)
+            rows = [row for row in (tgroup if tgroup is not None and len(tgroup) else elem) if row.tag == "row"]
+            if rows:
+                headers = _row_cells(rows[0])
+                md_lines.append(f"| {' | '.join(headers)} |")
+                md_lines.append(f"| {' | '.join(['---'] * len(headers))} |")
+                md_lines.extend([f"| {' | '.join(_row_cells(row))} |" for row in rows[1:]])
+
+        # --- Footnotes ---
+        elif tag == "footnote":
+            foot = "".join(elem.itertext()).strip()
+            if foot:
+                md_lines.append(f"> **Footnote:** {foot}")
+
+        # --- Fallback: walk the children ---
+        else:
+            stack.append((iter(elem), level, None))
+
+    return md_lines
+
+
+def chunk_text(text: str, chunk_size: int = 5_000) -> List[str]:
+    """Split text into ~chunk_size chars while respecting code blocks & sentences."""
+    chunks, start, length = [], 0, len(text)
+    while start < length:
+        end = min(start + chunk_size, length)
+        segment = text[start:end]
+
+        # try to cut nicely
+        cut = max(
+            segment.rfind('```'),        # code block fence
+            segment.rfind('\n\n'),       # paragraph
+            segment.rfind('. '),         # sentence end
+        )
+        if cut != -1 and cut > chunk_size * 0.3:
+            end = start + cut + (0 if cut == segment.rfind('```') else 1)
+
+        chunks.append(text[start:end].strip())
+        start = end
+    return [c for c in chunks if c]
+
+
+def document_chunks(document: ET.Element) -> Tuple[str, str, List[str]]:
+    """Return the id, title and markdown chunks of an export's `<document>`."""
+    doc_id = document.attrib.get("id", "")
+    title = document.findtext("naam", "").strip() or "(untitled)"
+    body_section = document.find("document/section")
+    markdown = "\n\n".join(elem_to_markdown(body_section)) if body_section is not None else ""
+    return doc_id, title, chunk_text(markdown)
+
+
+def convert_documents(
+    documents: List[Tuple[Optional[str], bytes]],
+    parser: str = "etree",
+) -> List[Tuple[Optional[str], str, str, List[str]]]:
+    """
+    Convert the sources of `<document>` elements, each with its folder id,
+    to `(folder_id, doc_id, title, chunks)`; runs in a worker process.
+    """
+    return [(folder_id, *document_chunks(parse_xml(source, parser))) for folder_id, source in documents]
+
+
+def iter_xml_document_chunks(
+    xml_file,
+    executor: Optional[Executor] = None,
+    processes: int = 1,
+    documents_per_task: int = 64,
+    parser: str = "etree",
+) -> Iterator[Tuple[Optional[str], str, str, List[str]]]:
+    """
+    Yield `(folder_id, doc_id, title, chunks)` for each top-level document
+    of an XML export, in document order.
+
+    Without `executor` the documents are converted as they are parsed.
+    Otherwise the export is only scanned for the byte ranges of its
+    documents, and batches of `documents_per_task` document sources are
+    parsed and converted on `executor`, a process pool of `processes`
+    workers, so the conversion is not limited by the GIL. At most two
+    batches per process are converted ahead of the consumer. Documents are
+    parsed with `parser`, "etree" (ElementTree) or "lxml".
+    """
+    if executor is None:
+        for folder_id, document in iter_xml_documents(xml_file, parser):
+            yield (folder_id, *document_chunks(document))
+        return
+
+    def batches():
+        documents = iter_xml_document_sources(xml_file)
+        while batch := list(itertools.islice(documents, documents_per_task)):
+            yield batch, parser
+
+    for converted in map_in_order(executor, convert_documents, batches(), max_in_flight=2 * processes):
+        yield from converted
@@ -197,6 +197,81 @@ class _AzureOpenAISettings(BaseSettings):
             return None
     
 
+class _EmbeddingSettings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_prefix="EMBEDDING_",
+        env_file=DOTENV_PATH,
+        extra="ignore",
+        env_ignore_empty=True
+    )
+
+    batch_max_size: conint(ge=1) = 32
+    batch_max_wait_ms: confloat(ge=0) = 5.0
+    max_queue_size: conint(ge=1) = 256
+    max_inputs: conint(ge=1) = 2048
+    inference_threads: conint(ge=1) = 1
+    sidecar_socket: Optional[str] = None
+    sidecar_autostart: bool = True
+    sidecar_connect_timeout: confloat(gt=0) = 60.0
+    cache_memory_entries: conint(ge=0) = 10000
+    cache_dir: Optional[str] = None
+    cache_disk_max_mb: conint(ge=1) = 1024
+    backend: Literal["torch", "onnx"] = "torch"
+    onnx_dir: str = ".onnx"
+    onnx_quantize: bool = False
+    onnx_quantization_config: Literal["arm64", "avx2", "avx512", "avx512_vnni"] = "avx2"
+    ingestion_batch_size: conint(ge=1) = 64
+    ingestion_max_batch_tokens: conint(ge=1) = 16384
+    ingestion_target_batch_seconds: confloat(gt=0) = 2.0
+
+
+def _worker_cpu_share() -> int:
+    """
+    CPUs per web worker process. Every gunicorn worker has its own ingestion
+    budget and process pools; gunicorn.conf.py exports the number of workers
+    as WEB_CONCURRENCY.
+    """
+    return max(1, (os.cpu_count() or 1) // int(os.environ.get("WEB_CONCURRENCY") or 1))
+
+
+class _IngestionSettings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_prefix="INGESTION_",
+        env_file=DOTENV_PATH,
+        extra="ignore",
+        env_ignore_empty=True
+    )
+
+    queue_size: conint(ge=1) = 4
+    index_batch_size: conint(ge=1, le=1000) = 1000
+    index_max_batch_mb: confloat(gt=0, le=16) = 15
+    index_max_concurrency: conint(ge=1) = 4
+    index_max_retries: conint(ge=0) = 5
+    file_concurrency: conint(ge=1) = 4
+    cpu_slots: conint(ge=1) = Field(default_factory=_worker_cpu_share)
+    memory_budget_mb: conint(ge=1) = 2048
+    job_db: str = ".ingestion/jobs.sqlite3"
+    manifest_db: str = ".ingestion/manifest.sqlite3"
+    manifest_reconcile_on_start: bool = True
+    manifest_sync_seconds: conint(ge=0) = 300
+    job_spool_dir: str = ".ingestion/uploads"
+    job_workers: conint(ge=1) = 1
+    job_lease_seconds: conint(ge=10) = 300
+    job_max_attempts: conint(ge=1) = 3
+    job_ttl_seconds: conint(ge=60) = 86400
+    job_poll_seconds: confloat(gt=0) = 1.0
+    upload_memory_threshold_kb: conint(ge=0) = 1024
+    pdf_processes: conint(ge=1) = Field(default_factory=_worker_cpu_share)
+    pdf_parallel_min_pages: conint(ge=1) = 200
+    pdf_pages_per_range: conint(ge=1) = 50
+    xml_processes: conint(ge=0) = Field(default_factory=_worker_cpu_share)
+    xml_documents_per_task: conint(ge=1) = 64
+    xml_parser: Literal["etree", "lxml"] = "etree"
+    extraction_cache: bool = True
+    extraction_cache_dir: str = ".extraction_cache"
+    extraction_cache_container: Optional[str] = None
+
+
 class _SearchCommonSettings(BaseSettings):
     model_config = SettingsConfigDict(
         env_prefix="SEARCH_",
@@ -763,6 +838,8 @@ class _AppSettings(BaseModel):
     azure_openai: _AzureOpenAISettings = _AzureOpenAISettings()
     search: _SearchCommonSettings = _SearchCommonSettings()
     ui: Optional[_UiSettings] = _UiSettings()
+    embedding: _EmbeddingSettings = _EmbeddingSettings()
+    ingestion: _IngestionSettings = _IngestionSettings()
     
     # Constructed properties
     chat_history: Optional[_ChatHistorySettings] = None
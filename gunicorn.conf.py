@@ -1,4 +1,5 @@
 import multiprocessing
+import os
 
 max_requests = 1000
 max_requests_jitter = 50
@@ -9,5 +10,32 @@ timeout = 230
 # https://learn.microsoft.com/en-us/troubleshoot/azure/app-service/web-apps-performance-faqs#why-does-my-request-time-out-after-230-seconds
 
 num_cpus = multiprocessing.cpu_count()
-workers = (num_cpus * 2) + 1
+workers = int(os.environ.get("WEB_CONCURRENCY") or (num_cpus * 2) + 1)
+# Each worker sizes its ingestion CPU slots and process pools to its share of
+# the CPUs (see INGESTION_CPU_SLOTS in the README)
+os.environ["WEB_CONCURRENCY"] = str(workers)
 worker_class = "uvicorn.workers.UvicornWorker"
+
+# Optional embedding sidecar: one process holds the embedding model and every
+# worker talks to it over a Unix socket instead of loading its own copy. The
+# settings come from the environment or .env, as in the app; the sidecar is
+# restarted whenever it exits.
+embedding_sidecar = None
+
+
+def on_starting(server):
+    global embedding_sidecar
+    from backend.embedding.sidecar import SidecarSupervisor
+    from backend.settings import app_settings
+
+    settings = app_settings.embedding
+    if settings.sidecar_socket and settings.sidecar_autostart:
+        server.log.info(f"Starting embedding sidecar on {settings.sidecar_socket}")
+        embedding_sidecar = SidecarSupervisor(cwd=os.path.dirname(os.path.abspath(__file__)))
+        embedding_sidecar.start()
+
+
+def on_exit(server):
+    if embedding_sidecar is not None:
+        server.log.info("Stopping embedding sidecar")
+        embedding_sidecar.stop()
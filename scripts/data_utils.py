@@ -1,10 +1,13 @@
 """Data utilities for index preparation."""
 import ast
+import gzip
+import hashlib
 import html
 import json
 import os
 import re
 import ssl
+import struct
 import subprocess
 import tempfile
 import time
@@ -53,6 +56,14 @@ FILE_FORMAT_DICT = {
     }
 
 RETRY_COUNT = 5
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "16"))
+
+# Document Intelligence results are cached by file content hash, in a local
+# directory or in a blob container (set EXTRACTION_CACHE_DIR="" to disable)
+EXTRACTION_CACHE_DIR = os.getenv("EXTRACTION_CACHE_DIR", ".extraction_cache")
+EXTRACTION_CACHE_CONTAINER_URL = os.getenv("EXTRACTION_CACHE_CONTAINER_URL")
+# Bump whenever the text or image mapping produced by extract_pdf_content changes
+PDF_EXTRACTION_VERSION = "1"
 
 SENTENCE_ENDINGS = [".", "!", "?"]
 WORDS_BREAKS = list(reversed([",", ";", ":", " ", "(", ")", "[", "]", "{", "}", "\t", "\n"]))
@@ -590,7 +601,68 @@ def polygon_to_bbox(polygon, dpi=72):
     x1, y1 = max(x_coords)*dpi, max(y_coords)*dpi
     return x0, y0, x1, y1
 
-def extract_pdf_content(file_path, form_recognizer_client, use_layout=False): 
+def _extraction_cache_container():
+    return ContainerClient.from_container_url(EXTRACTION_CACHE_CONTAINER_URL)
+
+
+def get_cached_extraction(key):
+    try:
+        if EXTRACTION_CACHE_CONTAINER_URL:
+            from azure.core.exceptions import ResourceNotFoundError
+            try:
+                data = _extraction_cache_container().download_blob(key).readall()
+            except ResourceNotFoundError:
+                return None
+        elif EXTRACTION_CACHE_DIR:
+            path = os.path.join(EXTRACTION_CACHE_DIR, key)
+            if not os.path.exists(path):
+                return None
+            with open(path, "rb") as f:
+                data = f.read()
+        else:
+            return None
+        return json.loads(gzip.decompress(data))
+    except Exception as e:
+        print(f"Failed to read extraction cache entry {key}: {e}")
+        return None
+
+
+def put_cached_extraction(key, entry):
+    data = gzip.compress(json.dumps(entry).encode("utf-8"))
+    try:
+        if EXTRACTION_CACHE_CONTAINER_URL:
+            _extraction_cache_container().upload_blob(key, data, overwrite=True)
+        elif EXTRACTION_CACHE_DIR:
+            path = os.path.join(EXTRACTION_CACHE_DIR, key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)
+    except Exception as e:
+        print(f"Failed to write extraction cache entry {key}: {e}")
+
+
+def extract_pdf_content(file_path, form_recognizer_client, use_layout=False):
+    """
+    Extract the text and image mapping of a document with Document
+    Intelligence, reusing the result of an earlier run on the same content.
+    """
+    model = "prebuilt-layout" if use_layout else "prebuilt-read"
+    with open(file_path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    extension = os.path.splitext(file_path)[1].lower()
+    key = f"document-intelligence-{model}/{PDF_EXTRACTION_VERSION}/{digest}{extension}.json.gz"
+
+    cached = get_cached_extraction(key)
+    if cached is not None:
+        return cached["content"], cached["image_mapping"]
+
+    content, image_mapping = _analyze_pdf_content(file_path, form_recognizer_client, use_layout=use_layout)
+    put_cached_extraction(key, {"content": content, "image_mapping": image_mapping})
+    return content, image_mapping
+
+
+def _analyze_pdf_content(file_path, form_recognizer_client, use_layout=False): 
     offset = 0
     page_map = []
     model = "prebuilt-layout" if use_layout else "prebuilt-read"
@@ -736,22 +808,43 @@ def merge_chunks_serially(chunked_content_list: List[str], num_tokens: int, cont
         yield current_chunk, total_size
 
 def get_payload_and_headers_cohere(
-    text, aad_token) -> Tuple[Dict, Dict]:
+    texts, aad_token) -> Tuple[Dict, Dict]:
     oai_headers =  {
         "Content-Type": "application/json",
         "Authorization": f"Bearer {aad_token}",
     }
 
-    cohere_body = { "texts": [text], "input_type": "search_document" }
+    cohere_body = { "texts": texts if isinstance(texts, list) else [texts], "input_type": "search_document" }
     return cohere_body, oai_headers
-    
-def get_embedding(text, embedding_model_endpoint=None, embedding_model_key=None, azure_credential=None):
+
+def get_local_embeddings(texts: List[str], endpoint: str) -> List[List[float]]:
+    """Embed `texts` with the app's local model through its /api/embed endpoint."""
+    response = requests.post(endpoint, json={"input": texts, "encoding_format": "base64"}, timeout=300)
+    response.raise_for_status()
+    data = sorted(response.json()["data"], key=lambda item: item["index"])
+    vectors = []
+    for item in data:
+        raw = base64.b64decode(item["embedding"])
+        vectors.append(list(struct.unpack(f"<{len(raw) // 4}f", raw)))  # little-endian float32
+    return vectors
+
+def get_embeddings(texts, embedding_model_endpoint=None, embedding_model_key=None, azure_credential=None):
+    """Embed a list of texts in one request and return one vector per text, in order."""
     endpoint = embedding_model_endpoint if embedding_model_endpoint else os.environ.get("EMBEDDING_MODEL_ENDPOINT")
     
     FLAG_EMBEDDING_MODEL = os.getenv("FLAG_EMBEDDING_MODEL", "AOAI")
     FLAG_COHERE = os.getenv("FLAG_COHERE", "ENGLISH")
     FLAG_AOAI = os.getenv("FLAG_AOAI", "V3")
 
+    if FLAG_EMBEDDING_MODEL == "LOCAL":
+        # The app's /api/embed, e.g. http://localhost:50505/api/embed
+        if endpoint is None:
+            raise Exception("EMBEDDING_MODEL_ENDPOINT is required for embedding")
+        try:
+            return get_local_embeddings(texts, endpoint)
+        except Exception as e:
+            raise Exception(f"Error getting embeddings with endpoint={endpoint} with error={e}")
+
     if azure_credential is None and (endpoint is None or key is None):
         raise Exception("EMBEDDING_MODEL_ENDPOINT and EMBEDDING_MODEL_KEY are required for embedding")
 
@@ -768,20 +861,21 @@ def get_embedding(text, embedding_model_endpoint=None, embedding_model_key=None,
             
             client = AzureOpenAI(api_version=api_version, azure_endpoint=base_url, api_key=api_key)
             if FLAG_AOAI == "V2":
-                embeddings = client.embeddings.create(model=deployment_id, input=text)
+                embeddings = client.embeddings.create(model=deployment_id, input=texts)
             elif FLAG_AOAI == "V3":   
                 embeddings = client.embeddings.create(model=deployment_id, 
-                                                      input=text, 
+                                                      input=texts, 
                                                       dimensions=int(os.getenv("VECTOR_DIMENSION", 1536)))
             
-            return embeddings.model_dump()['data'][0]['embedding']
+            data = sorted(embeddings.model_dump()['data'], key=lambda item: item['index'])
+            return [item['embedding'] for item in data]
         
         if FLAG_EMBEDDING_MODEL == "COHERE":
             if FLAG_COHERE == "MULTILINGUAL":
                 key = embedding_model_key if embedding_model_key else os.getenv("COHERE_MULTILINGUAL_API_KEY")
             elif FLAG_COHERE == "ENGLISH":
                 key = embedding_model_key if embedding_model_key else os.getenv("COHERE_ENGLISH_API_KEY")
-            data, headers = get_payload_and_headers_cohere(text, key)
+            data, headers = get_payload_and_headers_cohere(texts, key)
 
             body = str.encode(json.dumps(data))
             req = urllib.request.Request(endpoint, body, headers)
@@ -789,13 +883,17 @@ def get_embedding(text, embedding_model_endpoint=None, embedding_model_key=None,
             result = response.read()
             result_content = json.loads(result.decode('utf-8'))
                         
-            return result_content["embeddings"][0]   
+            return result_content["embeddings"]
         
 
     except Exception as e:
         raise Exception(f"Error getting embeddings with endpoint={endpoint} with error={e}")
 
 
+def get_embedding(text, embedding_model_endpoint=None, embedding_model_key=None, azure_credential=None):
+    return get_embeddings([text], embedding_model_endpoint, embedding_model_key, azure_credential)[0]
+
+
 def chunk_content_helper(
         content: str, file_format: str, file_name: Optional[str],
         token_overlap: int,
@@ -886,35 +984,44 @@ def chunk_content(
         )
         chunks = []
         skipped_chunks = 0
+        kept = []
         for chunk, chunk_size, doc in chunked_context:
             if chunk_size >= min_chunk_size:
-                if add_embeddings:
-                    for i in range(RETRY_COUNT):
-                        try:
-                            doc.contentVector = get_embedding(chunk, azure_credential=azure_credential, embedding_model_endpoint=embedding_endpoint)
-                            break
-                        except Exception as e:
-                            print(f"Error getting embedding for chunk with error={e}, retrying, current at {i + 1} retry, {RETRY_COUNT - (i + 1)} retries left")
-                            time.sleep(30)
+                kept.append((chunk, doc))
+            else:
+                skipped_chunks += 1
+
+        if add_embeddings:
+            for start in range(0, len(kept), EMBEDDING_BATCH_SIZE):
+                batch = kept[start:start + EMBEDDING_BATCH_SIZE]
+                for i in range(RETRY_COUNT):
+                    try:
+                        vectors = get_embeddings([chunk for chunk, _ in batch], azure_credential=azure_credential, embedding_model_endpoint=embedding_endpoint)
+                        for (_, doc), vector in zip(batch, vectors):
+                            doc.contentVector = vector
+                        break
+                    except Exception as e:
+                        print(f"Error getting embeddings for {len(batch)} chunks with error={e}, retrying, current at {i + 1} retry, {RETRY_COUNT - (i + 1)} retries left")
+                        time.sleep(30)
+                for chunk, doc in batch:
                     if doc.contentVector is None:
                         raise Exception(f"Error getting embedding for chunk={chunk}")
-                    
-                doc.image_mapping = {}
-                for key, value in image_mapping.items():
-                    if key in chunk:
-                        doc.image_mapping[key] = value
-                chunks.append(
-                    Document(
-                        content=chunk,
-                        title=doc.title,
-                        url=url,
-                        contentVector=doc.contentVector,
-                        metadata=doc.metadata,
-                        image_mapping=doc.image_mapping
-                    )
+
+        for chunk, doc in kept:
+            doc.image_mapping = {}
+            for key, value in image_mapping.items():
+                if key in chunk:
+                    doc.image_mapping[key] = value
+            chunks.append(
+                Document(
+                    content=chunk,
+                    title=doc.title,
+                    url=url,
+                    contentVector=doc.contentVector,
+                    metadata=doc.metadata,
+                    image_mapping=doc.image_mapping
                 )
-            else:
-                skipped_chunks += 1
+            )
 
     except UnsupportedFormatError as e:
         if ignore_errors:
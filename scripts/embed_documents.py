@@ -1,19 +1,35 @@
 import argparse
-from asyncio import sleep
 import json
+import os
+import time
 
 from azure.identity import DefaultAzureCredential
 from azure.keyvault.secrets import SecretClient
 
-from data_utils import get_embedding
+from data_utils import get_embeddings
 
 RETRY_COUNT = 5
 
+
+def embed_batch(documents, embedding_endpoint, embedding_key):
+    # Sleep/Retry in case embedding model is rate limited.
+    for _ in range(RETRY_COUNT):
+        try:
+            embeddings = get_embeddings([document["content"] for document in documents], embedding_endpoint, embedding_key)
+            for document, embedding in zip(documents, embeddings):
+                document["contentVector"] = embedding
+            return
+        except:
+            print("Error generating embeddings. Retrying...")
+            time.sleep(30)
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--input_data_path", type=str, required=True)
     parser.add_argument("--output_file_path", type=str, required=True)
     parser.add_argument("--config_file", type=str, required=True)
+    parser.add_argument("--batch_size", type=int, default=16, help="Number of documents embedded per request")
 
     args = parser.parse_args()
 
@@ -24,7 +40,7 @@ if __name__ == "__main__":
 
     if type(config) is not list:
         config = [config]
-    
+
     for index_config in config:
         # Keyvault Secret Client
         keyvault_url = index_config.get("keyvault_url")
@@ -34,9 +50,11 @@ if __name__ == "__main__":
         else:
             secret_client = SecretClient(keyvault_url, credential)
 
-        # Get Embedding key
+        # Get Embedding key (the app's local /api/embed endpoint needs none)
         embedding_key_secret_name = index_config.get("embedding_key_secret_name")
-        if not embedding_key_secret_name:
+        if os.getenv("FLAG_EMBEDDING_MODEL") == "LOCAL":
+            embedding_key = None
+        elif not embedding_key_secret_name:
             raise ValueError("No embedding key secret name provided in config file. Embeddings will not be generated.")
         else:
             embedding_key_secret = secret_client.get_secret(embedding_key_secret_name)
@@ -49,19 +67,17 @@ if __name__ == "__main__":
         # Embed documents
         print("Generating embeddings...")
         with open(args.input_data_path) as input_file, open(args.output_file_path, "w") as output_file:
+            batch = []
             for line in input_file:
-                document = json.loads(line)
-                # Sleep/Retry in case embedding model is rate limited.
-                for _ in range(RETRY_COUNT):
-                    try:
-                        embedding = get_embedding(document["content"], embedding_endpoint,  embedding_key)
-                        document["contentVector"] = embedding
-                        break
-                    except:
-                        print("Error generating embedding. Retrying...")
-                        sleep(30)
-                
-                output_file.write(json.dumps(document) + "\n")
+                batch.append(json.loads(line))
+                if len(batch) < args.batch_size:
+                    continue
+                embed_batch(batch, embedding_endpoint, embedding_key)
+                output_file.writelines(json.dumps(document) + "\n" for document in batch)
+                batch = []
 
-        print("Embeddings generated and saved to {}.".format(args.output_file_path))
+            if batch:
+                embed_batch(batch, embedding_endpoint, embedding_key)
+                output_file.writelines(json.dumps(document) + "\n" for document in batch)
 
+        print("Embeddings generated and saved to {}.".format(args.output_file_path))
@@ -22,6 +22,12 @@ fi
 cd ..
 . ./scripts/loadenv.sh
 
+echo ""
+echo "Starting embedding sidecar (if EMBEDDING_SIDECAR_SOCKET is set)"
+echo ""
+./.venv/bin/python -m backend.embedding.sidecar --autostart &
+trap "kill $! 2>/dev/null" EXIT
+
 echo ""
 echo "Starting backend"
 echo ""
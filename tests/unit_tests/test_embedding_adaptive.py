@@ -0,0 +1,62 @@
+import numpy as np
+
+from backend.embedding.adaptive import AdaptiveBatchEncoder
+from backend.embedding.cache import CachedEmbeddingModel, EmbeddingCache
+
+
+class FakeTokenizer:
+    def __call__(self, texts, truncation=False, max_length=None, **kwargs):
+        ids = [list(range(len(t.split()))) for t in texts]
+        if truncation:
+            ids = [i[:max_length] for i in ids]
+        return {"input_ids": ids}
+
+
+class FakeModel:
+    max_seq_length = 8
+
+    def __init__(self):
+        self.tokenizer = FakeTokenizer()
+        self.calls = []
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        self.calls.append(list(texts))
+        return np.array([[float(len(t.split())), 1.0] for t in texts], dtype=np.float32)
+
+
+def test_batches_by_token_budget_and_restores_order():
+    model = FakeModel()
+    encoder = AdaptiveBatchEncoder(model, max_batch_size=4, max_batch_tokens=8, target_batch_seconds=60)
+    texts = ["w " * 1, "w " * 8, "w " * 2, "w " * 1, "w " * 20, "w " * 2, "w " * 1]
+
+    progress = []
+    vectors = encoder.encode(texts, progress=lambda done, total: progress.append((done, total)))
+
+    # Lengths are truncated to max_seq_length and the output keeps the input order
+    assert vectors[:, 0].tolist() == [1.0, 8.0, 2.0, 1.0, 20.0, 2.0, 1.0]
+    # Long texts are encoded alone, short ones together, never above 8 padded tokens
+    assert [len(c) for c in model.calls] == [1, 1, 4, 1]
+    assert progress[-1] == (7, 7)
+    assert encoder.stats()["batches"] == 4
+
+
+def test_token_budget_follows_measured_throughput():
+    encoder = AdaptiveBatchEncoder(FakeModel(), max_batch_tokens=10000, target_batch_seconds=0.5)
+    encoder._record(batch_size=10, tokens=100, padded_tokens=200, seconds=1.0)
+    assert encoder.stats()["token_budget"] == 100
+
+
+def test_estimates_lengths_without_tokenizer_and_composes_with_cache():
+    class PlainModel:
+        def __init__(self):
+            self.calls = []
+
+        def encode(self, texts, **kwargs):
+            self.calls.append(list(texts))
+            return np.array([[float(len(t))] for t in texts], dtype=np.float32)
+
+    plain = PlainModel()
+    encoder = CachedEmbeddingModel(AdaptiveBatchEncoder(plain), EmbeddingCache("fake-model"))
+    assert encoder.encode(["abcd", "ab", "abcd"])[:, 0].tolist() == [4.0, 2.0, 4.0]
+    assert plain.calls == [["abcd", "ab"]]
+    assert encoder.stats()["texts"] == 2
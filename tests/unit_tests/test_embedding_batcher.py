@@ -0,0 +1,96 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from backend.embedding.batcher import MicroBatcher, EmbeddingQueueFullError
+
+
+class FakeModel:
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts):
+        self.calls.append(list(texts))
+        return np.array([[float(len(t)), 1.0] for t in texts], dtype=np.float32)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_one_encode():
+    model = FakeModel()
+    batcher = MicroBatcher(model.encode, max_batch_size=32, max_wait_ms=20)
+
+    texts = ["a" * n for n in range(1, 11)]
+    vectors = await asyncio.gather(*(batcher.embed(t) for t in texts))
+
+    assert len(model.calls) == 1
+    assert model.calls[0] == texts
+    assert [v[0] for v in vectors] == [float(len(t)) for t in texts]
+    await batcher.aclose()
+
+
+@pytest.mark.asyncio
+async def test_max_batch_size_splits_batches():
+    model = FakeModel()
+    batcher = MicroBatcher(model.encode, max_batch_size=4, max_wait_ms=20)
+
+    await asyncio.gather(*(batcher.embed(str(i)) for i in range(10)))
+
+    assert [len(c) for c in model.calls] == [4, 4, 2]
+    stats = batcher.stats()
+    assert stats["batches"] == 3
+    assert stats["texts"] == 10
+    assert stats["batch_size_histogram"] == {"3-4": 2, "2": 1}
+    await batcher.aclose()
+
+
+@pytest.mark.asyncio
+async def test_encode_error_is_raised_to_every_caller():
+    def failing_encode(texts):
+        raise RuntimeError("model exploded")
+
+    batcher = MicroBatcher(failing_encode, max_wait_ms=5)
+    results = await asyncio.gather(
+        batcher.embed("a"), batcher.embed("b"), return_exceptions=True
+    )
+
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+    # The worker keeps serving after a failed batch
+    batcher.encode_fn = FakeModel().encode
+    vector = await batcher.embed("abc")
+    assert vector[0] == 3.0
+    await batcher.aclose()
+
+
+@pytest.mark.asyncio
+async def test_full_queue_raises_with_retry_after():
+    model = FakeModel()
+    batcher = MicroBatcher(model.encode, max_batch_size=2, max_wait_ms=50, max_queue_size=3)
+
+    accepted = [asyncio.ensure_future(batcher.embed(str(i))) for i in range(3)]
+    await asyncio.sleep(0)  # let the first three reach the queue
+
+    with pytest.raises(EmbeddingQueueFullError) as exc_info:
+        await asyncio.gather(*(batcher.embed("overflow") for _ in range(3)))
+    assert exc_info.value.retry_after >= 1
+
+    await asyncio.gather(*accepted)
+    assert batcher.stats()["rejected"] >= 1
+    await batcher.aclose()
+
+
+@pytest.mark.asyncio
+async def test_embed_many_batches_inputs_with_concurrent_callers():
+    model = FakeModel()
+    batcher = MicroBatcher(model.encode, max_batch_size=32, max_wait_ms=20, max_queue_size=4)
+
+    many, single = await asyncio.gather(batcher.embed_many(["a", "bbb", "cc"]), batcher.embed("dddd"))
+
+    assert [v[0] for v in many] == [1.0, 3.0, 2.0]
+    assert single[0] == 4.0
+    assert model.calls == [["a", "bbb", "cc", "dddd"]]
+
+    # A request larger than the queue is admitted when nothing else is waiting
+    assert len(await batcher.embed_many(["x"] * 6)) == 6
+    await batcher.aclose()
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from backend.embedding.cache import CachedEmbeddingModel, EmbeddingCache, text_digest
+
+
+class FakeModel:
+    def __init__(self, dim=4):
+        self.dim = dim
+        self.calls = []
+
+    def encode(self, texts, **kwargs):
+        self.calls.append(list(texts))
+        return np.array([[float(len(t))] * self.dim for t in texts], dtype=np.float32)
+
+
+def test_text_digest_normalizes_whitespace():
+    assert text_digest("hello   world\n") == text_digest(" hello world")
+    assert text_digest("hello world") != text_digest("hello worlds")
+
+
+def test_memory_tier_hits_and_deduplicates():
+    model = FakeModel()
+    cache = EmbeddingCache("fake-model", memory_entries=10)
+
+    first = cache.encode(["a", "bb", "a"], model.encode)
+    assert model.calls == [["a", "bb"]]
+    assert first[:, 0].tolist() == [1.0, 2.0, 1.0]
+
+    second = cache.encode(["bb", "ccc"], model.encode)
+    assert model.calls[-1] == ["ccc"]
+    assert second[:, 0].tolist() == [2.0, 3.0]
+
+    stats = cache.stats()["memory"]
+    assert stats["hits"] == 1
+    assert stats["entries"] == 3
+
+
+def test_memory_tier_evicts_least_recently_used():
+    model = FakeModel()
+    cache = EmbeddingCache("fake-model", memory_entries=2)
+
+    cache.encode(["a", "bb"], model.encode)
+    cache.encode(["a"], model.encode)  # "a" is now the most recently used
+    cache.encode(["ccc"], model.encode)
+
+    assert cache.get("bb") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["memory"]["evictions"] == 1
+
+
+def test_disk_tier_survives_restart_and_evicts_by_size(tmp_path):
+    model = FakeModel(dim=4)
+    # Room for exactly three 4-dim float32 vectors
+    cache = EmbeddingCache("org/fake-model", memory_entries=0, disk_dir=str(tmp_path), disk_max_bytes=48)
+    cache.encode(["a", "bb", "ccc"], model.encode)
+
+    restarted = EmbeddingCache("org/fake-model", memory_entries=0, disk_dir=str(tmp_path), disk_max_bytes=48)
+    vectors = restarted.encode(["bb", "ccc"], model.encode)
+    assert len(model.calls) == 1
+    assert vectors[:, 0].tolist() == [2.0, 3.0]
+
+    # "a" is the least recently used entry and gets recycled
+    restarted.encode(["dddd"], model.encode)
+    disk = restarted.stats()["disk"]
+    assert disk["evictions"] == 1
+    assert disk["entries"] == 3
+    assert restarted.get("a") is None
+    assert restarted.get("dddd")[0] == 4.0
+
+
+def test_cached_model_wraps_encode():
+    model = FakeModel()
+    cached = CachedEmbeddingModel(model, EmbeddingCache("fake-model"))
+
+    assert cached.encode("abc").tolist() == [3.0] * 4
+    assert cached.encode(["abc", "de"]).shape == (2, 4)
+    assert model.calls == [["abc"], ["de"]]
+    assert cached.dim == 4
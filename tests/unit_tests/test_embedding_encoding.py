@@ -0,0 +1,30 @@
+import base64
+import json
+
+import numpy as np
+import pytest
+
+from backend.embedding.encoding import embedding_response, encode_embedding, validate_encoding
+
+
+def test_float_response_round_trips_float32():
+    vector = np.array([[0.1, -2.5, 3.0]], dtype=np.float32)
+    body = json.loads(embedding_response([encode_embedding(vector), encode_embedding(vector * 2)]))
+    assert [item["index"] for item in body["data"]] == [0, 1]
+    assert np.array_equal(np.array(body["data"][0]["embedding"], dtype=np.float32), vector[0])
+    assert np.array_equal(np.array(body["data"][1]["embedding"], dtype=np.float32), vector[0] * 2)
+
+
+@pytest.mark.parametrize("dtype, np_dtype", [("float32", "<f4"), ("float16", "<f2")])
+def test_base64_response_is_little_endian(dtype, np_dtype):
+    vector = np.array([0.5, -1.25, 2.0], dtype=np.float32)
+    encoded = encode_embedding(vector, "base64", dtype)
+    decoded = np.frombuffer(base64.b64decode(encoded), dtype=np_dtype)
+    assert decoded.tolist() == [0.5, -1.25, 2.0]
+    assert json.loads(embedding_response([encoded]))["data"][0]["embedding"] == encoded
+
+
+@pytest.mark.parametrize("encoding_format, dtype", [("hex", "float32"), ("base64", "int8"), ("float", "float16")])
+def test_validate_encoding_rejects_unsupported_options(encoding_format, dtype):
+    with pytest.raises(ValueError):
+        validate_encoding(encoding_format, dtype)
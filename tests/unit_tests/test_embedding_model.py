@@ -0,0 +1,32 @@
+import pytest
+
+from backend.embedding.model import LazyEmbeddingModel, embedding_model_id, load_embedding_model
+
+
+def test_embedding_model_id_distinguishes_backends():
+    assert embedding_model_id("org/model") == "org/model"
+    assert embedding_model_id("org/model", backend="onnx") == "org/model@onnx"
+    assert embedding_model_id("org/model", backend="onnx", quantize=True, quantization_config="avx512_vnni") == \
+        "org/model@onnx-qint8-avx512_vnni"
+
+
+def test_load_embedding_model_rejects_unknown_backend():
+    pytest.importorskip("sentence_transformers")
+    with pytest.raises(ValueError):
+        load_embedding_model("org/model", backend="openvino")
+
+
+def test_lazy_model_loads_once_on_first_use():
+    class FakeModel:
+        max_seq_length = 128
+
+        def encode(self, sentences, **kwargs):
+            return [len(s) for s in sentences]
+
+    loads = []
+    lazy = LazyEmbeddingModel(lambda: loads.append(1) or FakeModel())
+    assert not lazy.loaded and loads == []
+
+    assert lazy.encode(["ab", "c"]) == [2, 1]
+    assert lazy.max_seq_length == 128
+    assert lazy.loaded and loads == [1]
@@ -0,0 +1,86 @@
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pytest
+
+from backend.embedding.sidecar import EmbeddingSidecarServer, SidecarEmbeddingModel, SidecarSupervisor
+
+
+class FakeModel:
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts):
+        self.calls.append(list(texts))
+        return np.array([[float(len(t)), 0.5] for t in texts], dtype=np.float32)
+
+
+@pytest.fixture
+def socket_path():
+    with tempfile.TemporaryDirectory() as tmp:
+        yield os.path.join(tmp, "embed.sock")
+
+
+@pytest.mark.asyncio
+async def test_sidecar_serves_interactive_and_bulk_requests(socket_path):
+    model = FakeModel()
+    server = EmbeddingSidecarServer(model, socket_path, max_batch_size=16, max_wait_ms=20)
+    server_task = asyncio.create_task(server.serve_forever())
+    client = SidecarEmbeddingModel(socket_path, connect_timeout=5)
+
+    try:
+        vectors = await asyncio.gather(*(client.embed("x" * n) for n in range(1, 6)))
+        assert [v[0] for v in vectors] == [1.0, 2.0, 3.0, 4.0, 5.0]
+        # Queries from concurrent connections are batched together by the sidecar
+        assert len(model.calls) < 5
+
+        many = await client.embed_many(["a", "abc"])
+        assert [v[0] for v in many] == [1.0, 3.0]
+
+        bulk = await asyncio.to_thread(client.encode, ["ab", "abcd"])
+        assert bulk.shape == (2, 2)
+        assert bulk[:, 0].tolist() == [2.0, 4.0]
+        assert model.calls[-1] == ["ab", "abcd"]
+
+        single = await asyncio.to_thread(client.encode, "abc")
+        assert single.tolist() == [3.0, 0.5]
+
+        stats = await client.stats()
+        assert stats["batcher"]["texts"] == 7
+    finally:
+        await client.aclose()
+        server_task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await server_task
+
+
+def test_supervisor_restarts_the_sidecar_until_stopped(tmp_path):
+    starts = tmp_path / "starts"
+    command = [sys.executable, "-c", f"open({str(starts)!r}, 'a').write('x')"]
+    supervisor = SidecarSupervisor(command, backoff_seconds=0.01, max_backoff_seconds=0.05)
+    supervisor.start()
+    deadline = time.monotonic() + 10
+    while supervisor.restarts < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    supervisor.stop()
+
+    assert supervisor.restarts >= 2
+    count = len(starts.read_text())
+    time.sleep(0.2)
+    assert len(starts.read_text()) == count
+
+
+def test_supervisor_stop_terminates_the_sidecar():
+    supervisor = SidecarSupervisor([sys.executable, "-c", "import time; time.sleep(60)"])
+    supervisor.start()
+    deadline = time.monotonic() + 10
+    while supervisor._process is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    supervisor.stop(timeout=5)
+
+    assert supervisor._process.poll() is not None
+    assert supervisor.restarts == 0
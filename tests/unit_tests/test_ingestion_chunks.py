@@ -0,0 +1,34 @@
+import re
+
+from backend.ingestion.chunks import chunk_id, content_hash, file_hash, is_manifest_blob, manifest_blob_name
+
+
+def test_chunk_id_is_deterministic_and_a_valid_search_key():
+    first = chunk_id("contoso", "handbook.pdf", 3, "## handbook.pdf - Page 3\n\nVacation")
+    second = chunk_id("contoso", "handbook.pdf", 3, "## handbook.pdf - Page 3\n\nVacation")
+
+    assert first == second
+    assert re.fullmatch(r"[A-Za-z0-9_\-=]+", first)
+
+
+def test_chunk_id_changes_with_any_part_of_its_identity():
+    base = chunk_id("contoso", "handbook.pdf", 3, "text")
+
+    assert chunk_id("fabrikam", "handbook.pdf", 3, "text") != base
+    assert chunk_id("contoso", "policies.pdf", 3, "text") != base
+    assert chunk_id("contoso", "handbook.pdf", 4, "text") != base
+    assert chunk_id("contoso", "handbook.pdf", 3, "text!") != base
+
+
+def test_content_hash_and_manifest_names():
+    assert content_hash("abc") == content_hash(b"abc")
+    assert manifest_blob_name("contoso/handbook.pdf") == "_chunks/contoso/handbook.pdf.json"
+    assert is_manifest_blob(manifest_blob_name("contoso/handbook.pdf"))
+    assert not is_manifest_blob("contoso/handbook.pdf")
+
+
+def test_file_hash_matches_content_hash(tmp_path):
+    path = tmp_path / "handbook.pdf"
+    path.write_bytes(b"%PDF" * 1000)
+
+    assert file_hash(str(path), block_size=7) == content_hash(b"%PDF" * 1000)
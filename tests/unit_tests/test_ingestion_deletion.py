@@ -0,0 +1,156 @@
+from types import SimpleNamespace
+
+import pytest
+
+from backend.ingestion import deletion
+from backend.ingestion.deletion import BlobDeletionError, delete_blobs, document_filter, iter_document_id_pages
+
+
+class AsyncList:
+    def __init__(self, items):
+        self.items = iter(items)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.items)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class BadRequest(Exception):
+    status_code = 400
+
+
+class FakeSearchClient:
+    """Answers key-ordered searches like the service, from a set of keys."""
+
+    def __init__(self, keys, sortable=True, filterable=True):
+        self.keys = set(keys)
+        self.sortable = sortable
+        self.filterable = filterable
+        self.queries = []
+
+    async def search(self, search_text, filter, select, top, order_by=None, skip=0):
+        if order_by and not self.sortable:
+            raise BadRequest("The field 'id' is not sortable")
+        if filter and "id gt" in filter and not self.filterable:
+            raise BadRequest("The field 'id' is not filterable")
+        self.queries.append(filter if order_by else (filter, skip))
+        after = filter.split("id gt '")[1].rstrip("')") if filter and "id gt" in filter else ""
+        # Unordered results come in an arbitrary (here reversed) order
+        keys = sorted(self.keys, reverse=not order_by)
+        return AsyncList([{"id": key} for key in keys if key > after][skip:skip + top])
+
+
+def test_document_filter_quotes_values():
+    assert document_filter() is None
+    assert document_filter("contoso") == "organization eq 'contoso'"
+    assert document_filter("contoso", "o'brien.pdf") == "organization eq 'contoso' and file eq 'o''brien.pdf'"
+
+
+@pytest.mark.asyncio
+async def test_pages_continue_after_the_last_key_while_documents_are_deleted():
+    client = FakeSearchClient(f"{i:03}" for i in range(7))
+
+    pages = []
+    async for keys in iter_document_id_pages(client, "organization eq 'contoso'", page_size=3):
+        pages.append(keys)
+        client.keys.difference_update(keys)  # deleting a page does not shift the next one
+
+    assert pages == [["000", "001", "002"], ["003", "004", "005"], ["006"]]
+    assert client.queries == [
+        "(organization eq 'contoso')",
+        "(organization eq 'contoso') and (id gt '002')",
+        "(organization eq 'contoso') and (id gt '005')",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_without_a_sortable_key_pages_are_read_by_offset():
+    client = FakeSearchClient((f"{i:03}" for i in range(5)), sortable=False)
+
+    pages = [keys async for keys in iter_document_id_pages(client, "organization eq 'contoso'", page_size=2)]
+
+    assert pages == [["004", "003"], ["002", "001"], ["000"]]
+    assert [skip for _, skip in client.queries] == [0, 2, 4]
+
+
+@pytest.mark.asyncio
+async def test_a_key_that_is_not_filterable_falls_back_after_the_first_page():
+    client = FakeSearchClient((f"{i:03}" for i in range(5)), filterable=False)
+
+    pages = [keys async for keys in iter_document_id_pages(client, None, page_size=2)]
+
+    # The first page was read in key order; the rest by offset, without repeating it
+    assert pages == [["000", "001"], ["004", "003"], ["002"]]
+
+
+@pytest.mark.asyncio
+async def test_without_a_sortable_key_deleting_consumers_requery_until_nothing_matches(monkeypatch):
+    monkeypatch.setattr(deletion, "STALE_QUERY_SECONDS", 0)
+    client = FakeSearchClient((f"{i:03}" for i in range(5)), sortable=False)
+    pending = []
+
+    async def delete_pending():
+        # The first deletion only shows up in the index one query later
+        if len(client.queries) == 1:
+            return
+        client.keys.difference_update(pending)
+        pending.clear()
+
+    pages = []
+    async for keys in iter_document_id_pages(client, None, page_size=2, before_requery=delete_pending):
+        pages.append(keys)
+        pending.extend(keys)
+
+    assert pages == [["004", "003"], ["002", "001"], ["000"]]
+    assert client.keys == set()
+    assert all(skip == 0 for _, skip in client.queries)
+
+
+@pytest.mark.asyncio
+async def test_blobs_are_deleted_in_batches_and_missing_ones_are_skipped():
+    requests = []
+
+    class FakeContainerClient:
+        async def delete_blobs(self, *names, raise_on_any_failure):
+            assert raise_on_any_failure is False
+            requests.append(names)
+            return AsyncList([
+                SimpleNamespace(status_code=404 if name == "gone" else 202, reason="")
+                for name in names
+            ])
+
+    totals = []
+
+    async def on_batch(deleted):
+        totals.append(deleted)
+
+    names = [f"contoso/{i}.pdf" for i in range(5)] + ["gone"]
+    deleted = await delete_blobs(FakeContainerClient(), names, batch_size=4, on_batch=on_batch)
+
+    assert [len(batch) for batch in requests] == [4, 2]
+    assert deleted == 5
+    assert totals == [4, 5]
+
+
+@pytest.mark.asyncio
+async def test_failed_blob_deletes_are_raised_after_every_batch():
+    requests = []
+
+    class FakeContainerClient:
+        async def delete_blobs(self, *names, raise_on_any_failure):
+            requests.append(names)
+            return AsyncList([
+                SimpleNamespace(status_code=500 if name == "locked" else 202, reason="Internal Server Error")
+                for name in names
+            ])
+
+    with pytest.raises(BlobDeletionError) as error:
+        await delete_blobs(FakeContainerClient(), ["locked", "a", "b"], batch_size=2)
+
+    assert error.value.failed == ["locked"]
+    assert len(requests) == 2
@@ -0,0 +1,57 @@
+from backend.ingestion.extraction_cache import ExtractionCache
+from backend.ingestion.pdf import PDF_EXTRACTOR, iter_cached_pdf_pages
+
+
+def test_entries_are_keyed_by_digest_extractor_and_version(tmp_path):
+    cache = ExtractionCache(str(tmp_path))
+    cache.put("abc", "pymupdf-text", "1", {"pages": ["one", "two"]})
+
+    assert cache.get("abc", "pymupdf-text", "1") == {"pages": ["one", "two"]}
+    assert cache.get("abc", "pymupdf-text", "2") is None
+    assert cache.get("def", "pymupdf-text", "1") is None
+    assert cache.stats() == {"backend": "directory", "hits": 1, "misses": 2, "writes": 1}
+
+
+def test_corrupt_entries_are_misses(tmp_path):
+    cache = ExtractionCache(str(tmp_path))
+    path = tmp_path / ExtractionCache.key("abc", "pymupdf-text", "1")
+    path.parent.mkdir(parents=True)
+    path.write_bytes(b"not gzip")
+
+    assert cache.get("abc", "pymupdf-text", "1") is None
+
+
+def pages(texts):
+    return [
+        {"page_number": n, "text": text, "markdown": f"## doc.pdf - Page {n}\n\n{text}\n", "total_pages": len(texts)}
+        for n, text in enumerate(texts, 1)
+    ]
+
+
+def test_cached_pages_skip_extraction(tmp_path):
+    cache = ExtractionCache(str(tmp_path))
+    extracted = []
+
+    def extract():
+        extracted.append(True)
+        return iter(pages(["first", "second"]))
+
+    first = list(iter_cached_pdf_pages(extract, "doc.pdf", cache, "abc", "1"))
+    second = list(iter_cached_pdf_pages(extract, "doc.pdf", cache, "abc", "1"))
+
+    assert extracted == [True]
+    assert second == first == pages(["first", "second"])
+    assert cache.get("abc", PDF_EXTRACTOR, "1") == {"pages": ["first", "second"]}
+    # Only the requested pages are served from the cache
+    assert [page["page_number"] for page in iter_cached_pdf_pages(extract, "doc.pdf", cache, "abc", "1", skip_pages={1})] == [2]
+
+
+def test_partial_extractions_are_not_cached(tmp_path):
+    cache = ExtractionCache(str(tmp_path))
+
+    list(iter_cached_pdf_pages(lambda: iter(pages(["second"])[1:]), "doc.pdf", cache, "abc", "1", skip_pages={1}))
+    unfinished = iter_cached_pdf_pages(lambda: iter(pages(["a", "b"])), "doc.pdf", cache, "def", "1")
+    next(unfinished)
+    unfinished.close()
+
+    assert cache.stats()["writes"] == 0
@@ -0,0 +1,156 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from backend.ingestion.indexer import IndexingError, SearchIndexer
+
+
+class HttpError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(status_code=status_code, headers=headers or {})
+
+
+def ok(documents):
+    return [SimpleNamespace(key=d["id"], succeeded=True, status_code=201, error_message=None) for d in documents]
+
+
+def documents(count, size=10):
+    return [{"id": str(i), "content": "x" * size} for i in range(count)]
+
+
+@pytest.mark.asyncio
+async def test_batches_by_count_and_payload_bytes():
+    batches = []
+
+    async def upload(batch):
+        batches.append(len(batch))
+        return ok(batch)
+
+    indexer = SearchIndexer(upload, max_batch_documents=4, max_batch_bytes=100)
+    await indexer.add(documents(6, size=10))  # 33 bytes each: 3 fit in 100 bytes
+    await indexer.add(documents(2, size=10))
+    stats = await indexer.flush()
+
+    assert batches == [3, 3, 2]
+    assert stats["succeeded"] == 8
+
+
+@pytest.mark.asyncio
+async def test_runs_batches_concurrently():
+    running = 0
+    peak = 0
+
+    async def upload(batch):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return ok(batch)
+
+    indexer = SearchIndexer(upload, max_batch_documents=1, max_concurrency=3)
+    await indexer.add(documents(9))
+    await indexer.flush()
+    assert peak == 3
+
+
+@pytest.mark.asyncio
+async def test_retries_only_failed_documents():
+    sent = []
+
+    async def upload(batch):
+        sent.append([d["id"] for d in batch])
+        first = len(sent) == 1
+        return [
+            SimpleNamespace(key=d["id"], succeeded=not (first and d["id"] == "1"),
+                            status_code=503 if first and d["id"] == "1" else 201, error_message=None)
+            for d in batch
+        ]
+
+    indexed = []
+
+    async def on_indexed(batch):
+        indexed.append([d["id"] for d in batch])
+
+    indexer = SearchIndexer(upload, backoff_seconds=0.001, on_indexed=on_indexed)
+    await indexer.add(documents(3))
+    stats = await indexer.flush()
+
+    assert sent == [["0", "1", "2"], ["1"]]
+    assert indexed == [["0", "2"], ["1"]]
+    assert stats["succeeded"] == 3
+    assert stats["throttled"] == 1
+
+
+@pytest.mark.asyncio
+async def test_throttling_halves_concurrency_and_honours_retry_after():
+    calls = []
+
+    async def upload(batch):
+        calls.append(asyncio.get_running_loop().time())
+        if len(calls) == 1:
+            raise HttpError(429, {"retry-after-ms": "50"})
+        return ok(batch)
+
+    indexer = SearchIndexer(upload, max_concurrency=4, backoff_seconds=0.001)
+    await indexer.add(documents(2))
+    stats = await indexer.flush()
+
+    assert calls[1] - calls[0] >= 0.045
+    assert stats["throttled"] == 1
+    assert stats["succeeded"] == 2
+
+
+@pytest.mark.asyncio
+async def test_splits_batches_rejected_as_too_large():
+    sizes = []
+
+    async def upload(batch):
+        sizes.append(len(batch))
+        if len(batch) > 2:
+            raise HttpError(413)
+        return ok(batch)
+
+    indexer = SearchIndexer(upload)
+    await indexer.add(documents(5))
+    stats = await indexer.flush()
+
+    assert sizes == [5, 2, 3, 1, 2]
+    assert stats["succeeded"] == 5
+
+
+@pytest.mark.asyncio
+async def test_permanent_failures_are_reported():
+    async def upload(batch):
+        return [SimpleNamespace(key=d["id"], succeeded=d["id"] != "2", status_code=400 if d["id"] == "2" else 201,
+                                error_message="bad vector" if d["id"] == "2" else None) for d in batch]
+
+    indexer = SearchIndexer(upload)
+    await indexer.add(documents(4))
+    with pytest.raises(IndexingError) as error:
+        await indexer.flush()
+    assert error.value.failed == {"2": "bad vector"}
+
+
+@pytest.mark.asyncio
+async def test_on_indexed_errors_stop_indexing():
+    class LeaseLost(Exception):
+        pass
+
+    sent = []
+
+    async def upload(batch):
+        sent.append(len(batch))
+        return ok(batch)
+
+    async def on_indexed(batch):
+        raise LeaseLost()
+
+    indexer = SearchIndexer(upload, max_batch_documents=1, max_concurrency=1, on_indexed=on_indexed)
+    with pytest.raises(LeaseLost):
+        await indexer.add(documents(5))
+        await indexer.flush()
+    assert len(sent) < 5
@@ -0,0 +1,168 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from backend.ingestion.jobs import JobStore, JobWorkerPool, LeaseLostError
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.sqlite3"), str(tmp_path / "uploads"), lease_seconds=60, max_attempts=2)
+
+
+def test_claim_leases_jobs_in_order_and_finish_removes_files(store):
+    store.create("first", "pdf", {"organization": "contoso", "files": []})
+    store.create("second", "xml", {"organization": "contoso", "files": []})
+    os.makedirs(store.job_dir("first"))
+
+    job = store.claim("worker-a")
+    assert (job.id, job.kind, job.status, job.attempts) == ("first", "pdf", "processing", 1)
+    assert job.payload == {"organization": "contoso", "files": []}
+    assert store.claim("worker-b").id == "second"
+    assert store.claim("worker-c") is None
+
+    assert not store.finish("first", "worker-b", "completed", result={"processed_files": []})
+    assert store.finish("first", "worker-a", "completed", result={"processed_files": ["a.pdf"]})
+    finished = store.get("first")
+    assert finished.status == "completed"
+    assert finished.result == {"processed_files": ["a.pdf"]}
+    assert not os.path.exists(store.job_dir("first"))
+
+
+def test_expired_lease_is_resumed_until_attempts_run_out(store):
+    store.create("job", "pdf", {"files": []})
+    store.lease_seconds = -1  # every lease has already expired
+
+    assert store.claim("worker-a").attempts == 1
+    assert not store.renew("job", "worker-b")
+    assert store.claim("worker-b").attempts == 2
+    assert store.claim("worker-c") is None
+    abandoned = store.get("job")
+    assert abandoned.status == "failed"
+    assert "2 attempts" in abandoned.error
+
+
+def test_release_requeues_without_counting_the_attempt(store):
+    store.create("job", "pdf", {"files": []})
+    store.claim("worker-a")
+    store.release("job", "worker-a")
+
+    job = store.get("job")
+    assert (job.status, job.attempts) == ("queued", 0)
+
+
+def test_purge_removes_old_finished_jobs_only(store):
+    store.create("old", "pdf", {"files": []})
+    store.create("running", "pdf", {"files": []})
+    store.claim("worker")
+    store.finish("old", "worker", "failed", error="boom")
+    store.claim("worker")
+    time.sleep(0.01)
+
+    assert store.purge(ttl_seconds=0) == ["old"]
+    assert store.get("old") is None
+    assert store.get("running").status == "processing"
+
+
+@pytest.mark.asyncio
+async def test_worker_pool_runs_jobs_and_records_the_outcome(store):
+    store.create("ok", "pdf", {"files": ["a.pdf"]})
+    store.create("bad", "pdf", {"files": []})
+
+    async def handler(job):
+        if not job.payload["files"]:
+            raise ValueError("no files")
+        return {"processed_files": job.payload["files"]}
+
+    pool = JobWorkerPool(store, handler, workers=2, poll_seconds=0.01)
+    runner = asyncio.ensure_future(pool.run())
+    for _ in range(200):
+        if all(store.get(job_id).status in ("completed", "failed") for job_id in ("ok", "bad")):
+            break
+        await asyncio.sleep(0.01)
+    await pool.stop()
+
+    assert runner.done()
+    assert store.get("ok").result == {"processed_files": ["a.pdf"]}
+    assert store.get("bad").status == "failed"
+    assert store.get("bad").error == "no files"
+
+
+@pytest.mark.asyncio
+async def test_stopping_the_pool_requeues_the_running_job(store):
+    store.create("slow", "pdf", {"files": []})
+    started = asyncio.Event()
+
+    async def handler(job):
+        started.set()
+        await asyncio.sleep(60)
+
+    pool = JobWorkerPool(store, handler, poll_seconds=0.01)
+    asyncio.ensure_future(pool.run())
+    await asyncio.wait_for(started.wait(), 5)
+    await pool.stop()
+
+    assert store.get("slow").status == "queued"
+
+
+def test_checkpoints_are_kept_per_file_and_purged_with_the_job(store):
+    store.create("job", "pdf", {"files": []})
+    store.checkpoint("job", "a.pdf", [("p1", 1), ("p2", 2)], progress={"indexed": 2})
+    store.checkpoint("job", "a.pdf", [("p2", 2), ("p3", 3)], progress={"indexed": 3})
+    store.checkpoint("job", "b.xml", [("c1", None)])
+
+    assert store.checkpointed_chunks("job", "a.pdf") == {"p1": 1, "p2": 2, "p3": 3}
+    assert store.checkpointed_chunks("job", "b.xml") == {"c1": None}
+    assert store.progress("job") == {"a.pdf": {"indexed": 3}}
+
+    store.claim("worker")
+    store.finish("job", "worker", "completed", result={})
+    time.sleep(0.01)
+    store.purge(ttl_seconds=0)
+    assert store.checkpointed_chunks("job", "a.pdf") == {}
+    assert store.progress("job") == {}
+
+
+def test_checkpoints_require_the_lease_when_an_owner_is_given(store):
+    store.create("job", "pdf", {"files": []})
+    job = store.claim("worker")
+    assert job.lease_owner == "worker"
+
+    store.checkpoint("job", "a.pdf", [("p1", 1)], owner="worker")
+    with pytest.raises(LeaseLostError):
+        store.checkpoint("job", "a.pdf", [("p2", 2)], owner="other")
+    with pytest.raises(LeaseLostError):
+        store.ensure_lease("job", "other")
+
+    assert store.checkpointed_chunks("job", "a.pdf") == {"p1": 1}
+
+
+@pytest.mark.asyncio
+async def test_losing_the_lease_cancels_the_running_job(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"), str(tmp_path / "uploads"), lease_seconds=0.03)
+    store.create("slow", "pdf", {"files": []})
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    async def handler(job):
+        started.set()
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    pool = JobWorkerPool(store, handler, poll_seconds=60)
+    asyncio.ensure_future(pool.run())
+    await asyncio.wait_for(started.wait(), 5)
+    # Another worker claims the job again
+    with store._connect() as conn:
+        conn.execute("UPDATE jobs SET lease_owner = 'other' WHERE id = 'slow'")
+    await asyncio.wait_for(cancelled.wait(), 5)
+    await pool.stop()
+
+    # The job is left to its new owner
+    job = store.get("slow")
+    assert (job.status, job.lease_owner) == ("processing", "other")
@@ -0,0 +1,119 @@
+import time
+
+import pytest
+
+from backend.ingestion.manifest import DocumentManifest, DocumentRecord
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    return DocumentManifest(str(tmp_path / "manifest.sqlite3"))
+
+
+def record(blob_path, chunk_ids=("a", "b"), page_count=2, byte_size=100, content_hash="abc"):
+    organization, file_name = blob_path.split("/")
+    return DocumentRecord(
+        organization=organization,
+        file_name=file_name,
+        blob_path=blob_path,
+        content_hash=content_hash,
+        chunk_ids=list(chunk_ids),
+        page_count=page_count,
+        byte_size=byte_size,
+    )
+
+
+def test_put_replaces_the_record_of_a_blob(manifest):
+    manifest.put(record("acme/doc.pdf"))
+    manifest.put(record("acme/doc.pdf", chunk_ids=["c"], page_count=1, content_hash="def"))
+
+    stored = manifest.get("acme/doc.pdf")
+    assert (stored.content_hash, stored.chunk_ids, stored.page_count) == ("def", ["c"], 1)
+    assert stored.updated_at > 0
+    assert manifest.get("acme/other.pdf") is None
+
+
+def test_files_are_listed_and_found_by_name(manifest):
+    for blob_path in ("globex/b.pdf", "acme/b.pdf", "acme/a.xml"):
+        manifest.put(record(blob_path))
+
+    assert manifest.blob_paths() == ["acme/a.xml", "acme/b.pdf", "globex/b.pdf"]
+    assert manifest.blob_paths("acme") == ["acme/a.xml", "acme/b.pdf"]
+    assert manifest.blob_paths("initech") == []
+    assert manifest.find("b.pdf").blob_path == "acme/b.pdf"
+    assert manifest.find("c.pdf") is None
+
+
+def test_remove_returns_the_removed_records(manifest):
+    manifest.put(record("acme/a.pdf", chunk_ids=["1", "2"]))
+    manifest.put(record("acme/b.pdf"))
+
+    removed = manifest.remove(["acme/a.pdf", "acme/missing.pdf"])
+
+    assert [(r.blob_path, r.chunk_ids) for r in removed] == [("acme/a.pdf", ["1", "2"])]
+    assert manifest.blob_paths() == ["acme/b.pdf"]
+
+
+def test_stats_are_per_organization(manifest):
+    manifest.put(record("acme/a.pdf", chunk_ids=["1", "2", "3"], page_count=3, byte_size=300))
+    manifest.put(record("acme/b.xml", chunk_ids=["4"], page_count=None, byte_size=50))
+    manifest.put(record("globex/c.pdf", chunk_ids=["5"], page_count=1, byte_size=10))
+
+    stats = manifest.stats()
+
+    assert list(stats) == ["acme", "globex"]
+    assert {key: stats["acme"][key] for key in ("files", "bytes", "chunks", "pages")} == {
+        "files": 2, "bytes": 350, "chunks": 4, "pages": 3
+    }
+    assert list(manifest.stats("globex")) == ["globex"]
+    assert manifest.stats("initech") == {}
+
+
+def test_replace_only_touches_the_given_organization(manifest):
+    manifest.put(record("acme/old.pdf"))
+    manifest.put(record("globex/kept.pdf"))
+
+    manifest.replace([record("acme/new.pdf")], organization="acme")
+    assert manifest.blob_paths() == ["acme/new.pdf", "globex/kept.pdf"]
+
+    manifest.replace([record("initech/only.pdf")])
+    assert manifest.blob_paths() == ["initech/only.pdf"]
+
+
+def test_records_are_listed_per_organization(manifest):
+    manifest.put(record("acme/b.pdf", chunk_ids=["2"]))
+    manifest.put(record("acme/a.pdf", chunk_ids=["1"]))
+    manifest.put(record("globex/c.pdf"))
+
+    assert [(r.blob_path, r.chunk_ids) for r in manifest.records("acme")] == [("acme/a.pdf", ["1"]), ("acme/b.pdf", ["2"])]
+    assert len(manifest.records()) == 3
+
+
+def test_add_missing_keeps_existing_records(manifest):
+    manifest.put(record("acme/a.pdf", content_hash="new"))
+
+    manifest.add_missing([record("acme/a.pdf", content_hash="stale"), record("acme/b.pdf")])
+
+    assert manifest.get("acme/a.pdf").content_hash == "new"
+    assert manifest.blob_paths() == ["acme/a.pdf", "acme/b.pdf"]
+
+
+def test_prune_removes_files_missing_from_the_listing(manifest):
+    manifest.put(record("acme/kept.pdf"))
+    manifest.put(record("acme/gone.pdf"))
+    manifest.put(record("globex/gone.pdf"))
+    listed_at = time.time() + 1
+    fresh = record("acme/fresh.pdf")
+    fresh.updated_at = listed_at + 1
+    manifest.put(fresh)
+
+    assert manifest.prune(["acme/kept.pdf"], before=listed_at, organization="acme") == ["acme/gone.pdf"]
+    assert manifest.blob_paths() == ["acme/fresh.pdf", "acme/kept.pdf", "globex/gone.pdf"]
+    assert manifest.prune(["acme/kept.pdf"], before=listed_at) == ["globex/gone.pdf"]
+
+
+def test_synced_at_is_recorded(manifest):
+    assert manifest.synced_at() is None
+    manifest.mark_synced(123.0)
+    manifest.mark_synced(456.0)
+    assert manifest.synced_at() == 456.0
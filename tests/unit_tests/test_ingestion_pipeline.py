@@ -0,0 +1,84 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from backend.ingestion.pipeline import IngestionPipeline
+
+
+def fake_encode(texts):
+    return np.array([[float(len(t))] for t in texts], dtype=np.float32)
+
+
+class FakeIndexer:
+    def __init__(self, upload, batch_size):
+        self.upload = upload
+        self.batch_size = batch_size
+        self.pending = []
+        self.succeeded = 0
+
+    async def _send(self, batch):
+        self.upload(batch)
+        self.succeeded += len(batch)
+
+    async def add(self, documents):
+        self.pending.extend(documents)
+        while len(self.pending) >= self.batch_size:
+            batch, self.pending = self.pending[:self.batch_size], self.pending[self.batch_size:]
+            await self._send(batch)
+
+    async def flush(self):
+        if self.pending:
+            await self._send(self.pending)
+        return {"succeeded": self.succeeded}
+
+
+@pytest.mark.asyncio
+async def test_pipeline_indexes_every_item_in_batches():
+    uploads = []
+    pipeline = IngestionPipeline(fake_encode, FakeIndexer(uploads.append, 4), queue_size=1, embed_batch_size=3)
+    items = ({"content": "x" * n} for n in range(1, 11))
+
+    stats = await pipeline.run(items, lambda item, vector: {"content": item["content"], "vector": vector[0]})
+
+    assert [len(batch) for batch in uploads] == [4, 4, 2]
+    assert [doc["vector"] for batch in uploads for doc in batch] == [float(n) for n in range(1, 11)]
+    assert stats["extracted"] == stats["embedded"] == stats["indexed"] == 10
+
+
+@pytest.mark.asyncio
+async def test_pipeline_overlaps_stages_with_bounded_lookahead():
+    events = []
+
+    def items():
+        for n in range(8):
+            events.append(("extract", n))
+            yield {"content": str(n)}
+
+    def upload(documents):
+        events.append(("index", documents[0]["content"]))
+
+    pipeline = IngestionPipeline(fake_encode, FakeIndexer(upload, 1), queue_size=1, embed_batch_size=1)
+    await pipeline.run(items(), lambda item, vector: item)
+
+    # The first page is indexed long before the last one is extracted
+    assert events.index(("index", "0")) < events.index(("extract", 7))
+
+
+@pytest.mark.asyncio
+async def test_pipeline_failure_cancels_other_stages():
+    def upload(documents):
+        raise RuntimeError("index unavailable")
+
+    extracted = []
+
+    def items():
+        for n in range(1000):
+            extracted.append(n)
+            yield {"content": str(n)}
+
+    pipeline = IngestionPipeline(fake_encode, FakeIndexer(upload, 1), queue_size=1, embed_batch_size=1)
+    with pytest.raises(RuntimeError, match="index unavailable"):
+        await pipeline.run(items(), lambda item, vector: item)
+    await asyncio.sleep(0.05)
+    assert len(extracted) < 1000
@@ -0,0 +1,107 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from backend.ingestion.scheduler import ResourceBudget, map_in_order, run_concurrently
+
+
+@pytest.mark.asyncio
+async def test_run_concurrently_limits_concurrency_and_keeps_order():
+    running = 0
+    peak = 0
+
+    async def process(n):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01 * (5 - n % 5))
+        running -= 1
+        return n * 2
+
+    results = await run_concurrently(list(range(10)), process, concurrency=3)
+
+    assert results == [n * 2 for n in range(10)]
+    assert peak == 3
+
+
+@pytest.mark.asyncio
+async def test_budget_limits_memory_across_items():
+    budget = ResourceBudget(cpu_slots=8, memory_bytes=100)
+    running = 0
+    peak = 0
+
+    async def process(size):
+        nonlocal running, peak
+        running += size
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= size
+        return size
+
+    # The 500-byte item exceeds the whole budget and is clamped to run alone
+    sizes = [60, 30, 30, 500, 10]
+    results = await run_concurrently(sizes, process, concurrency=8, budget=budget, memory_of=lambda size: size)
+
+    assert results == sizes
+    assert peak <= 500
+    assert budget.stats()["memory_in_use"] == 0
+    assert budget.stats()["cpu_in_use"] == 0
+
+
+@pytest.mark.asyncio
+async def test_budget_wakes_waiters_on_other_event_loops():
+    budget = ResourceBudget(cpu_slots=1, memory_bytes=10)
+    await budget.acquire(cpu=1)
+    acquired = threading.Event()
+
+    def other_job():
+        async def wait():
+            async with budget.reserve(cpu=1):
+                acquired.set()
+        asyncio.run(wait())
+
+    thread = threading.Thread(target=other_job)
+    thread.start()
+    await asyncio.sleep(0.05)
+    assert not acquired.is_set() and budget.stats()["waiting"] == 1
+
+    budget.release(1, 0)
+    await asyncio.to_thread(thread.join, 5)
+    assert acquired.is_set()
+    assert budget.stats()["cpu_in_use"] == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_gives_up_its_place():
+    budget = ResourceBudget(cpu_slots=1, memory_bytes=10)
+    await budget.acquire(cpu=1)
+    waiter = asyncio.ensure_future(budget.acquire(cpu=1))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+
+    budget.release(1, 0)
+    assert budget.stats() == {"cpu_slots": 1, "cpu_in_use": 0, "memory_bytes": 10, "memory_in_use": 0, "waiting": 0}
+
+
+def test_map_in_order_bounds_work_in_flight_and_keeps_order():
+    submitted = []
+
+    def work(n):
+        time.sleep(0.001 * (5 - n % 5))
+        return n * n
+
+    with ThreadPoolExecutor(4) as executor:
+        def args():
+            for n in range(10):
+                submitted.append(n)
+                yield (n,)
+
+        results = map_in_order(executor, work, args(), max_in_flight=3)
+        assert next(results) == 0
+        assert len(submitted) == 4  # three ahead, plus one refilled after the first result
+        assert list(results) == [n * n for n in range(1, 10)]
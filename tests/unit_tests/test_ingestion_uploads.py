@@ -0,0 +1,32 @@
+import io
+
+import pytest
+from quart import Quart, request
+from quart.datastructures import FileStorage
+
+from backend.ingestion.uploads import spooled_request_class
+
+
+@pytest.mark.asyncio
+async def test_large_uploads_are_spooled_to_disk(tmp_path):
+    app = Quart(__name__)
+    app.request_class = spooled_request_class(1024, directory=str(tmp_path))
+
+    @app.route("/upload", methods=["POST"])
+    async def upload():
+        files = (await request.files).getlist("files")
+        return {
+            "rolled": [file.stream._rolled for file in files],
+            "sizes": [len(file.read()) for file in files],
+        }
+
+    client = app.test_client()
+    response = await client.post("/upload", files={
+        "files": FileStorage(stream=io.BytesIO(b"x" * 4096), filename="big.pdf"),
+    })
+    assert (await response.get_json()) == {"rolled": [True], "sizes": [4096]}
+
+    response = await client.post("/upload", files={
+        "files": FileStorage(stream=io.BytesIO(b"x" * 100), filename="small.pdf"),
+    })
+    assert (await response.get_json()) == {"rolled": [False], "sizes": [100]}
@@ -0,0 +1,104 @@
+import io
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from backend.ingestion.xml_documents import iter_xml_document_sources, iter_xml_documents
+
+EXPORT = b"""<export>
+  <folder id="1">
+    <naam>Root</naam>
+    <document id="10"><naam>A</naam><document><section><p>a</p></section></document></document>
+    <folder>
+      <naam>Inherits the id</naam>
+      <document id="11"><naam>B</naam></document>
+      <folder id="2"><document id="12"><naam>C</naam></document></folder>
+    </folder>
+    <document id="13"><naam>D</naam></document>
+  </folder>
+  <document id="14"><naam>E</naam></document>
+</export>"""
+
+
+def test_top_level_documents_are_yielded_with_their_folder_id():
+    documents = [
+        (folder_id, doc.get("id"), doc.findtext("naam"), doc.findtext("document/section/p"))
+        for folder_id, doc in iter_xml_documents(io.BytesIO(EXPORT))
+    ]
+
+    assert documents == [
+        ("1", "10", "A", "a"),
+        ("1", "11", "B", None),
+        ("2", "12", "C", None),
+        ("1", "13", "D", None),
+        (None, "14", "E", None),
+    ]
+
+
+def test_documents_are_detached_once_consumed():
+    seen = []
+    for _, doc in iter_xml_documents(io.BytesIO(EXPORT)):
+        seen.append(doc)
+    # Every yielded element has been cleared, so the parsed tree does not grow
+    assert all(len(doc) == 0 and not doc.attrib for doc in seen)
+
+
+def test_a_root_document_is_yielded():
+    assert [doc.get("id") for _, doc in iter_xml_documents(io.BytesIO(b'<document id="1"><document/></document>'))] == ["1"]
+
+
+def test_malformed_xml_raises_value_error():
+    with pytest.raises(ValueError, match="Failed to parse XML data"):
+        list(iter_xml_documents(io.BytesIO(b"<folder><document></folder>")))
+
+
+@pytest.mark.parametrize("block_size", [7, 1024 * 1024])
+def test_document_sources_match_the_parsed_documents(block_size):
+    parsed = []
+    for folder_id, doc in iter_xml_documents(io.BytesIO(EXPORT)):
+        doc.tail = None
+        parsed.append((folder_id, ET.tostring(doc)))
+    sources = [
+        (folder_id, ET.tostring(ET.fromstring(source)))
+        for folder_id, source in iter_xml_document_sources(io.BytesIO(EXPORT), block_size=block_size)
+    ]
+
+    assert sources == parsed
+
+
+NAMESPACED_EXPORT = b"""<?xml version="1.0"?>
+<export xmlns:x="urn:x"><folder id="1" xmlns:y="urn:y">
+  <document id="1"><naam>A</naam><x:note x:kind="k">one</x:note></document>
+  <document id="2" xmlns:x="urn:other"><naam>B</naam><x:note><y:ref/></x:note></document>
+</folder></export>"""
+
+DTD_EXPORT = b"""<?xml version="1.0"?>
+<!DOCTYPE export [
+  <!ENTITY company "Contoso">
+]>
+<export><folder id="1"><document id="1"><naam>&company;</naam><p>About &company;</p></document></folder></export>"""
+
+
+@pytest.mark.parametrize("export", [NAMESPACED_EXPORT, DTD_EXPORT], ids=["namespaces", "dtd"])
+@pytest.mark.parametrize("block_size", [7, 1024 * 1024])
+def test_document_sources_carry_namespaces_and_entities_declared_outside(export, block_size):
+    parsed = []
+    for folder_id, doc in iter_xml_documents(io.BytesIO(export)):
+        doc.tail = None
+        parsed.append((folder_id, ET.tostring(doc)))
+    sources = [
+        (folder_id, ET.tostring(ET.fromstring(source)))
+        for folder_id, source in iter_xml_document_sources(io.BytesIO(export), block_size=block_size)
+    ]
+
+    assert sources == parsed
+
+
+def test_document_sources_keep_empty_documents_and_the_encoding():
+    export = '<?xml version="1.0" encoding="ISO-8859-1"?><folder id="1"><document id="a"/><document id="b"><naam>Café</naam></document ></folder>'
+
+    sources = list(iter_xml_document_sources(io.BytesIO(export.encode("iso-8859-1"))))
+
+    assert [folder_id for folder_id, _ in sources] == ["1", "1"]
+    assert ET.fromstring(sources[0][1]).get("id") == "a"
+    assert ET.fromstring(sources[1][1]).findtext("naam") == "Café"
@@ -0,0 +1,122 @@
+import io
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from backend.ingestion.xml_documents import parse_xml
+from backend.ingestion.xml_markdown import elem_to_markdown, inline_to_md, iter_xml_document_chunks
+
+# Every construct the converter handles, and the markdown the previous
+# recursive converter produced for it
+SECTION = b"""<section>
+  <h1>Title with <em>emphasis</em></h1>
+  <H3>Mixed <span>case <b>tag</b></span></H3>
+  <p>Text with <strong> bold </strong>, <i>italic</i>, <code> x = 1 </code>, a <a href=" https://example.com ">link <b>here</b></a>,<br/>a break and <img src="logo.png" id="logo"/>.</p>
+  <p class="code">def f():
+    return 1</p>
+  <p>   </p>
+  <div>
+    <list type="bullet">
+      <li><p>First</p></li>
+      <li>Second <em>item</em>
+        <list type="arabic"><li value="1"><p>Nested one</p></li><li value="2"><p>Nested two</p></li></list>
+      </li>
+    </list>
+    <ol><li value="3">Third</li></ol>
+  </div>
+  <table><tgroup>
+    <row><entry>Name</entry><entry><b>Value</b></entry></row>
+    <row><entry>a</entry><entry> 1 </entry></row>
+  </tgroup></table>
+  <table><row><entry>No tgroup</entry></row></table>
+  <footnote>See <em>page</em> 4.</footnote>
+</section>"""
+
+SECTION_MARKDOWN = [
+    "# Title with *emphasis*",
+    "### Mixed case **tag**",
+    "Text with **bold**, *italic*, `x = 1`, a [link **here**](https://example.com),  \na break and ![logo](logo.png).",
+    "```",
+    "def f():",
+    "    return 1",
+    "```",
+    "- First",
+    "- Second *item*\n        Nested oneNested two",
+    "  1. Nested one",
+    "  2. Nested two",
+    "3. Third",
+    "| Name | **Value** |",
+    "| --- | --- |",
+    "| a | 1 |",
+    "| No tgroup |",
+    "| --- |",
+    "> **Footnote:** See page 4.",
+]
+
+EXPORT = b"""<export>
+  <folder id="7">
+    <document id="1"><naam>Intro</naam><document><section>
+      <h2>Welcome</h2><p>Read <strong>this</strong> first.</p>
+    </section></document></document>
+    <document id="2"><naam>Empty</naam></document>
+    <folder id="8">
+      <document id="3"><naam>Table</naam><document><section>
+        <table><tgroup><row><entry>A</entry><entry>B</entry></row><row><entry>1</entry><entry>2</entry></row></tgroup></table>
+      </section></document></document>
+    </folder>
+  </folder>
+</export>"""
+
+
+def test_documents_are_converted_in_order():
+    assert list(iter_xml_document_chunks(io.BytesIO(EXPORT))) == [
+        ("7", "1", "Intro", ["## Welcome\n\nRead **this** first."]),
+        ("7", "2", "Empty", []),
+        ("8", "3", "Table", ["| A | B |\n\n| --- | --- |\n\n| 1 | 2 |"]),
+    ]
+
+
+def test_executor_conversion_matches_the_serial_one():
+    serial = list(iter_xml_document_chunks(io.BytesIO(EXPORT)))
+    with ThreadPoolExecutor(2) as executor:
+        parallel = list(iter_xml_document_chunks(io.BytesIO(EXPORT), executor, processes=2, documents_per_task=1))
+
+    assert parallel == serial
+
+
+def test_executor_conversion_resolves_entities_declared_in_the_dtd():
+    export = (
+        b'<!DOCTYPE export [<!ENTITY company "Contoso">]>'
+        b'<export><document id="1"><naam>&company;</naam><document><section><p>About &company;</p></section></document></document></export>'
+    )
+    serial = list(iter_xml_document_chunks(io.BytesIO(export)))
+    with ThreadPoolExecutor(2) as executor:
+        parallel = list(iter_xml_document_chunks(io.BytesIO(export), executor, processes=2, documents_per_task=1))
+
+    assert parallel == serial == [(None, "1", "Contoso", ["About Contoso"])]
+
+
+def test_section_matches_the_golden_markdown():
+    assert elem_to_markdown(ET.fromstring(SECTION)) == SECTION_MARKDOWN
+
+
+def test_inline_content_is_stripped_at_every_level():
+    assert inline_to_md(ET.fromstring(b"<p> a <span> b <em> c </em> </span> d </p>")) == "a b *c* d"
+    assert inline_to_md(ET.fromstring(b"<entry>  plain  </entry>")) == "plain"
+
+
+def test_deeply_nested_elements_do_not_hit_the_recursion_limit():
+    depth = 5000
+    xml = b"<section>" + b"<div>" * depth + b"<p>" + b"<span>" * depth + b"deep" + b"</span>" * depth + b"</p>" + b"</div>" * depth + b"</section>"
+
+    assert elem_to_markdown(ET.fromstring(xml)) == ["deep"]
+
+
+def test_lxml_trees_convert_to_the_same_markdown():
+    pytest.importorskip("lxml")
+    # Comments are dropped, as by ElementTree
+    source = SECTION.replace(b"<em>emphasis</em>", b"<em>emph<!-- note -->asis</em>")
+
+    assert elem_to_markdown(parse_xml(source, "lxml")) == SECTION_MARKDOWN
+    assert list(iter_xml_document_chunks(io.BytesIO(EXPORT), parser="lxml")) == list(iter_xml_document_chunks(io.BytesIO(EXPORT)))
@@ -0,0 +1,126 @@
+"""
+Compare the torch and ONNX Runtime embedding backends before switching
+EMBEDDING_BACKEND / EMBEDDING_ONNX_QUANTIZE.
+
+For every backend the script reports, on the pages of a PDF
+(data/employee_handbook.pdf by default):
+  - cosine agreement of each page vector with the torch vector
+  - batch throughput (pages per second)
+  - single-query latency (p50 / p99) on short snippets of the same text
+
+Usage:
+    python tools/embedding_backend_benchmark.py --model sentence-transformers/all-MiniLM-L6-v2
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add parent directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.embedding.model import load_embedding_model
+
+BACKENDS = {
+    "torch": {"backend": "torch"},
+    "onnx": {"backend": "onnx"},
+    "onnx-int8": {"backend": "onnx", "quantize": True},
+}
+
+
+def load_pages(pdf_path):
+    import fitz
+
+    with fitz.open(pdf_path) as doc:
+        return [page.get_text("text") for page in doc if page.get_text("text").strip()]
+
+
+def load_queries(pages, count):
+    lines = [line.strip() for page in pages for line in page.splitlines() if len(line.strip()) > 20]
+    return (lines * (count // max(1, len(lines)) + 1))[:count]
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True).clip(min=1e-12)
+
+
+def benchmark_backend(model, pages, queries, batch_size):
+    model.encode(queries[:8])  # warm-up
+
+    started = time.perf_counter()
+    page_vectors = model.encode(pages, batch_size=batch_size)
+    batch_seconds = time.perf_counter() - started
+
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        model.encode([query])
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    return page_vectors, {
+        "pages_per_second": len(pages) / batch_seconds,
+        "query_p50_ms": float(np.percentile(latencies, 50)),
+        "query_p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=os.environ.get("AZURE_OPENAI_EMBEDDING_NAME"),
+                        help="sentence-transformers model (defaults to AZURE_OPENAI_EMBEDDING_NAME)")
+    parser.add_argument("--pdf", default=os.path.join(os.path.dirname(__file__), "..", "data", "employee_handbook.pdf"))
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument("--onnx-dir", default=".onnx")
+    parser.add_argument("--quantization-config", default="avx2", choices=["arm64", "avx2", "avx512", "avx512_vnni"])
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    if not args.model:
+        parser.error("--model or AZURE_OPENAI_EMBEDDING_NAME is required")
+
+    pages = load_pages(args.pdf)
+    queries = load_queries(pages, args.queries)
+
+    # torch always runs first: it is the reference the other backends are compared against
+    backends = ["torch"] + [name for name in args.backends if name != "torch"]
+    results = {}
+    reference = None
+    for name in backends:
+        options = BACKENDS[name]
+        model = load_embedding_model(
+            args.model,
+            backend=options["backend"],
+            onnx_dir=args.onnx_dir,
+            quantize=options.get("quantize", False),
+            quantization_config=args.quantization_config,
+        )
+        vectors, result = benchmark_backend(model, pages, queries, args.batch_size)
+        vectors = normalize(vectors)
+        if reference is None:
+            reference = vectors
+        cosines = np.sum(vectors * reference, axis=1)
+        result.update({
+            "cosine_mean": float(cosines.mean()),
+            "cosine_min": float(cosines.min()),
+        })
+        results[name] = result
+
+    if args.json:
+        print(json.dumps({"model": args.model, "pages": len(pages), "queries": len(queries), "results": results}, indent=2))
+        return
+
+    print(f"model: {args.model}  pages: {len(pages)}  queries: {len(queries)}")
+    print(f"{'backend':<12}{'cos mean':>10}{'cos min':>10}{'pages/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, r in results.items():
+        print(f"{name:<12}{r['cosine_mean']:>10.5f}{r['cosine_min']:>10.5f}{r['pages_per_second']:>10.1f}"
+              f"{r['query_p50_ms']:>10.2f}{r['query_p99_ms']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
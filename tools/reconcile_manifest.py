@@ -0,0 +1,52 @@
+"""
+Rebuild this instance's document manifest (INGESTION_MANIFEST_DB) from Blob
+Storage and the search index: after upgrading from a version that did not
+keep one, or when files were added or removed outside the app. Uses the
+app's settings from the environment or .env.
+
+Usage:
+    python tools/reconcile_manifest.py [--organization <organization>]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+# Add parent directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import app
+
+
+async def reconcile(organization: str = None) -> dict:
+    app.init_azure_clients(app.app)
+    try:
+        async with app.app.app_context():
+            return await app.reconcile_manifest(organization)
+    finally:
+        await app.close_azure_clients(app.app)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--organization", help="only rebuild the files of this organization")
+    parser.add_argument("--json", action="store_true", help="print the result and stats as JSON")
+    args = parser.parse_args()
+
+    organization = args.organization.strip().lower().strip('.') if args.organization else None
+    result = asyncio.run(reconcile(organization))
+    stats = app.document_manifest.stats(organization)
+
+    if args.json:
+        print(json.dumps({**result, "organizations": stats}, indent=2))
+        return
+
+    print(f"files: {result['files']}  chunks: {result['chunks']}")
+    print(f"{'organization':<24}{'files':>8}{'chunks':>10}{'pages':>10}{'MB':>10}")
+    for name, s in stats.items():
+        print(f"{name:<24}{s['files']:>8}{s['chunks']:>10}{s['pages']:>10}{s['bytes'] / 2**20:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Measure how long a fresh worker takes to become useful.
+
+Each run starts a new interpreter and reports:
+  - import_seconds:      `import app` (what every gunicorn worker restart and
+                         tools/data_collection.py pay)
+  - startup_seconds:     running the before_serving hooks
+  - first_embed_ms:      the first /api/embed request, sent right after startup
+  - ready_seconds:       time from process start until /readyz answers 200
+  - warm_embed_ms:       an /api/embed request once the worker is ready
+
+Usage:
+    python tools/startup_benchmark.py --runs 3
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+async def measure_once(ready_timeout: float) -> dict:
+    process_started = time.perf_counter()
+    sys.path.append(ROOT)
+    os.chdir(ROOT)
+
+    started = time.perf_counter()
+    import app as app_module
+    result = {"import_seconds": time.perf_counter() - started}
+
+    started = time.perf_counter()
+    async with app_module.app.test_app() as test_app:
+        result["startup_seconds"] = time.perf_counter() - started
+        client = test_app.test_client()
+
+        started = time.perf_counter()
+        response = await client.post("/api/embed", json={"input": "How many vacation days do I get?"})
+        result["first_embed_ms"] = (time.perf_counter() - started) * 1000
+        result["first_embed_status"] = response.status_code
+
+        while True:
+            response = await client.get("/readyz")
+            if response.status_code == 200:
+                result["ready_seconds"] = time.perf_counter() - process_started
+                break
+            if time.perf_counter() - process_started > ready_timeout:
+                result["ready_seconds"] = None
+                result["readiness"] = (await response.get_json())["checks"]
+                break
+            await asyncio.sleep(0.1)
+
+        started = time.perf_counter()
+        await client.post("/api/embed", json={"input": "What is the travel reimbursement policy?"})
+        result["warm_embed_ms"] = (time.perf_counter() - started) * 1000
+
+    return result
+
+
+def summarize(runs: list) -> dict:
+    summary = {}
+    for key in ("import_seconds", "startup_seconds", "first_embed_ms", "ready_seconds", "warm_embed_ms"):
+        values = [run[key] for run in runs if run.get(key) is not None]
+        if values:
+            summary[key] = {"median": statistics.median(values), "min": min(values), "max": max(values)}
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="number of fresh processes to measure")
+    parser.add_argument("--ready-timeout", type=float, default=300, help="seconds to wait for /readyz")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--measure-once", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure_once:
+        print(json.dumps(asyncio.run(measure_once(args.ready_timeout))))
+        return
+
+    runs = []
+    for i in range(args.runs):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--measure-once", "--ready-timeout", str(args.ready_timeout)],
+            cwd=ROOT, check=True, capture_output=True, text=True,
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    summary = summarize(runs)
+    if args.json:
+        print(json.dumps({"runs": runs, "summary": summary}, indent=2))
+        return
+
+    print(f"{'metric':<18}{'median':>12}{'min':>12}{'max':>12}")
+    for key, values in summary.items():
+        print(f"{key:<18}{values['median']:>12.3f}{values['min']:>12.3f}{values['max']:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
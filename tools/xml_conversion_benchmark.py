@@ -0,0 +1,97 @@
+"""
+Compare converting the documents of an XML export to markdown chunks in the
+parsing thread (INGESTION_XML_PROCESSES=0) and in process pools of various
+sizes, before tuning INGESTION_XML_PROCESSES / INGESTION_XML_DOCUMENTS_PER_TASK.
+
+The export is read from --xml, or generated with --documents documents of
+headings, paragraphs, lists and tables. For every configuration the script
+reports documents per second and checks that the chunks are identical to
+the serial conversion.
+
+Usage:
+    python tools/xml_conversion_benchmark.py --documents 20000 --processes 2 4 8
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Add parent directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.ingestion.xml_markdown import iter_xml_document_chunks
+
+
+def generate_export(documents: int) -> bytes:
+    body = (
+        "<h2>Section {n}</h2>"
+        "<p>Paragraph with <strong>bold</strong>, <em>emphasis</em>, <code>code</code> "
+        "and a <a href=\"https://example.com/{n}\">link</a>.</p>"
+        "<list type=\"bullet\"><li><p>First item</p></li><li><p>Second item</p>"
+        "<list type=\"bullet\"><li><p>Nested item</p></li></list></li></list>"
+        "<table><tgroup><row><entry>Key</entry><entry>Value</entry></row>"
+        "<row><entry>n</entry><entry>{n}</entry></row></tgroup></table>"
+        "<footnote>Footnote {n}</footnote>"
+    )
+    parts = ["<export><folder id=\"1\"><naam>Benchmark</naam>"]
+    for n in range(documents):
+        parts.append(
+            f"<document id=\"{n}\"><naam>Document {n}</naam><document><section>"
+            + body.format(n=n) * 4
+            + "</section></document></document>"
+        )
+    parts.append("</folder></export>")
+    return "".join(parts).encode("utf-8")
+
+
+def convert(data: bytes, executor, processes: int, documents_per_task: int):
+    started = time.perf_counter()
+    documents = list(iter_xml_document_chunks(io.BytesIO(data), executor, processes, documents_per_task))
+    return documents, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--xml", help="XML export to convert (defaults to a generated one)")
+    parser.add_argument("--documents", type=int, default=20000, help="documents in the generated export")
+    parser.add_argument("--processes", type=int, nargs="+", default=[os.cpu_count() or 1])
+    parser.add_argument("--documents-per-task", type=int, default=64)
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    if args.xml:
+        with open(args.xml, "rb") as f:
+            data = f.read()
+    else:
+        data = generate_export(args.documents)
+
+    reference, seconds = convert(data, None, 1, args.documents_per_task)
+    results = {"serial": {"documents_per_second": len(reference) / seconds, "identical": True}}
+    for processes in args.processes:
+        with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("spawn")) as executor:
+            # Start the workers before timing
+            list(executor.map(abs, range(processes)))
+            documents, seconds = convert(data, executor, processes, args.documents_per_task)
+        results[f"{processes} processes"] = {
+            "documents_per_second": len(documents) / seconds,
+            "identical": documents == reference,
+        }
+
+    if args.json:
+        print(json.dumps({"documents": len(reference), "megabytes": len(data) / 2**20, "results": results}, indent=2))
+        return
+
+    print(f"documents: {len(reference)}  size: {len(data) / 2**20:.1f} MB")
+    print(f"{'conversion':<16}{'docs/s':>10}{'speedup':>10}{'identical':>11}")
+    baseline = results["serial"]["documents_per_second"]
+    for name, r in results.items():
+        print(f"{name:<16}{r['documents_per_second']:>10.0f}{r['documents_per_second'] / baseline:>10.2f}"
+              f"{str(r['identical']):>11}")
+
+
+if __name__ == "__main__":
+    main()
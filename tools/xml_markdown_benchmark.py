@@ -0,0 +1,217 @@
+"""
+Micro-benchmark of the XML to markdown converters on a synthetic corpus of
+table-heavy documents.
+
+The converters in backend/ingestion/xml_markdown.py are compared with the
+previous recursive implementation (kept below as the reference) on trees
+parsed by ElementTree and, if it is installed, lxml. Parsing is not timed.
+For every converter the script reports documents and MB of XML per second
+and checks that the markdown is identical to the reference output.
+
+Usage:
+    python tools/xml_markdown_benchmark.py --documents 2000 --rows 50 --repeat 5
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+from typing import List
+
+# Add parent directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.ingestion.xml_documents import parse_xml
+from backend.ingestion.xml_markdown import elem_to_markdown
+
+
+def reference_inline_to_md(elem) -> str:
+    """
+    The previous, recursive converter: convert an element and its children to inline Markdown,
+    handling <strong>, <em>, <code>, <a>, <img>, <br>, <span>, and other inline tags.
+    """
+    parts: List[str] = []
+    # Text before children
+    if elem.text:
+        parts.append(elem.text)
+
+    for child in elem:
+        tag = child.tag.lower()
+        if tag in ("strong", "b"):
+            parts.append(f"**{reference_inline_to_md(child)}**")
+        elif tag in ("em", "i"):
+            parts.append(f"*{reference_inline_to_md(child)}*")
+        elif tag == "code":
+            code_text = (child.text or "").strip()
+            parts.append(f"`{code_text}`")
+        elif tag == "a":
+            href = child.attrib.get("href", "").strip()
+            link_text = reference_inline_to_md(child)
+            parts.append(f"[{link_text}]({href})")
+        elif tag == "img":
+            src = child.attrib.get("href", child.attrib.get("src", "")).strip()
+            alt = child.attrib.get("alt", child.attrib.get("id", "")).strip()
+            parts.append(f"![{alt}]({src})")
+        elif tag == "br":
+            parts.append("  \n")  # Markdown line break
+        else:
+            # For <span> and unknown inline tags, ignore tag but recurse
+            parts.append(reference_inline_to_md(child))
+
+        # Tail text after this child
+        if child.tail:
+            parts.append(child.tail)
+
+    return "".join(parts).strip()
+
+
+def reference_elem_to_markdown(elem, level: int = 0) -> List[str]:
+    """
+    Convert XML element tree to Markdown lines, handling headings,
+    paragraphs (including code blocks), lists, tables, images, footnotes.
+    """
+    md_lines: List[str] = []
+    tag = elem.tag.lower()
+    indent = "  " * level
+
+    # --- Headings ---
+    if tag in ("h1", "h2", "h3", "h4", "h5", "h6"):
+        level_num = int(tag[1])
+        prefix = "#" * level_num
+        text = reference_inline_to_md(elem)
+        md_lines.append(f"{prefix} {text}")
+        return md_lines
+
+    # --- Paragraphs & Code Blocks ---
+    if tag == "p":
+        if elem.attrib.get("class", "").lower() == "code":
+            md_lines.append("```")
+            md_lines.extend((elem.text or "").splitlines())
+            md_lines.append("```")
+        else:
+            text = reference_inline_to_md(elem)
+            if text:
+                md_lines.append(text)
+        return md_lines
+
+    # --- Lists ---
+    if tag in ("list", "ul", "ol"):
+        list_type = elem.attrib.get("type", "bullet")
+        is_ordered = list_type != "bullet" or tag == "ol"
+        for li in elem.findall("li"):
+            p_child = li.find("p")
+            content = reference_inline_to_md(p_child) if p_child is not None else reference_inline_to_md(li)
+            prefix = f"{indent}{(str(li.attrib.get('value')) + '.') if is_ordered else '-'} "
+            md_lines.append(f"{prefix}{content}")
+            # Nested lists
+            for sub in li:
+                if sub.tag.lower() in ("list", "ul", "ol"):
+                    md_lines.extend(reference_elem_to_markdown(sub, level + 1))
+        return md_lines
+
+    # --- Tables ---
+    if tag == "table":
+        tgroup = elem.find("tgroup") or elem
+        rows = tgroup.findall("row")
+        if rows:
+            headers = [reference_inline_to_md(cell) for cell in rows[0].findall("entry")]
+            md_lines.append("| " + " | ".join(headers) + " |")
+            md_lines.append("| " + " | ".join(["---"] * len(headers)) + " |")
+            for row in rows[1:]:
+                cells = [reference_inline_to_md(cell) for cell in row.findall("entry")]
+                md_lines.append("| " + " | ".join(cells) + " |")
+        return md_lines
+
+    # --- Footnotes ---
+    if tag == "footnote":
+        foot = "".join(elem.itertext()).strip()
+        if foot:
+            md_lines.append(f"> **Footnote:** {foot}")
+        return md_lines
+
+    # --- Fallback: recurse into children ---
+    for child in elem:
+        md_lines.extend(reference_elem_to_markdown(child, level))
+
+    return md_lines
+
+
+def generate_documents(documents: int, rows: int, columns: int) -> List[bytes]:
+    # Most cells are plain text, as in the exports; every fourth one is formatted
+    plain_cell = "<entry>Value {r}.{c}</entry>"
+    formatted_cell = "<entry>Cell <strong>{r}</strong>.<em>{c}</em> <a href=\"#r{r}\">ref</a></entry>"
+    table = "".join(
+        "<row>" + "".join((formatted_cell if c % 4 == 0 else plain_cell).format(r=r, c=c) for c in range(columns)) + "</row>"
+        for r in range(rows)
+    )
+    body = (
+        "<h2>Overview</h2>"
+        "<p>Intro with <code>code</code>, <span>a <b>nested <i>span</i></b></span> and a<br/>break.</p>"
+        "<list type=\"bullet\"><li><p>One</p></li><li><p>Two</p>"
+        "<list type=\"arabic\"><li value=\"1\"><p>Nested</p></li></list></li></list>"
+        f"<table><tgroup>{table}</tgroup></table>"
+        "<p class=\"code\">line 1\nline 2</p>"
+        "<footnote>See <em>appendix</em>.</footnote>"
+    )
+    return [
+        f"<section id=\"{n}\">{body}</section>".encode("utf-8")
+        for n in range(documents)
+    ]
+
+
+def benchmark(convert, trees, size: int, repeat: int):
+    # Best of `repeat` runs, without garbage collection pauses
+    seconds = []
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            output = [convert(tree) for tree in trees]
+            seconds.append(time.perf_counter() - started)
+    finally:
+        gc.enable()
+    best = min(seconds)
+    return output, {"documents_per_second": len(trees) / best, "mb_per_second": size / 2**20 / best}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=2000)
+    parser.add_argument("--rows", type=int, default=50, help="table rows per document")
+    parser.add_argument("--columns", type=int, default=6, help="table columns per document")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per converter; the fastest is reported")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    sources = generate_documents(args.documents, args.rows, args.columns)
+    size = sum(map(len, sources))
+
+    etree_trees = [ET.fromstring(source) for source in sources]
+    reference, result = benchmark(reference_elem_to_markdown, etree_trees, size, args.repeat)
+    results = {"reference (etree)": {**result, "identical": True}}
+
+    converters = {"etree": etree_trees}
+    try:
+        converters["lxml"] = [parse_xml(source, "lxml") for source in sources]
+    except ImportError:
+        print("lxml is not installed; skipping it", file=sys.stderr)
+    for name, trees in converters.items():
+        output, result = benchmark(elem_to_markdown, trees, size, args.repeat)
+        results[name] = {**result, "identical": output == reference}
+
+    if args.json:
+        print(json.dumps({"documents": len(sources), "megabytes": size / 2**20, "results": results}, indent=2))
+        return
+
+    print(f"documents: {len(sources)}  size: {size / 2**20:.1f} MB")
+    print(f"{'converter':<20}{'docs/s':>10}{'MB/s':>10}{'speedup':>10}{'identical':>11}")
+    baseline = results["reference (etree)"]["documents_per_second"]
+    for name, r in results.items():
+        print(f"{name:<20}{r['documents_per_second']:>10.0f}{r['mb_per_second']:>10.1f}"
+              f"{r['documents_per_second'] / baseline:>10.2f}{str(r['identical']):>11}")
+
+
+if __name__ == "__main__":
+    main()